@@ -0,0 +1,108 @@
+"""
+Dependency providers for API routes.
+
+Services are created on first use rather than at import time so that
+importing the application stays cheap; heavy models load lazily (or in the
+background warm-up started by the application lifespan).
+"""
+
+from typing import Optional
+
+from app.core.config import settings
+from app.database import AsyncSessionLocal
+from app.services.batch_runner import BatchRunner
+from app.services.cost_ledger import CostLedger
+from app.services.evaluation_service import EvaluationService
+from app.services.flow_metrics import FlowMetricsRecorder
+from app.services.flow_versions import FlowVersionStore
+from app.services.prompt_flow_service import PromptFlowService
+
+_evaluation_service: Optional[EvaluationService] = None
+_flow_service: Optional[PromptFlowService] = None
+_batch_runner: Optional[BatchRunner] = None
+_version_store: Optional[FlowVersionStore] = None
+_cost_ledger: Optional[CostLedger] = None
+_metrics_recorder: Optional[FlowMetricsRecorder] = None
+
+
+def get_evaluation_service() -> EvaluationService:
+    global _evaluation_service
+    if _evaluation_service is None:
+        _evaluation_service = EvaluationService(cost_ledger=get_cost_ledger())
+    return _evaluation_service
+
+
+def get_flow_service() -> PromptFlowService:
+    global _flow_service
+    if _flow_service is None:
+        # LLM nodes' semantic cache shares the evaluation embedding path
+        embed = None
+        if settings.SEMANTIC_CACHE_BACKEND != "none":
+            embed = get_evaluation_service().encode
+        _flow_service = PromptFlowService(embed=embed)
+    return _flow_service
+
+
+def get_batch_runner() -> BatchRunner:
+    global _batch_runner
+    if _batch_runner is None:
+        _batch_runner = BatchRunner(
+            get_flow_service(),
+            get_evaluation_service(),
+            root=settings.BATCH_DATA_DIR,
+            concurrency=settings.BATCH_CONCURRENCY,
+            max_retries=settings.BATCH_MAX_RETRIES,
+            checkpoint_every=settings.BATCH_CHECKPOINT_EVERY,
+            cost_ledger=get_cost_ledger()
+        )
+    return _batch_runner
+
+
+def get_version_store() -> FlowVersionStore:
+    global _version_store
+    if _version_store is None:
+        _version_store = FlowVersionStore(
+            snapshot_every=settings.FLOW_VERSION_SNAPSHOT_EVERY,
+            cache_size=settings.FLOW_VERSION_CACHE_SIZE
+        )
+    return _version_store
+
+
+def get_cost_ledger() -> CostLedger:
+    global _cost_ledger
+    if _cost_ledger is None:
+        _cost_ledger = CostLedger(
+            AsyncSessionLocal, flush_interval_ms=settings.COST_FLUSH_INTERVAL_MS
+        )
+    return _cost_ledger
+
+
+def get_metrics_recorder() -> FlowMetricsRecorder:
+    global _metrics_recorder
+    if _metrics_recorder is None:
+        _metrics_recorder = FlowMetricsRecorder(
+            AsyncSessionLocal, flush_interval_ms=settings.FLOW_METRICS_FLUSH_INTERVAL_MS
+        )
+    return _metrics_recorder
+
+
+async def shutdown_services():
+    """Release executors and background tasks owned by services"""
+    global _evaluation_service, _flow_service, _batch_runner, _cost_ledger, _metrics_recorder
+    # Batch runs use both services, so stop them first
+    if _batch_runner is not None:
+        await _batch_runner.close()
+        _batch_runner = None
+    if _evaluation_service is not None:
+        await _evaluation_service.close()
+        _evaluation_service = None
+    if _flow_service is not None:
+        await _flow_service.close()
+        _flow_service = None
+    # Last, so increments recorded during shutdown are written
+    if _metrics_recorder is not None:
+        await _metrics_recorder.close()
+        _metrics_recorder = None
+    if _cost_ledger is not None:
+        await _cost_ledger.close()
+        _cost_ledger = None
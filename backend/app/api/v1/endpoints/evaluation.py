@@ -1,37 +1,159 @@
 from fastapi import APIRouter, Depends, HTTPException
-from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from datetime import datetime
+from app.api.deps import get_cost_ledger, get_evaluation_service, get_flow_service
+from app.database import get_db
+from app.models.flow import Flow
+from app.services.cost_ledger import CostLedger
 from app.services.evaluation_service import EvaluationService
+from app.services.flow_metrics import record_run_costs
+from app.services.pricing import get_pricing_table
+from app.services.prompt_flow_service import PromptFlowService
 from app.schemas.evaluation import (
     ExperimentCreate, ExperimentResponse, ABTestResult,
-    HumanFeedback, EvaluationMetrics
+    HumanFeedback, EvaluationMetrics, BatchEvaluationRequest,
+    ExperimentResultCreate, VariantAssignment, VariantRunRequest
 )
 
 router = APIRouter()
-evaluation_service = EvaluationService()
 
 @router.get("/")
 async def evaluation_status():
     return {"status": "ready", "message": "Evaluation endpoint"}
 
 @router.post("/experiments/", response_model=str)
-async def create_experiment(experiment_data: ExperimentCreate):
+async def create_experiment(
+    experiment_data: ExperimentCreate,
+    evaluation_service: EvaluationService = Depends(get_evaluation_service)
+):
     """Create a new A/B test experiment"""
     experiment_id = await evaluation_service.create_ab_experiment(experiment_data)
     return experiment_id
 
 @router.get("/experiments/{experiment_id}/results", response_model=ABTestResult)
-async def get_experiment_results(experiment_id: str):
+async def get_experiment_results(
+    experiment_id: str,
+    evaluation_service: EvaluationService = Depends(get_evaluation_service)
+):
     """Get A/B test results with statistical analysis"""
     try:
-        results = await evaluation_service.compare_variants(experiment_id)
+        results = await evaluation_service.get_results(experiment_id)
         return results
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"Experiment not found: {str(e)}")
 
+@router.get(
+    "/experiments/{experiment_id}/assignment/{user_id}",
+    response_model=VariantAssignment
+)
+async def get_variant_assignment(
+    experiment_id: str,
+    user_id: str,
+    evaluation_service: EvaluationService = Depends(get_evaluation_service)
+):
+    """Get the variant a user is assigned to"""
+    try:
+        return await evaluation_service.assign_variant(experiment_id, user_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Experiment not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/experiments/{experiment_id}/run")
+async def run_experiment_variant(
+    experiment_id: str,
+    run_request: VariantRunRequest,
+    db: AsyncSession = Depends(get_db),
+    evaluation_service: EvaluationService = Depends(get_evaluation_service),
+    flow_service: PromptFlowService = Depends(get_flow_service),
+    cost_ledger: CostLedger = Depends(get_cost_ledger)
+):
+    """Assign the user to a variant and execute that variant's flow"""
+    try:
+        assignment = await evaluation_service.assign_variant(
+            experiment_id, run_request.user_id
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Experiment not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    flow = None
+    if assignment.flow_id.isdigit():
+        flow = await db.get(Flow, int(assignment.flow_id))
+    if not flow:
+        raise HTTPException(status_code=404, detail="Flow not found")
+    
+    validation = await flow_service.validate_flow(
+        flow.flow_config["nodes"], flow.flow_config.get("connections", [])
+    )
+    if not validation["valid"]:
+        raise HTTPException(status_code=400, detail=validation["errors"])
+    
+    result = await flow_service.run(
+        flow.flow_config,
+        run_request.inputs,
+        flow_id=flow.id,
+        updated_at=flow.updated_at
+    )
+    record_run_costs(cost_ledger, flow.id, result)
+    return {"assignment": assignment, "result": result}
+
+@router.get("/experiments/{experiment_id}/costs")
+async def get_experiment_costs(
+    experiment_id: str,
+    cost_ledger: CostLedger = Depends(get_cost_ledger)
+):
+    """Running token and cost totals of an experiment's results, per variant"""
+    totals = await cost_ledger.totals("experiment", experiment_id)
+    return {
+        "experiment_id": experiment_id,
+        "total": totals["total"],
+        "by_variant": totals["breakdown"]
+    }
+
+@router.get("/pricing")
+async def get_pricing():
+    """Per-model token prices (USD per 1K tokens) with effective dates"""
+    return get_pricing_table().describe()
+
+@router.post("/experiments/{experiment_id}/rebucket")
+async def rebucket_experiment(
+    experiment_id: str,
+    salt: str,
+    evaluation_service: EvaluationService = Depends(get_evaluation_service)
+):
+    """Change the assignment salt, re-bucketing all users"""
+    try:
+        await evaluation_service.rebucket(experiment_id, salt)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Experiment not found")
+    return {"message": "Experiment re-bucketed", "salt": salt}
+
+@router.post("/experiments/{experiment_id}/results")
+async def submit_experiment_result(
+    experiment_id: str,
+    result: ExperimentResultCreate,
+    evaluation_service: EvaluationService = Depends(get_evaluation_service)
+):
+    """Fold an evaluated response into the experiment statistics"""
+    try:
+        status = await evaluation_service.record_result(
+            experiment_id=experiment_id,
+            variant=result.variant,
+            metrics=result.metrics,
+            response_id=result.response_id
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Experiment not found")
+    return {"message": "Result recorded successfully", "status": status}
+
 @router.post("/experiments/{experiment_id}/feedback")
 async def submit_human_feedback(
     experiment_id: str,
-    feedback: HumanFeedback
+    feedback: HumanFeedback,
+    evaluation_service: EvaluationService = Depends(get_evaluation_service)
 ):
     """Submit human evaluation feedback"""
     await evaluation_service.record_human_feedback(
@@ -46,7 +168,8 @@ async def evaluate_prompt_response(
     prompt: str,
     response: str,
     expected_output: str = None,
-    execution_time_ms: float = 0
+    execution_time_ms: float = 0,
+    evaluation_service: EvaluationService = Depends(get_evaluation_service)
 ):
     """Evaluate the quality of a prompt-response pair"""
     metrics = await evaluation_service.evaluate_prompt_quality(
@@ -57,35 +180,57 @@ async def evaluate_prompt_response(
     )
     return metrics
 
+@router.post("/evaluate/batch", response_model=List[EvaluationMetrics])
+async def evaluate_prompt_responses(
+    request: BatchEvaluationRequest,
+    evaluation_service: EvaluationService = Depends(get_evaluation_service)
+):
+    """Evaluate many prompt-response pairs in one batched pass"""
+    try:
+        return await evaluation_service.evaluate_batch(request.pairs, request.metrics)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e).strip("'"))
+
+@router.get("/metrics")
+async def list_metrics(
+    evaluation_service: EvaluationService = Depends(get_evaluation_service)
+):
+    """Registered evaluation metrics, their inputs and cost classes"""
+    return evaluation_service.metric_registry.describe()
+
+@router.get("/embedding-cache/stats")
+async def get_embedding_cache_stats(
+    evaluation_service: EvaluationService = Depends(get_evaluation_service)
+):
+    """Get embedding cache hit/miss counters"""
+    return evaluation_service.embedding_cache.stats()
+
 @router.get("/experiments/{experiment_id}/dashboard")
-async def get_experiment_dashboard(experiment_id: str):
+async def get_experiment_dashboard(
+    experiment_id: str,
+    evaluation_service: EvaluationService = Depends(get_evaluation_service)
+):
     """Get dashboard data for experiment monitoring"""
-    results = await evaluation_service.compare_variants(experiment_id)
-    
-    return {
-        "experiment_id": experiment_id,
-        "status": "running",  # This would come from DB
-        "metrics_comparison": [
-            {
-                "metric_name": "Coherence Score",
-                "variant_a": results.variant_a_metrics.coherence_score,
-                "variant_b": results.variant_b_metrics.coherence_score,
-                "improvement": results.improvement_percentage,
-                "significance": results.statistical_significance
-            },
-            {
-                "metric_name": "User Satisfaction",
-                "variant_a": results.variant_a_metrics.user_satisfaction,
-                "variant_b": results.variant_b_metrics.user_satisfaction,
-                "improvement": results.improvement_percentage,
-                "significance": results.statistical_significance
-            },
-            {
-                "metric_name": "Latency (ms)",
-                "variant_a": results.variant_a_metrics.latency_ms,
-                "variant_b": results.variant_b_metrics.latency_ms,
-                "improvement": results.improvement_percentage,
-                "significance": results.statistical_significance
-            }
-        ]
-    }
+    try:
+        return await evaluation_service.get_dashboard(experiment_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Experiment not found")
+
+@router.get("/experiments/{experiment_id}/series")
+async def get_experiment_series(
+    experiment_id: str,
+    metric: str,
+    granularity: str = "hour",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    evaluation_service: EvaluationService = Depends(get_evaluation_service)
+):
+    """Per-variant time series of a metric (minute, hour or day buckets, UTC)"""
+    try:
+        return await evaluation_service.metric_series(
+            experiment_id, metric, granularity, start, end
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Experiment not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
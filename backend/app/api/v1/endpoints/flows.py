@@ -1,13 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List, Dict, Any
-from app.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query, File, Form, UploadFile
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Dict, Any, Optional
+from dataclasses import asdict
+from datetime import datetime
+import base64
+import json
+from app.api.deps import (
+    get_batch_runner, get_cost_ledger, get_flow_service, get_metrics_recorder, get_version_store
+)
+from app.database import get_db, AsyncSessionLocal
 from app.models.flow import Flow, FlowVersion
+from app.schemas.flow import FlowPage, FlowSummary
+from app.services.batch_runner import BatchRunner
+from app.services.cost_ledger import CostLedger
+from app.services.flow_metrics import FlowMetricsRecorder, record_run_costs
+from app.services.flow_versions import FlowVersionStore
 from app.services.prompt_flow_service import PromptFlowService
 from pydantic import BaseModel
 
 router = APIRouter()
-flow_service = PromptFlowService()
 
 class FlowCreate(BaseModel):
     name: str
@@ -20,18 +33,23 @@ class FlowExecute(BaseModel):
     inputs: Dict[str, Any]
 
 @router.post("/flows/")
-async def create_flow(flow_data: FlowCreate, db: Session = Depends(get_db)):
+async def create_flow(
+    flow_data: FlowCreate,
+    db: AsyncSession = Depends(get_db),
+    flow_service: PromptFlowService = Depends(get_flow_service),
+    version_store: FlowVersionStore = Depends(get_version_store)
+):
     """Create a new prompt flow"""
+    # Validate the graph before building anything from it
+    validation = await flow_service.validate_flow(flow_data.nodes, flow_data.connections)
+    if not validation["valid"]:
+        raise HTTPException(status_code=400, detail=validation["errors"])
+    
     flow_config = await flow_service.create_flow_definition(
         flow_data.nodes, 
         flow_data.connections
     )
     
-    # Validate flow
-    validation = await flow_service.validate_flow(flow_config)
-    if not validation["valid"]:
-        raise HTTPException(status_code=400, detail=validation["errors"])
-    
     # Save to database
     db_flow = Flow(
         name=flow_data.name,
@@ -43,59 +61,381 @@ async def create_flow(flow_data: FlowCreate, db: Session = Depends(get_db)):
         }
     )
     db.add(db_flow)
-    db.commit()
-    db.refresh(db_flow)
+    await db.flush()
+    # Executions record their metrics on the latest version
+    await version_store.create(db, db_flow.id, "1.0", db_flow.flow_config)
+    await db.commit()
+    await db.refresh(db_flow)
     
     return db_flow
 
-@router.get("/flows/")
-async def list_flows(db: Session = Depends(get_db)):
-    """List all flows"""
-    flows = db.query(Flow).all()
-    return flows
+def _encode_cursor(updated_at: datetime, flow_id: int) -> str:
+    raw = json.dumps([updated_at.isoformat(), flow_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        updated_at, flow_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(updated_at), int(flow_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _flow_listing_query(
+    include_config: bool,
+    name_prefix: Optional[str],
+    cursor: Optional[str]
+):
+    """Projected, keyset-ordered flow query (newest first)"""
+    columns = [Flow.id, Flow.name, Flow.description, Flow.created_at, Flow.updated_at]
+    if include_config:
+        columns.append(Flow.flow_config)
+    
+    query = select(*columns).order_by(Flow.updated_at.desc(), Flow.id.desc())
+    if name_prefix:
+        escaped = (
+            name_prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        )
+        query = query.where(Flow.name.like(f"{escaped}%", escape="\\"))
+    if cursor:
+        updated_at, flow_id = _decode_cursor(cursor)
+        query = query.where(tuple_(Flow.updated_at, Flow.id) < (updated_at, flow_id))
+    return query
+
+@router.get("/flows/", response_model=FlowPage, response_model_exclude_none=True)
+async def list_flows(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    include_config: bool = False,
+    name_prefix: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    db: AsyncSession = Depends(get_db)
+):
+    """List flows, newest first, one keyset page at a time.
+    
+    ``flow_config`` is left out unless ``include_config`` is set. With
+    ``format=ndjson`` every matching flow is streamed, one JSON object per line.
+    """
+    query = _flow_listing_query(include_config, name_prefix, cursor)
+    
+    if format == "ndjson":
+        async def export():
+            # The request-scoped session is closed before streaming starts
+            async with AsyncSessionLocal() as session:
+                rows = await session.stream(
+                    query.execution_options(yield_per=500)
+                )
+                async for row in rows.mappings():
+                    summary = FlowSummary(**row)
+                    yield summary.model_dump_json(exclude_none=True) + "\n"
+        
+        return StreamingResponse(export(), media_type="application/x-ndjson")
+    
+    result = await db.execute(query.limit(limit + 1))
+    rows = result.mappings().all()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1]["updated_at"], rows[-1]["id"])
+    
+    return FlowPage(
+        items=[FlowSummary(**row) for row in rows],
+        next_cursor=next_cursor
+    )
 
 @router.get("/flows/{flow_id}")
-async def get_flow(flow_id: int, db: Session = Depends(get_db)):
+async def get_flow(flow_id: int, db: AsyncSession = Depends(get_db)):
     """Get a specific flow"""
-    flow = db.query(Flow).filter(Flow.id == flow_id).first()
+    flow = await db.get(Flow, flow_id)
     if not flow:
         raise HTTPException(status_code=404, detail="Flow not found")
     return flow
 
-@router.post("/flows/execute")
-async def execute_flow(execute_data: FlowExecute, db: Session = Depends(get_db)):
-    """Execute a flow with inputs"""
-    flow = db.query(Flow).filter(Flow.id == execute_data.flow_id).first()
+async def _get_runnable_flow(
+    flow_id: int,
+    db: AsyncSession,
+    flow_service: PromptFlowService
+) -> Flow:
+    """Load a flow, rejecting invalid graphs before any node runs"""
+    flow = await db.get(Flow, flow_id)
     if not flow:
         raise HTTPException(status_code=404, detail="Flow not found")
     
+    validation = await flow_service.validate_flow(
+        flow.flow_config["nodes"], flow.flow_config.get("connections", [])
+    )
+    if not validation["valid"]:
+        raise HTTPException(status_code=400, detail=validation["errors"])
+    return flow
+
+@router.post("/flows/execute")
+async def execute_flow(
+    execute_data: FlowExecute,
+    db: AsyncSession = Depends(get_db),
+    flow_service: PromptFlowService = Depends(get_flow_service),
+    cost_ledger: CostLedger = Depends(get_cost_ledger),
+    metrics_recorder: FlowMetricsRecorder = Depends(get_metrics_recorder)
+):
+    """Execute a flow with inputs"""
+    flow = await _get_runnable_flow(execute_data.flow_id, db, flow_service)
+    
     # Execute flow
-    result = await flow_service.execute_flow(
-        flow.flow_config["pf_config"],
-        execute_data.inputs
+    result = await flow_service.run(
+        flow.flow_config,
+        execute_data.inputs,
+        flow_id=flow.id,
+        updated_at=flow.updated_at
     )
+    metrics_recorder.add(flow.id, result)
+    record_run_costs(cost_ledger, flow.id, result)
     
     return result
 
+@router.post("/flows/execute/stream")
+async def execute_flow_stream(
+    execute_data: FlowExecute,
+    db: AsyncSession = Depends(get_db),
+    flow_service: PromptFlowService = Depends(get_flow_service),
+    cost_ledger: CostLedger = Depends(get_cost_ledger),
+    metrics_recorder: FlowMetricsRecorder = Depends(get_metrics_recorder)
+):
+    """Execute a flow, streaming progress as Server-Sent Events.
+    
+    Events: ``node_start``, ``token`` (incremental LLM output), ``node_end``,
+    ``node_error`` and finally ``result`` (outputs and metrics) or ``error``.
+    """
+    flow = await _get_runnable_flow(execute_data.flow_id, db, flow_service)
+    
+    async def events():
+        async for event in flow_service.stream(
+            flow.flow_config,
+            execute_data.inputs,
+            flow_id=flow.id,
+            updated_at=flow.updated_at
+        ):
+            name = event.pop("event")
+            if name in ("result", "error"):
+                metrics_recorder.add(
+                    flow.id, event if name == "result" else {"error": event["detail"]}
+                )
+                if name == "result":
+                    record_run_costs(cost_ledger, flow.id, event)
+            yield f"event: {name}\ndata: {json.dumps(event, default=str)}\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/flows/batch")
+async def run_batch(
+    flow_id: int = Form(...),
+    dataset_path: Optional[str] = Form(None),
+    file: Optional[UploadFile] = File(None),
+    output: str = Form("stream", pattern="^(stream|file)$"),
+    evaluate: bool = Form(False),
+    prompt_field: Optional[str] = Form(None),
+    expected_field: Optional[str] = Form(None),
+    concurrency: Optional[int] = Form(None, ge=1),
+    db: AsyncSession = Depends(get_db),
+    flow_service: PromptFlowService = Depends(get_flow_service),
+    batch_runner: BatchRunner = Depends(get_batch_runner)
+):
+    """Run a flow over every row of a JSONL dataset.
+    
+    The dataset is either uploaded as ``file`` or named by ``dataset_path``
+    (relative to the server's datasets directory). With ``output=stream``
+    results are streamed back as NDJSON; with ``output=file`` the run
+    continues in the background, writing a resumable results file.
+    """
+    if (file is None) == (dataset_path is None):
+        raise HTTPException(status_code=400, detail="Provide either file or dataset_path")
+    flow = await _get_runnable_flow(flow_id, db, flow_service)
+    
+    if file is not None:
+        async def chunks():
+            while chunk := await file.read(1 << 20):
+                yield chunk
+        
+        dataset_path = await batch_runner.save_dataset(chunks())
+    
+    try:
+        run = batch_runner.create_run(
+            flow.id,
+            dataset_path,
+            uploaded=file is not None,
+            evaluate=evaluate,
+            prompt_field=prompt_field,
+            expected_field=expected_field,
+            concurrency=concurrency
+        )
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        if file is not None:
+            await batch_runner.remove_dataset(dataset_path)
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if output == "file":
+        run = batch_runner.start(run, flow.flow_config, updated_at=flow.updated_at)
+        return asdict(run)
+    
+    async def export():
+        async for result in batch_runner.stream(run, flow.flow_config, flow.updated_at):
+            yield json.dumps(result, default=str) + "\n"
+    
+    return StreamingResponse(
+        export(),
+        media_type="application/x-ndjson",
+        headers={"X-Batch-Run-Id": run.run_id}
+    )
+
+@router.get("/flows/batch/{run_id}")
+async def get_batch_run(
+    run_id: str,
+    batch_runner: BatchRunner = Depends(get_batch_runner)
+):
+    """Progress of a batch run written to a results file"""
+    run = batch_runner.get_run(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Batch run not found")
+    return {**asdict(run), "active": batch_runner.is_active(run_id)}
+
+@router.get("/flows/batch/{run_id}/results")
+async def get_batch_results(
+    run_id: str,
+    batch_runner: BatchRunner = Depends(get_batch_runner)
+):
+    """Download a batch run's results file (NDJSON, in completion order)"""
+    if batch_runner.get_run(run_id) is None:
+        raise HTTPException(status_code=404, detail="Batch run not found")
+    return FileResponse(
+        batch_runner.results_path(run_id), media_type="application/x-ndjson"
+    )
+
+@router.post("/flows/batch/{run_id}/resume")
+async def resume_batch_run(
+    run_id: str,
+    db: AsyncSession = Depends(get_db),
+    flow_service: PromptFlowService = Depends(get_flow_service),
+    batch_runner: BatchRunner = Depends(get_batch_runner)
+):
+    """Continue an interrupted batch run from its last checkpoint"""
+    run = batch_runner.get_run(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Batch run not found")
+    if run.status == "completed":
+        raise HTTPException(status_code=400, detail="Batch run already completed")
+    if batch_runner.is_active(run_id):
+        raise HTTPException(status_code=409, detail="Batch run is still running")
+    
+    flow = await _get_runnable_flow(run.flow_id, db, flow_service)
+    try:
+        run = batch_runner.start(run, flow.flow_config, updated_at=flow.updated_at)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return asdict(run)
+
+@router.get("/flows/{flow_id}/costs")
+async def get_flow_costs(
+    flow_id: int,
+    db: AsyncSession = Depends(get_db),
+    cost_ledger: CostLedger = Depends(get_cost_ledger)
+):
+    """Running token and cost totals of a flow's LLM calls, per model"""
+    if not await db.get(Flow, flow_id):
+        raise HTTPException(status_code=404, detail="Flow not found")
+    totals = await cost_ledger.totals("flow", str(flow_id))
+    return {"flow_id": flow_id, "total": totals["total"], "by_model": totals["breakdown"]}
+
+def _version_summary(version: FlowVersion) -> Dict[str, Any]:
+    return {
+        "id": version.id,
+        "flow_id": version.flow_id,
+        "version": version.version,
+        "storage": version.storage,
+        "base_version_id": version.base_version_id,
+        "content_hash": version.content_hash,
+        "metrics": version.metrics,
+        "created_at": version.created_at
+    }
+
+async def _get_flow_version(flow_id: int, version_id: int, db: AsyncSession) -> FlowVersion:
+    version = await db.get(FlowVersion, version_id)
+    if version is None or version.flow_id != flow_id:
+        raise HTTPException(status_code=404, detail="Flow version not found")
+    return version
+
 @router.post("/flows/{flow_id}/versions")
-async def create_flow_version(flow_id: int, version_data: dict, db: Session = Depends(get_db)):
+async def create_flow_version(
+    flow_id: int,
+    version_data: dict,
+    db: AsyncSession = Depends(get_db),
+    version_store: FlowVersionStore = Depends(get_version_store)
+):
     """Create a new version of a flow"""
-    flow = db.query(Flow).filter(Flow.id == flow_id).first()
+    flow = await db.get(Flow, flow_id)
     if not flow:
         raise HTTPException(status_code=404, detail="Flow not found")
     
-    # Create new version
-    version = FlowVersion(
-        flow_id=flow_id,
-        version=version_data.get("version", "1.0"),
-        flow_config=version_data.get("flow_config", flow.flow_config),
+    # Stored as a delta from the latest version where that is smaller
+    version = await version_store.create(
+        db,
+        flow_id,
+        version_data.get("version", "1.0"),
+        version_data.get("flow_config", flow.flow_config),
         metrics=version_data.get("metrics", {})
     )
-    db.add(version)
-    db.commit()
-    db.refresh(version)
+    await db.commit()
     
-    return version
+    return _version_summary(version)
+
+@router.get("/flows/{flow_id}/versions")
+async def list_flow_versions(
+    flow_id: int,
+    limit: int = Query(50, ge=1, le=500),
+    before: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+    version_store: FlowVersionStore = Depends(get_version_store),
+    metrics_recorder: FlowMetricsRecorder = Depends(get_metrics_recorder)
+):
+    """Version history, newest first; pass the last id as ``before`` to page"""
+    # Include this process's buffered executions in the version metrics
+    await metrics_recorder.flush()
+    versions = await version_store.history(db, flow_id, limit=limit, before=before)
+    return {"items": [_version_summary(version) for version in versions]}
+
+@router.get("/flows/{flow_id}/versions/diff")
+async def diff_flow_versions(
+    flow_id: int,
+    from_version: int = Query(..., alias="from"),
+    to_version: int = Query(..., alias="to"),
+    db: AsyncSession = Depends(get_db),
+    version_store: FlowVersionStore = Depends(get_version_store)
+):
+    """Structural changes between two versions of a flow"""
+    await _get_flow_version(flow_id, from_version, db)
+    await _get_flow_version(flow_id, to_version, db)
+    diff = await version_store.diff(db, from_version, to_version)
+    return {"from": from_version, "to": to_version, **diff}
+
+@router.get("/flows/{flow_id}/versions/{version_id}")
+async def get_flow_version(
+    flow_id: int,
+    version_id: int,
+    db: AsyncSession = Depends(get_db),
+    version_store: FlowVersionStore = Depends(get_version_store),
+    metrics_recorder: FlowMetricsRecorder = Depends(get_metrics_recorder)
+):
+    """A version with its reconstructed flow_config"""
+    # Include this process's buffered executions in the version metrics
+    await metrics_recorder.flush()
+    version = await _get_flow_version(flow_id, version_id, db)
+    return {
+        **_version_summary(version),
+        "flow_config": await version_store.get_config(db, version_id)
+    }
 
 @router.get("/")
 async def list_flows():
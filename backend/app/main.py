@@ -1,18 +1,56 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+import asyncio
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from app.api.deps import get_evaluation_service, get_flow_service, shutdown_services
 from app.api.v1.router import api_router
 from app.core.config import settings
 from app.database import engine, Base
+from app.services.flow_worker_pool import FlowQueueFull
+from app.services.inference_worker import InferenceQueueFull
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create database tables
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    
+    # Load the embedding model in the background so the server starts
+    # accepting traffic (and answering /health) immediately
+    app.state.warmup_task = None
+    if settings.EMBEDDING_WARMUP:
+        app.state.warmup_task = asyncio.create_task(
+            get_evaluation_service().warm_up()
+        )
+    
+    # Start Prompt Flow worker processes (importing promptflow is slow)
+    app.state.pf_warmup_task = None
+    if settings.FLOW_ENGINE == "promptflow" and get_flow_service().promptflow_available:
+        app.state.pf_warmup_task = asyncio.create_task(
+            get_flow_service().worker_pool.start()
+        )
+    elif settings.FLOW_ENGINE == "native":
+        # Processes that run python node code
+        app.state.pf_warmup_task = asyncio.create_task(
+            get_flow_service().dag_executor.python_pool.start()
+        )
+    
+    yield
+    
+    for task in (app.state.warmup_task, app.state.pf_warmup_task):
+        if task is not None and not task.done():
+            task.cancel()
+    await shutdown_services()
+    await engine.dispose()
 
 app = FastAPI(
     title="Prompt Flow API",
     description="AI-powered prompt flow builder and execution engine",
     version="0.1.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -24,6 +62,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(InferenceQueueFull)
+@app.exception_handler(FlowQueueFull)
+async def queue_full_handler(request: Request, exc: Exception):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "1"}
+    )
+
 # Include API router
 app.include_router(api_router, prefix="/api/v1")
 
@@ -34,3 +81,21 @@ async def root():
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: healthy and the embedding model is loaded"""
+    task = getattr(app.state, "warmup_task", None)
+    if task is not None:
+        if not task.done():
+            return JSONResponse(
+                status_code=503,
+                content={"status": "starting", "embedding_model": "loading"}
+            )
+        if task.cancelled() or task.exception() is not None:
+            error = "cancelled" if task.cancelled() else str(task.exception())
+            return JSONResponse(
+                status_code=503,
+                content={"status": "unavailable", "embedding_model": error}
+            )
+    return {"status": "ready"}
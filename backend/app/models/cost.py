@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, String, Float, BigInteger, DateTime, UniqueConstraint
+from datetime import datetime
+from app.database import Base
+
+class CostAggregate(Base):
+    """Running token/cost totals, incremented as executions are recorded"""
+    __tablename__ = "cost_aggregates"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    scope = Column(String, nullable=False)  # "flow" or "experiment"
+    scope_id = Column(String, nullable=False)
+    dimension = Column(String, nullable=False)  # model for flows, variant for experiments
+    runs = Column(BigInteger, default=0)
+    prompt_tokens = Column(BigInteger, default=0)
+    completion_tokens = Column(BigInteger, default=0)
+    cost_usd = Column(Float, default=0.0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        UniqueConstraint("scope", "scope_id", "dimension", name="uq_cost_aggregates_key"),
+    )
@@ -1,9 +1,7 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, ForeignKey
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, ForeignKey, Index
+from sqlalchemy.orm import deferred, relationship
 from datetime import datetime
-
-Base = declarative_base()
+from app.database import Base
 
 class Flow(Base):
     __tablename__ = "flows"
@@ -16,6 +14,11 @@ class Flow(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     versions = relationship("FlowVersion", back_populates="flow")
+    
+    __table_args__ = (
+        # Keyset pagination order for flow listing
+        Index("ix_flows_updated_at_id", "updated_at", "id"),
+    )
 
 class FlowVersion(Base):
     __tablename__ = "flow_versions"
@@ -23,8 +26,21 @@ class FlowVersion(Base):
     id = Column(Integer, primary_key=True, index=True)
     flow_id = Column(Integer, ForeignKey("flows.id"))
     version = Column(String)
-    flow_config = Column(JSON)
+    # "snapshot" (full flow_config), "delta" (changes from base version) or
+    # "ref" (same content as base version); NULL for rows predating deltas
+    storage = Column(String, default="snapshot")
+    base_version_id = Column(Integer, ForeignKey("flow_versions.id"), nullable=True)
+    chain_length = Column(Integer, default=0)  # versions to replay from a snapshot
+    content_hash = Column(String(64))
+    flow_config = deferred(Column(JSON))  # snapshots only
+    delta = deferred(Column(JSON))
     metrics = Column(JSON)  # execution metrics
     created_at = Column(DateTime, default=datetime.utcnow)
     
     flow = relationship("Flow", back_populates="versions")
+    
+    __table_args__ = (
+        # Version history and content-hash deduplication per flow
+        Index("ix_flow_versions_flow_id_id", "flow_id", "id"),
+        Index("ix_flow_versions_flow_id_content_hash", "flow_id", "content_hash"),
+    )
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 
 class EvaluationMetrics(BaseModel):
@@ -21,13 +21,30 @@ class EvaluationMetrics(BaseModel):
     # Custom Metrics
     custom_metrics: Dict[str, float] = {}
 
+class EvaluationPair(BaseModel):
+    prompt: str
+    response: str
+    expected_output: Optional[str] = None
+    execution_time_ms: float = 0
+    token_counts: Optional[Dict[str, int]] = None
+    model: Optional[str] = None  # for cost; the pricing default model if unset
+
+class BatchEvaluationRequest(BaseModel):
+    pairs: List[EvaluationPair]
+    metrics: Optional[List[str]] = None  # registered metric names; default all
+
 class ABTestConfig(BaseModel):
     name: str
     description: str
-    traffic_split: float = 0.5  # 0.0-1.0
+    traffic_split: float = 0.5  # 0.0-1.0, share of traffic sent to variant B
+    variant_weights: Optional[Dict[str, float]] = None  # overrides traffic_split
+    assignment_salt: str = ""  # change to re-bucket users
     success_metric: str = "user_satisfaction"
-    minimum_sample_size: int = 100
+    minimum_sample_size: int = 100  # per variant, before any decision
     max_duration_days: int = 30
+    testing_mode: str = "sequential"  # "sequential" (mSPRT) or "fixed_horizon"
+    alpha: float = 0.05
+    mixture_variance: float = 0.01  # mSPRT mixing variance, relative to metric variance
 
 class ABTestResult(BaseModel):
     experiment_id: str
@@ -37,6 +54,15 @@ class ABTestResult(BaseModel):
     statistical_significance: float
     winner: Optional[str] = None  # "A", "B", or "tie"
     improvement_percentage: Optional[float] = None
+    success_metric: Optional[str] = None
+    confidence_interval: Optional[List[float]] = None  # 95% CI of B - A
+    status: Optional[str] = None  # "running", "completed", "paused"
+    stop_reason: Optional[str] = None  # "significant", "horizon_reached", "max_duration"
+
+class ExperimentResultCreate(BaseModel):
+    variant: str  # "A" or "B"
+    metrics: EvaluationMetrics
+    response_id: Optional[str] = None
 
 class HumanFeedback(BaseModel):
     response_id: str
@@ -52,6 +78,17 @@ class ExperimentCreate(BaseModel):
     flow_a_id: str
     flow_b_id: str
     config: ABTestConfig
+    additional_variants: Dict[str, str] = {}  # variant name -> flow_id
+
+class VariantAssignment(BaseModel):
+    experiment_id: str
+    user_id: str
+    variant: str
+    flow_id: str
+
+class VariantRunRequest(BaseModel):
+    user_id: str
+    inputs: Dict[str, Any] = {}
 
 class ExperimentResponse(BaseModel):
     experiment_id: str
@@ -38,6 +38,16 @@ class FlowResponse(FlowBase):
     class Config:
         from_attributes = True
 
+class FlowSummary(FlowBase):
+    id: int
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    flow_config: Optional[Dict[str, Any]] = None  # only when requested
+
+class FlowPage(BaseModel):
+    items: List[FlowSummary]
+    next_cursor: Optional[str] = None  # pass back to fetch the next page
+
 class FlowExecuteRequest(BaseModel):
     flow_id: int
     inputs: Dict[str, Any]
@@ -56,6 +66,9 @@ class FlowVersionResponse(BaseModel):
     id: int
     flow_id: int
     version: str
+    storage: Optional[str] = None  # "snapshot", "delta" or "ref"
+    base_version_id: Optional[int] = None
+    content_hash: Optional[str] = None
     flow_config: Dict[str, Any]
     metrics: Optional[Dict[str, Any]]
     created_at: datetime
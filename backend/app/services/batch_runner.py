@@ -0,0 +1,417 @@
+from typing import Any, AsyncIterator, BinaryIO, Dict, List, Optional, Set, Tuple
+from dataclasses import dataclass, asdict, field
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+import asyncio
+import json
+import os
+import uuid
+
+from app.services.cost_ledger import CostLedger
+from app.services.evaluation_service import EvaluationService
+from app.services.flow_metrics import record_run_costs
+from app.services.prompt_flow_service import PromptFlowService
+
+READ_CHUNK_LINES = 256
+_DONE = object()
+
+
+@dataclass
+class BatchRun:
+    """A batch run's settings and progress, persisted as its checkpoint"""
+    run_id: str
+    flow_id: int
+    dataset: str
+    # The dataset was uploaded for this run and is deleted once it can't be resumed
+    uploaded: bool = False
+    evaluate: bool = False
+    prompt_field: Optional[str] = None
+    expected_field: Optional[str] = None
+    concurrency: int = 8
+    status: str = "pending"  # pending, running, completed, failed, cancelled
+    # Every line before ``watermark`` has its result in results.jsonl;
+    # ``offset`` is the byte position of that line in the dataset
+    watermark: int = 0
+    offset: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    error: Optional[str] = None
+    created_at: str = field(default_factory=lambda: datetime.utcnow().isoformat())
+    updated_at: Optional[str] = None
+
+
+class BatchRunner:
+    """Runs a flow over every row of a JSONL dataset.
+
+    Rows are read incrementally and executed by a fixed pool of workers, and
+    at most ``concurrency * 4`` rows may be read ahead of the oldest
+    unfinished one, so memory stays constant regardless of dataset size.
+    Failed rows are retried with exponential backoff. Persisted runs append
+    to ``runs/<run_id>/results.jsonl`` and checkpoint the watermark, so an
+    interrupted run resumes where it stopped without repeating rows.
+    """
+
+    def __init__(
+        self,
+        flow_service: PromptFlowService,
+        evaluation_service: EvaluationService,
+        root: str,
+        concurrency: int = 8,
+        max_retries: int = 2,
+        retry_backoff_s: float = 0.5,
+        checkpoint_every: int = 100,
+        cost_ledger: Optional[CostLedger] = None
+    ):
+        self.flow_service = flow_service
+        self.evaluation_service = evaluation_service
+        self.root = Path(root).resolve()
+        self.datasets_dir = self.root / "datasets"
+        self.runs_dir = self.root / "runs"
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.retry_backoff_s = retry_backoff_s
+        self.checkpoint_every = checkpoint_every
+        self.cost_ledger = cost_ledger
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def dataset_path(self, name: str) -> Path:
+        """Resolve a dataset name, refusing paths outside the datasets directory"""
+        path = (self.datasets_dir / name).resolve()
+        if self.datasets_dir not in path.parents:
+            raise ValueError("Dataset path must be inside the datasets directory")
+        if not path.is_file():
+            raise FileNotFoundError(f"Dataset not found: {name}")
+        return path
+
+    async def save_dataset(self, chunks: AsyncIterator[bytes]) -> str:
+        """Store an uploaded dataset chunk by chunk and return its name"""
+        name = f"uploads/{uuid.uuid4().hex}.jsonl"
+        path = self.datasets_dir / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            async for chunk in chunks:
+                await asyncio.to_thread(f.write, chunk)
+        return name
+
+    async def remove_dataset(self, name: str):
+        """Delete an uploaded dataset (other datasets are left alone)"""
+        path = (self.datasets_dir / name).resolve()
+        if self.datasets_dir / "uploads" in path.parents:
+            await asyncio.to_thread(path.unlink, missing_ok=True)
+
+    def create_run(
+        self,
+        flow_id: int,
+        dataset: str,
+        uploaded: bool = False,
+        evaluate: bool = False,
+        prompt_field: Optional[str] = None,
+        expected_field: Optional[str] = None,
+        concurrency: Optional[int] = None
+    ) -> BatchRun:
+        self.dataset_path(dataset)
+        return BatchRun(
+            run_id=uuid.uuid4().hex,
+            flow_id=flow_id,
+            dataset=dataset,
+            uploaded=uploaded,
+            evaluate=evaluate,
+            prompt_field=prompt_field,
+            expected_field=expected_field,
+            concurrency=min(concurrency or self.concurrency, self.concurrency)
+        )
+
+    def get_run(self, run_id: str) -> Optional[BatchRun]:
+        """Load a persisted run's checkpoint"""
+        if not run_id.isalnum():
+            return None
+        path = self._checkpoint_path(run_id)
+        if not path.is_file():
+            return None
+        with open(path) as f:
+            return BatchRun(**json.load(f))
+
+    def results_path(self, run_id: str) -> Path:
+        return self.runs_dir / run_id / "results.jsonl"
+
+    def is_active(self, run_id: str) -> bool:
+        task = self._tasks.get(run_id)
+        return task is not None and not task.done()
+
+    def start(self, run: BatchRun, flow_config: Dict, updated_at: Any = None) -> BatchRun:
+        """Run in the background, persisting results and checkpoints.
+
+        Also used to resume: a run loaded with ``get_run`` continues from its
+        watermark.
+        """
+        if self.is_active(run.run_id):
+            raise ValueError(f"Batch run {run.run_id} is already running")
+        self.dataset_path(run.dataset)
+        self.results_path(run.run_id).parent.mkdir(parents=True, exist_ok=True)
+        run.status = "running"
+        run.error = None
+        self._save_checkpoint(run)
+        self._tasks[run.run_id] = asyncio.create_task(
+            self._run_to_file(run, flow_config, updated_at)
+        )
+        return run
+
+    async def stream(
+        self,
+        run: BatchRun,
+        flow_config: Dict,
+        updated_at: Any = None
+    ) -> AsyncIterator[Dict]:
+        """Yield results as rows finish (not persisted, so not resumable)"""
+        try:
+            async for result in self._execute(run, flow_config, updated_at, completed=set()):
+                yield result
+        finally:
+            if run.uploaded:
+                await self.remove_dataset(run.dataset)
+
+    async def close(self):
+        """Cancel background runs; their checkpoints allow resuming later"""
+        for task in self._tasks.values():
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+
+    # Private helper methods
+    def _checkpoint_path(self, run_id: str) -> Path:
+        return self.runs_dir / run_id / "checkpoint.json"
+
+    def _save_checkpoint(self, run: BatchRun):
+        run.updated_at = datetime.utcnow().isoformat()
+        self._write_checkpoint(run.run_id, asdict(run))
+
+    def _write_checkpoint(self, run_id: str, state: Dict):
+        path = self._checkpoint_path(run_id)
+        temporary = path.with_suffix(".tmp")
+        with open(temporary, "w") as f:
+            json.dump(state, f)
+        os.replace(temporary, path)
+
+    def _scan_results(self, run: BatchRun) -> Tuple[Set[int], int, int]:
+        """Lines past the watermark whose results were written before a crash,
+        and the succeeded/failed counts of every result in the file
+        """
+        completed: Set[int] = set()
+        errors: Dict[int, bool] = {}
+        path = self.results_path(run.run_id)
+        if not path.is_file():
+            return completed, 0, 0
+        with open(path) as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                    number = result["line"]
+                except (ValueError, KeyError, TypeError):
+                    continue  # torn final write
+                errors[number] = bool(result.get("error"))
+                if number >= run.watermark:
+                    completed.add(number)
+        failed = sum(errors.values())
+        return completed, len(errors) - failed, failed
+
+    def _open_results(self, run_id: str) -> BinaryIO:
+        f = open(self.results_path(run_id), "ab+")
+        # Terminate a line torn by a crash before appending after it
+        if f.seek(0, os.SEEK_END) > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+        return f
+
+    def _append_results(self, f: BinaryIO, lines: List[bytes], run_id: str, state: Dict):
+        """Write result lines, then the checkpoint that covers them"""
+        if lines:
+            f.write(b"".join(lines))
+            f.flush()
+        self._write_checkpoint(run_id, state)
+
+    async def _write_results(self, f: BinaryIO, lines: List[bytes], run: BatchRun):
+        run.updated_at = datetime.utcnow().isoformat()
+        # Snapshot on the loop; the files are written on a worker thread
+        await asyncio.to_thread(self._append_results, f, lines, run.run_id, asdict(run))
+
+    async def _run_to_file(self, run: BatchRun, flow_config: Dict, updated_at: Any):
+        completed, run.succeeded, run.failed = await asyncio.to_thread(self._scan_results, run)
+        f = await asyncio.to_thread(self._open_results, run.run_id)
+        # Results are written together with the checkpoint that covers them
+        pending: List[bytes] = []
+        try:
+            async for result in self._execute(run, flow_config, updated_at, completed):
+                pending.append(json.dumps(result, default=str).encode() + b"\n")
+                if len(pending) >= self.checkpoint_every:
+                    lines, pending = pending, []
+                    await self._write_results(f, lines, run)
+            run.status = "completed"
+        except asyncio.CancelledError:
+            run.status = "cancelled"
+            raise
+        except Exception as e:
+            run.status = "failed"
+            run.error = str(e)
+        finally:
+            try:
+                await self._write_results(f, pending, run)
+            finally:
+                f.close()
+                self._tasks.pop(run.run_id, None)
+        # Failed and cancelled runs can be resumed, so they keep their upload
+        if run.status == "completed" and run.uploaded:
+            await self.remove_dataset(run.dataset)
+
+    async def _execute(
+        self,
+        run: BatchRun,
+        flow_config: Dict,
+        updated_at: Any,
+        completed: Set[int]
+    ) -> AsyncIterator[Dict]:
+        """Execute dataset rows from the run's watermark onwards.
+
+        Results are yielded in completion order. The run's watermark and
+        counters advance as results are handed to the caller, so a checkpoint
+        taken after the caller has stored a result never skips a row.
+        """
+        path = self.dataset_path(run.dataset)
+        window = asyncio.Semaphore(run.concurrency * 4)
+        rows: asyncio.Queue = asyncio.Queue(maxsize=run.concurrency)
+        results: asyncio.Queue = asyncio.Queue()
+        # line -> byte offset just past it, for lines beyond the watermark
+        finished: Dict[int, int] = {}
+
+        async def produce():
+            with open(path, "rb") as f:
+                f.seek(run.offset)
+                number, offset = run.watermark, run.offset
+                while True:
+                    chunk: List[bytes] = await asyncio.to_thread(
+                        lambda: list(islice(f, READ_CHUNK_LINES))
+                    )
+                    if not chunk:
+                        break
+                    for raw in chunk:
+                        await window.acquire()
+                        offset += len(raw)
+                        if number in completed or not raw.strip():
+                            # Already stored before a restart, or blank
+                            await results.put((number, offset, None))
+                        else:
+                            await rows.put((number, offset, raw))
+                        number += 1
+            for _ in range(run.concurrency):
+                await rows.put(_DONE)
+
+        async def work():
+            while True:
+                item = await rows.get()
+                if item is _DONE:
+                    break
+                number, offset, raw = item
+                result = await self._run_row(run, flow_config, updated_at, number, raw)
+                await results.put((number, offset, result))
+
+        producer = asyncio.create_task(produce())
+        workers = [asyncio.create_task(work()) for _ in range(run.concurrency)]
+        tasks = [producer, *workers]
+
+        async def drained():
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                results.put_nowait(_DONE)
+
+        supervisor = asyncio.create_task(drained())
+        try:
+            while True:
+                item = await results.get()
+                if item is _DONE:
+                    break
+                number, offset, result = item
+                if result is not None:
+                    if result.get("error"):
+                        run.failed += 1
+                    else:
+                        run.succeeded += 1
+                    yield result
+
+                finished[number] = offset
+                while run.watermark in finished:
+                    run.offset = finished.pop(run.watermark)
+                    run.watermark += 1
+                    window.release()
+            # Surface a producer failure (e.g. unreadable dataset)
+            await supervisor
+        finally:
+            for task in (*tasks, supervisor):
+                task.cancel()
+            await asyncio.gather(*tasks, supervisor, return_exceptions=True)
+
+    async def _run_row(
+        self,
+        run: BatchRun,
+        flow_config: Dict,
+        updated_at: Any,
+        number: int,
+        raw: bytes
+    ) -> Dict:
+        try:
+            inputs = json.loads(raw)
+            if not isinstance(inputs, dict):
+                raise ValueError("row must be a JSON object")
+        except ValueError as e:
+            return {"line": number, "error": f"Invalid JSON row: {e}", "attempts": 0}
+
+        result: Dict[str, Any] = {}
+        attempts = 0
+        while attempts <= self.max_retries:
+            if attempts:
+                await asyncio.sleep(self.retry_backoff_s * 2 ** (attempts - 1))
+            attempts += 1
+            try:
+                result = await self.flow_service.run(
+                    flow_config, inputs, flow_id=run.flow_id, updated_at=updated_at
+                )
+            except Exception as e:
+                result = {"error": str(e)}
+            if not result.get("error"):
+                break
+
+        if self.cost_ledger is not None:
+            record_run_costs(self.cost_ledger, run.flow_id, result)
+        record = {"line": number, "inputs": inputs, **result, "attempts": attempts}
+        if run.evaluate and not result.get("error"):
+            try:
+                record["evaluation"] = await self._evaluate(run, inputs, result)
+            except Exception as e:
+                record["evaluation_error"] = str(e)
+        return record
+
+    async def _evaluate(self, run: BatchRun, inputs: Dict, result: Dict) -> Dict:
+        outputs = result.get("outputs", {})
+        values = list(outputs.values()) if isinstance(outputs, dict) else [outputs]
+        response = str(values[0]) if len(values) == 1 else json.dumps(outputs, default=str)
+        prompt = (
+            str(inputs.get(run.prompt_field, "")) if run.prompt_field
+            else json.dumps(inputs, default=str)
+        )
+
+        metrics = result.get("metrics", {})
+        token_counts: Dict[str, int] = {}
+        for node_metrics in metrics.get("nodes", {}).values():
+            for name, count in node_metrics.get("token_usage", {}).items():
+                token_counts[name] = token_counts.get(name, 0) + count
+
+        evaluation = await self.evaluation_service.evaluate_prompt_quality(
+            prompt,
+            response,
+            expected_output=inputs.get(run.expected_field) if run.expected_field else None,
+            execution_time_ms=metrics.get("duration", 0) * 1000,
+            token_counts=token_counts
+        )
+        return evaluation.dict()
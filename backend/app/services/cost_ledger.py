@@ -0,0 +1,174 @@
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import asyncio
+
+import numpy as np
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.cost import CostAggregate
+
+# (scope, scope_id, dimension) -> [runs, prompt_tokens, completion_tokens, cost_usd]
+Key = Tuple[str, str, str]
+
+
+class CostLedger:
+    """Running cost aggregates per flow (by model) and experiment (by variant).
+
+    Executions add increments to an in-memory buffer, which is written as
+    one ``UPDATE ... SET x = x + n`` per aggregate every
+    ``flush_interval_ms``, so dashboards read a handful of rows instead of
+    rescanning every execution.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession],
+        flush_interval_ms: float = 1000
+    ):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval_ms / 1000
+        self._pending: Dict[Key, List[float]] = {}
+        self._lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def add(
+        self,
+        scope: str,
+        scope_id: str,
+        dimension: str,
+        prompt_tokens: float = 0,
+        completion_tokens: float = 0,
+        cost: float = 0.0,
+        runs: int = 1
+    ):
+        totals = self._pending.setdefault((scope, str(scope_id), dimension), [0, 0, 0, 0.0])
+        totals[0] += runs
+        totals[1] += prompt_tokens
+        totals[2] += completion_tokens
+        totals[3] += cost
+        self._ensure_flusher()
+
+    def add_many(
+        self,
+        scope: str,
+        scope_id: str,
+        dimensions: Sequence[str],
+        prompt_tokens: Sequence[float],
+        completion_tokens: Sequence[float],
+        costs: Sequence[float]
+    ):
+        """Add many executions at once, summed per dimension with numpy"""
+        if len(dimensions) == 0:
+            return
+        names, inverse = np.unique(np.asarray(dimensions, dtype=object), return_inverse=True)
+        runs = np.bincount(inverse, minlength=len(names))
+        sums = [
+            np.bincount(inverse, weights=np.asarray(values, dtype=np.float64), minlength=len(names))
+            for values in (prompt_tokens, completion_tokens, costs)
+        ]
+        for group, name in enumerate(names):
+            self.add(
+                scope, scope_id, name,
+                prompt_tokens=float(sums[0][group]),
+                completion_tokens=float(sums[1][group]),
+                cost=float(sums[2][group]),
+                runs=int(runs[group])
+            )
+
+    async def totals(self, scope: str, scope_id: str) -> Dict:
+        """Overall and per-dimension totals (pending increments included)"""
+        await self.flush()
+        async with self.session_factory() as db:
+            rows = (await db.execute(
+                select(CostAggregate)
+                .where(CostAggregate.scope == scope, CostAggregate.scope_id == str(scope_id))
+            )).scalars().all()
+
+        breakdown = {}
+        total = {"runs": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0}
+        for row in rows:
+            entry = {
+                "runs": row.runs,
+                "prompt_tokens": row.prompt_tokens,
+                "completion_tokens": row.completion_tokens,
+                "cost_usd": row.cost_usd
+            }
+            breakdown[row.dimension] = entry
+            for name, value in entry.items():
+                total[name] += value
+        return {"total": total, "breakdown": breakdown}
+
+    async def flush(self):
+        async with self._lock:
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            try:
+                async with self.session_factory() as db:
+                    for key, values in pending.items():
+                        await self._increment(db, key, values)
+                    await db.commit()
+            except Exception:
+                # Keep the increments for the next flush attempt
+                for key, values in pending.items():
+                    totals = self._pending.setdefault(key, [0, 0, 0, 0.0])
+                    for i, value in enumerate(values):
+                        totals[i] += value
+                raise
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        await self.flush()
+
+    # Private helper methods
+    def _ensure_flusher(self):
+        if self._flush_task is None or self._flush_task.done():
+            try:
+                self._flush_task = asyncio.get_running_loop().create_task(
+                    self._flush_periodically()
+                )
+            except RuntimeError:
+                pass  # no event loop: flushed by the next totals() or close()
+
+    async def _flush_periodically(self):
+        while self._pending:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Warning: cost ledger flush failed: {e}")
+
+    async def _increment(self, db: AsyncSession, key: Key, values: List[float]):
+        scope, scope_id, dimension = key
+        runs, prompt_tokens, completion_tokens, cost = values
+        match = (
+            (CostAggregate.scope == scope)
+            & (CostAggregate.scope_id == scope_id)
+            & (CostAggregate.dimension == dimension)
+        )
+        increment = update(CostAggregate).where(match).values(
+            runs=CostAggregate.runs + int(runs),
+            prompt_tokens=CostAggregate.prompt_tokens + int(prompt_tokens),
+            completion_tokens=CostAggregate.completion_tokens + int(completion_tokens),
+            cost_usd=CostAggregate.cost_usd + float(cost)
+        )
+        if (await db.execute(increment)).rowcount:
+            return
+        try:
+            async with db.begin_nested():
+                db.add(CostAggregate(
+                    scope=scope,
+                    scope_id=scope_id,
+                    dimension=dimension,
+                    runs=int(runs),
+                    prompt_tokens=int(prompt_tokens),
+                    completion_tokens=int(completion_tokens),
+                    cost_usd=float(cost)
+                ))
+        except IntegrityError:
+            # Another process created the row first
+            await db.execute(increment)
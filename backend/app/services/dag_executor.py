@@ -0,0 +1,486 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from dataclasses import dataclass, field
+import asyncio
+import hashlib
+import json
+import re
+import time
+
+from app.services.flow_worker_pool import FlowWorkerPool, python_node_worker_main
+from app.services.llm_client import LLMClient
+from app.services.node_cache import NodeCache, node_cache_key
+from app.services.pricing import estimate_cost
+from app.services.semantic_cache import SemanticCache
+from app.services.tracing import Span, Tracer, new_trace_id, payload_size
+
+TEMPLATE_VARIABLE = re.compile(r"\{\{\s*([\w.]+)\s*\}\}")
+
+# LLM node settings that don't change what the model generates
+_SEMANTIC_SCOPE_EXCLUDED = {"cache", "timeout", "semantic_cache", "prompt", "inputs"}
+
+
+class NodeExecutionError(Exception):
+    """A node failed or timed out; aborts the rest of the flow"""
+
+    def __init__(self, node_id: str, message: str):
+        super().__init__(f"Node '{node_id}' failed: {message}")
+        self.node_id = node_id
+
+
+@dataclass
+class DagNode:
+    """A UI node plus its resolved edges"""
+    id: str
+    type: str
+    config: Dict[str, Any]
+    # (source node id, sourceHandle, targetHandle) per incoming connection
+    upstream: List[Tuple[str, Optional[str], Optional[str]]] = field(default_factory=list)
+    downstream: Set[str] = field(default_factory=set)
+
+    @property
+    def predecessors(self) -> Set[str]:
+        return {source for source, _, _ in self.upstream}
+
+
+EventCallback = Callable[[str, Dict[str, Any]], None]
+
+
+def _ignore_event(event: str, data: Dict[str, Any]):
+    pass
+
+
+@dataclass
+class FlowRun:
+    """State shared by the nodes of one execution"""
+    inputs: Dict[str, Any]
+    # Stored flow id, or a hash of the definition for unsaved flows
+    flow_key: str = ""
+    outputs: Dict[str, Any] = field(default_factory=dict)
+    node_metrics: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    # Receives node_start/node_end/node_error and LLM token events
+    emit: EventCallback = _ignore_event
+    streaming: bool = False
+    trace_id: str = field(default_factory=new_trace_id)
+    span_id: Optional[str] = None
+    spans: List[Span] = field(default_factory=list)
+
+
+NodeRunner = Callable[[DagNode, Dict[str, Any], FlowRun], Awaitable[Any]]
+
+
+def node_config(node: Dict) -> Dict[str, Any]:
+    """Node settings as stored by the canvas (``data.config``)"""
+    return {**(node.get("data") or {}).get("config", {}), **node.get("config", {})}
+
+
+def build_dag(nodes: List[Dict], connections: List[Dict]) -> Dict[str, DagNode]:
+    """Index UI nodes by id and attach their connections"""
+    dag: Dict[str, DagNode] = {}
+    for node in nodes:
+        dag[node["id"]] = DagNode(id=node["id"], type=node["type"], config=node_config(node))
+
+    for connection in connections:
+        source, target = connection["source"], connection["target"]
+        if source not in dag or target not in dag:
+            raise ValueError(
+                f"Connection {connection.get('id', '')} references an unknown node"
+            )
+        dag[target].upstream.append(
+            (source, connection.get("sourceHandle"), connection.get("targetHandle"))
+        )
+        dag[source].downstream.add(target)
+    return dag
+
+
+def topological_order(dag: Dict[str, DagNode]) -> List[str]:
+    """Kahn's algorithm; raises ValueError if the flow has a cycle"""
+    in_degree = {node_id: len(node.predecessors) for node_id, node in dag.items()}
+    ready = [node_id for node_id, degree in in_degree.items() if degree == 0]
+    order = []
+    while ready:
+        node_id = ready.pop()
+        order.append(node_id)
+        for successor in dag[node_id].downstream:
+            in_degree[successor] -= 1
+            if in_degree[successor] == 0:
+                ready.append(successor)
+
+    if len(order) != len(dag):
+        raise ValueError("Flow contains a circular dependency")
+    return order
+
+
+class DagExecutor:
+    """In-process flow engine.
+
+    Nodes start as soon as all of their predecessors have finished, so
+    independent branches run concurrently and a flow takes roughly as long as
+    its critical path. ``max_concurrency`` bounds how many nodes of one flow
+    run at once and every node is subject to a timeout (``timeout`` in the
+    node config overrides ``node_timeout``).
+
+    Nodes whose config sets ``cache`` (``true`` or ``{"ttl": seconds}``) are
+    memoized in ``node_cache`` by node definition and resolved inputs. LLM
+    nodes that set ``semantic_cache`` (``true`` or ``{"threshold": 0.9}``)
+    reuse completions of sufficiently similar earlier prompts.
+
+    Every execution is traced: each node records wall and CPU time, time
+    spent waiting for a concurrency slot, payload sizes, cache hits and, for
+    LLM nodes, token usage and estimated cost. The spans go to ``tracer``.
+    CPU time of nodes that await I/O also counts other work the event loop
+    did meanwhile; python nodes are measured in their worker process.
+
+    Python nodes run in ``python_pool`` worker processes, never in the API
+    process: a node that times out or is cancelled has its worker killed.
+    """
+
+    def __init__(
+        self,
+        llm_client: Optional[LLMClient] = None,
+        max_concurrency: int = 8,
+        node_timeout: float = 60.0,
+        node_cache: Optional[NodeCache] = None,
+        cache_ttl: float = 3600,
+        semantic_cache: Optional[SemanticCache] = None,
+        tracer: Optional[Tracer] = None,
+        python_pool: Optional[FlowWorkerPool] = None
+    ):
+        self.llm_client = llm_client or LLMClient()
+        self.max_concurrency = max_concurrency
+        self.node_timeout = node_timeout
+        self.node_cache = node_cache
+        self.cache_ttl = cache_ttl
+        self.semantic_cache = semantic_cache
+        self.tracer = tracer or Tracer()
+        self.python_pool = python_pool or FlowWorkerPool(
+            job_timeout=node_timeout, target=python_node_worker_main
+        )
+        self.runners: Dict[str, NodeRunner] = {
+            "input": self._run_input,
+            "prompt": self._run_prompt,
+            "llm": self._run_llm,
+            "python": self._run_python,
+            "output": self._run_output
+        }
+
+    async def execute(
+        self,
+        nodes: List[Dict],
+        connections: List[Dict],
+        inputs: Dict[str, Any],
+        emit: Optional[EventCallback] = None,
+        flow_id: Optional[Any] = None
+    ) -> Dict:
+        """Run the flow and return its outputs and metrics.
+
+        ``emit`` is called synchronously with progress events; LLM nodes
+        stream their completions token by token when it is given.
+        ``flow_id`` scopes the semantic cache to the stored flow.
+        """
+        dag = build_dag(nodes, connections)
+        topological_order(dag)
+        unsupported = sorted({node.type for node in dag.values()} - set(self.runners))
+        if unsupported:
+            raise ValueError(f"Unsupported node types: {', '.join(unsupported)}")
+
+        run = FlowRun(inputs=inputs, flow_key=self._flow_key(flow_id, nodes, connections))
+        if emit is not None:
+            run.emit, run.streaming = emit, True
+        root = Span("flow", run.trace_id, attributes={"flow.nodes": len(dag)})
+        run.span_id = root.span_id
+        run.spans.append(root)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        waiting = {node_id: len(node.predecessors) for node_id, node in dag.items()}
+        running: Dict[asyncio.Task, str] = {}
+
+        def start(node_id: str):
+            task = asyncio.create_task(self._run_node(dag[node_id], run, semaphore))
+            running[task] = node_id
+
+        started = time.perf_counter()
+        for node_id, count in waiting.items():
+            if count == 0:
+                start(node_id)
+
+        status = "ok"
+        try:
+            while running:
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    node_id = running.pop(task)
+                    run.outputs[node_id] = task.result()
+                    for successor in dag[node_id].downstream:
+                        waiting[successor] -= 1
+                        if waiting[successor] == 0:
+                            start(successor)
+        except BaseException as e:
+            status = str(e) or type(e).__name__
+            raise
+        finally:
+            # First failure aborts the branches still in flight
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+            metrics = self._aggregate_metrics(run, time.perf_counter() - started)
+            root.attributes.update(
+                (f"flow.{name}", value) for name, value in metrics.items() if name != "nodes"
+            )
+            root.end(status)
+            await self.tracer.export(run.spans)
+
+        return {"outputs": self._flow_outputs(dag, run.outputs), "metrics": metrics}
+
+    # Private helper methods
+    async def _run_node(self, node: DagNode, run: FlowRun, semaphore: asyncio.Semaphore) -> Any:
+        ready = time.perf_counter()
+        async with semaphore:
+            metrics = run.node_metrics.setdefault(node.id, {})
+            metrics["queue_wait"] = time.perf_counter() - ready
+            span = Span(f"node {node.id}", run.trace_id, parent_id=run.span_id)
+            run.spans.append(span)
+            run.emit("node_start", {"node_id": node.id, "node_type": node.type})
+            try:
+                result = await self._execute_node(node, run)
+            except NodeExecutionError as e:
+                self._end_span(span, node, metrics, str(e))
+                run.emit("node_error", {"node_id": node.id, "detail": str(e)})
+                raise
+            except asyncio.CancelledError:
+                self._end_span(span, node, metrics, "cancelled")
+                raise
+            metrics["output_bytes"] = self._payload_size(result)
+            self._end_span(span, node, metrics, "ok")
+            run.emit("node_end", {"node_id": node.id, "output": result, "metrics": metrics})
+            return result
+
+    async def _execute_node(self, node: DagNode, run: FlowRun) -> Any:
+        """Run one node, through the memoization cache when it opts in"""
+        timeout = float(node.config.get("timeout", self.node_timeout))
+        metrics = run.node_metrics.setdefault(node.id, {})
+        started = time.perf_counter()
+        cpu_started = time.thread_time()
+        inputs = self._resolve_inputs(node, run)
+        metrics["input_bytes"] = self._payload_size(inputs)
+        cache_key = self._cache_key(node, inputs)
+        if cache_key is not None:
+            cached = await self._cache_get(cache_key)
+            if cached is not None:
+                metrics.update(
+                    duration=time.perf_counter() - started,
+                    cpu_time=time.thread_time() - cpu_started,
+                    cache_hit=True
+                )
+                return json.loads(cached)
+
+        try:
+            result = await asyncio.wait_for(
+                self.runners[node.type](node, inputs, run),
+                timeout
+            )
+        except asyncio.TimeoutError:
+            raise NodeExecutionError(node.id, f"timed out after {timeout}s")
+        except NodeExecutionError:
+            raise
+        except Exception as e:
+            raise NodeExecutionError(node.id, str(e)) from e
+        finally:
+            metrics["duration"] = time.perf_counter() - started
+            # Python nodes report their worker's CPU time
+            metrics.setdefault("cpu_time", time.thread_time() - cpu_started)
+        if cache_key is not None:
+            metrics["cache_hit"] = False
+            await self._cache_set(cache_key, result, node.config["cache"])
+        return result
+
+    def _aggregate_metrics(self, run: FlowRun, duration: float) -> Dict[str, Any]:
+        nodes = run.node_metrics.values()
+        return {
+            "trace_id": run.trace_id,
+            "duration": duration,
+            "cpu_time": sum(m.get("cpu_time", 0.0) for m in nodes),
+            "queue_wait": sum(m.get("queue_wait", 0.0) for m in nodes),
+            "tokens": sum(m.get("tokens", 0) for m in nodes),
+            "prompt_tokens": sum(m.get("token_usage", {}).get("prompt_tokens", 0) for m in nodes),
+            "completion_tokens": sum(
+                m.get("token_usage", {}).get("completion_tokens", 0) for m in nodes
+            ),
+            "cost": sum(m.get("cost", 0.0) for m in nodes),
+            "cache_hits": sum(1 for m in nodes if m.get("cache_hit")),
+            "semantic_cache_hits": sum(1 for m in nodes if m.get("semantic_cache_hit")),
+            "mock": any(m.get("mock") for m in nodes),
+            "nodes": run.node_metrics
+        }
+
+    def _end_span(self, span: Span, node: DagNode, metrics: Dict[str, Any], status: str):
+        span.attributes.update({"node.id": node.id, "node.type": node.type})
+        for name, value in metrics.items():
+            if isinstance(value, dict):
+                span.attributes.update((f"node.{name}.{k}", v) for k, v in value.items())
+            else:
+                span.attributes[f"node.{name}"] = value
+        span.end(status)
+
+    def _flow_key(self, flow_id: Optional[Any], nodes: List[Dict], connections: List[Dict]) -> str:
+        if flow_id is not None:
+            return f"flow-{flow_id}"
+        canonical = json.dumps(
+            {"nodes": nodes, "connections": connections},
+            sort_keys=True, separators=(",", ":"), default=str
+        )
+        return "def-" + hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+    def _payload_size(self, value: Any) -> Optional[int]:
+        try:
+            return payload_size(value)
+        except (TypeError, ValueError):
+            return None
+
+    def _cache_key(self, node: DagNode, inputs: Dict[str, Any]) -> Optional[str]:
+        if self.node_cache is None or not node.config.get("cache"):
+            return None
+        return node_cache_key(node.type, node.config, inputs)
+
+    async def _cache_get(self, key: str) -> Optional[str]:
+        try:
+            return await self.node_cache.get(key)
+        except Exception as e:
+            # An unavailable cache must not fail the flow
+            print(f"Warning: node cache lookup failed: {e}")
+            return None
+
+    async def _cache_set(self, key: str, result: Any, options: Any):
+        ttl = options.get("ttl", self.cache_ttl) if isinstance(options, dict) else self.cache_ttl
+        try:
+            await self.node_cache.set(key, json.dumps(result), float(ttl))
+        except TypeError:
+            pass  # outputs that aren't JSON serializable are never cached
+        except Exception as e:
+            print(f"Warning: node cache write failed: {e}")
+
+    def _resolve_inputs(self, node: DagNode, run: FlowRun) -> Dict[str, Any]:
+        """Flow inputs, overridden by static node inputs and upstream outputs"""
+        resolved = {**run.inputs, **node.config.get("inputs", {})}
+        upstream = {}
+        for source, source_handle, target_handle in node.upstream:
+            value = run.outputs[source]
+            if source_handle and isinstance(value, dict) and source_handle in value:
+                value = value[source_handle]
+            upstream[target_handle or source] = value
+        resolved.update(upstream)
+
+        # ``input`` is what single-argument nodes (e.g. ``main(input)``) receive
+        if "input" not in upstream:
+            if len(upstream) == 1:
+                resolved["input"] = next(iter(upstream.values()))
+            elif upstream:
+                resolved["input"] = upstream
+            else:
+                resolved.setdefault("input", dict(run.inputs))
+        return resolved
+
+    def _flow_outputs(self, dag: Dict[str, DagNode], outputs: Dict[str, Any]) -> Dict[str, Any]:
+        """Values of output nodes, or of every sink when there are none"""
+        output_nodes = [node for node in dag.values() if node.type == "output"]
+        if output_nodes:
+            return {node.config.get("name", node.id): outputs[node.id] for node in output_nodes}
+        return {node_id: outputs[node_id] for node_id, node in dag.items() if not node.downstream}
+
+    def _render(self, template: str, values: Dict[str, Any]) -> str:
+        def substitute(match: re.Match) -> str:
+            value: Any = values
+            for part in match.group(1).split("."):
+                if not isinstance(value, dict) or part not in value:
+                    raise KeyError(f"Missing template variable: {match.group(1)}")
+                value = value[part]
+            return str(value)
+
+        return TEMPLATE_VARIABLE.sub(substitute, template)
+
+    # Node runners
+    async def _run_input(self, node: DagNode, inputs: Dict[str, Any], run: FlowRun) -> Any:
+        fields = node.config.get("fields")
+        if fields:
+            return {name: run.inputs.get(name) for name in fields}
+        return dict(run.inputs)
+
+    async def _run_prompt(self, node: DagNode, inputs: Dict[str, Any], run: FlowRun) -> str:
+        return self._render(node.config.get("template", ""), inputs)
+
+    async def _run_llm(self, node: DagNode, inputs: Dict[str, Any], run: FlowRun) -> str:
+        if node.config.get("prompt"):
+            prompt = self._render(node.config["prompt"], inputs)
+        else:
+            prompt = str(inputs.get("prompt", inputs["input"]))
+
+        model = node.config.get("model", "gpt-3.5-turbo")
+        metrics = run.node_metrics.setdefault(node.id, {})
+        scope = None
+        if self.semantic_cache is not None and node.config.get("semantic_cache"):
+            scope = SemanticCache.scope(run.flow_key, node.id, model, {
+                name: value for name, value in node.config.items()
+                if name not in _SEMANTIC_SCOPE_EXCLUDED
+            })
+            options = node.config["semantic_cache"]
+            threshold = options.get("threshold") if isinstance(options, dict) else None
+            try:
+                cached = await self.semantic_cache.lookup(scope, prompt, threshold)
+            except Exception as e:
+                # Fall through to the LLM if embeddings are unavailable
+                print(f"Warning: semantic cache lookup failed: {e}")
+                cached, scope = None, None
+            if cached is not None:
+                metrics.update(
+                    model=model,
+                    semantic_cache_hit=True,
+                    similarity=cached["similarity"],
+                    cost=0.0
+                )
+                return cached["completion"]
+
+        on_token = None
+        if run.streaming:
+            started = time.perf_counter()
+
+            def on_token(text: str):
+                metrics.setdefault("time_to_first_token", time.perf_counter() - started)
+                run.emit("token", {"node_id": node.id, "text": text})
+
+        text, usage = await self.llm_client.complete(
+            prompt,
+            model=model,
+            temperature=node.config.get("temperature", 0.7),
+            max_tokens=node.config.get("max_tokens"),
+            on_token=on_token
+        )
+        metrics.update(
+            model=model,
+            token_usage=usage,
+            tokens=sum(usage.values()),
+            cost=estimate_cost(model, usage)
+        )
+        if self.llm_client.mock:
+            metrics["mock"] = True
+
+        if scope is not None:
+            metrics["semantic_cache_hit"] = False
+            try:
+                await self.semantic_cache.store(scope, prompt, text, usage)
+            except Exception as e:
+                print(f"Warning: semantic cache write failed: {e}")
+        return text
+
+    async def _run_python(self, node: DagNode, inputs: Dict[str, Any], run: FlowRun) -> Any:
+        # The flow author's code runs in a worker process; when the node
+        # times out (or the flow is aborted) the cancellation kills it
+        timeout = float(node.config.get("timeout", self.node_timeout))
+        result = await self.python_pool.submit(
+            (node.id, node.config.get("code", ""), inputs), timeout
+        )
+        metrics = run.node_metrics.setdefault(node.id, {})
+        metrics["worker_wait"] = result["queue_wait"]
+        metrics["cpu_time"] = result["outputs"]["cpu_time"]
+        return result["outputs"]["result"]
+
+    async def _run_output(self, node: DagNode, inputs: Dict[str, Any], run: FlowRun) -> Any:
+        return inputs["input"]
@@ -0,0 +1,220 @@
+from typing import Dict, List, Optional, Sequence
+from collections import OrderedDict
+from pathlib import Path
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """Content-addressed LRU cache for text embeddings.
+
+    Entries are keyed by a SHA-256 digest of the model name and the text, so
+    switching models never serves stale vectors. The in-memory tier is bounded
+    by bytes and evicts least-recently-used entries. When ``path`` is given, a
+    memory-mapped float32 ring buffer backs the cache so warm entries survive
+    restarts. Disk writes are synced by ``flush()`` (blocking: callers run it
+    off the event loop) once ``flush_every`` entries or ``flush_interval_s``
+    seconds have accumulated, see ``flush_due()``.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        max_bytes: int,
+        path: Optional[str] = None,
+        disk_capacity: int = 200_000,
+        flush_every: int = 1024,
+        flush_interval_s: float = 30.0
+    ):
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._bytes = 0
+
+        # Disk tier (created lazily once the embedding dimension is known)
+        self.path = Path(path) if path else None
+        self.disk_capacity = disk_capacity
+        self._vectors: Optional[np.memmap] = None
+        self._keys: Optional[np.memmap] = None
+        self._slots: Dict[bytes, int] = {}
+        self._next_slot = 0
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval_s
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+        if self.path is not None:
+            self._load_disk()
+
+    def key(self, text: str) -> bytes:
+        """Content hash of (model name, text)"""
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).digest()
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Look up embeddings, returning None for each miss"""
+        found: List[Optional[np.ndarray]] = []
+        for text in texts:
+            key = self.key(text)
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+            else:
+                vector = self._read_disk(key)
+                if vector is not None:
+                    self._remember(key, vector)
+
+            if vector is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            found.append(vector)
+        return found
+
+    def put_many(self, texts: Sequence[str], embeddings: np.ndarray):
+        """Store freshly computed embeddings"""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        for text, vector in zip(texts, embeddings):
+            key = self.key(text)
+            self._remember(key, vector)
+            self._write_disk(key, vector)
+
+    def flush_due(self) -> bool:
+        """Whether enough disk writes are pending to be worth a ``flush()``"""
+        if self._unflushed == 0:
+            return False
+        return (
+            self._unflushed >= self.flush_every
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        )
+
+    def flush(self):
+        """Sync the disk tier and its metadata"""
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+        self._flush_disk()
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and occupancy"""
+        lookups = self.hits + self.misses
+        return {
+            "model_name": self.model_name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._entries),
+            "memory_bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "disk_entries": len(self._slots),
+            "disk_capacity": self.disk_capacity if self.path else 0
+        }
+
+    def clear(self):
+        """Drop the in-memory tier and reset counters"""
+        self._entries.clear()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    # Private helper methods
+    def _remember(self, key: bytes, vector: np.ndarray):
+        """Insert into the memory tier, evicting LRU entries over budget"""
+        vector = np.array(vector, dtype=np.float32, copy=True)
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous.nbytes
+        self._entries[key] = vector
+        self._bytes += vector.nbytes
+
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+
+    def _meta_path(self) -> Path:
+        return self.path.with_suffix(".json")
+
+    def _load_disk(self):
+        """Open an existing memory-mapped cache, if compatible"""
+        meta_path = self._meta_path()
+        if not meta_path.exists():
+            return
+
+        try:
+            meta = json.loads(meta_path.read_text())
+            if meta.get("model_name") != self.model_name:
+                return
+            self.disk_capacity = meta["capacity"]
+            self._open_disk(meta["dim"], mode="r+")
+            self._next_slot = meta.get("next_slot", 0)
+            empty = bytes(32)
+            for slot, key in enumerate(self._keys):
+                key = bytes(key).ljust(32, b"\0")
+                if key != empty:
+                    self._slots[key] = slot
+        except (OSError, ValueError, KeyError):
+            # Corrupt or truncated cache files are rebuilt from scratch
+            self._vectors = None
+            self._keys = None
+            self._slots = {}
+            self._next_slot = 0
+
+    def _open_disk(self, dim: int, mode: str):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._vectors = np.memmap(
+            self.path.with_suffix(".f32"),
+            dtype=np.float32,
+            mode=mode,
+            shape=(self.disk_capacity, dim)
+        )
+        self._keys = np.memmap(
+            self.path.with_suffix(".keys"),
+            dtype="S32",
+            mode=mode,
+            shape=(self.disk_capacity,)
+        )
+
+    def _read_disk(self, key: bytes) -> Optional[np.ndarray]:
+        slot = self._slots.get(key)
+        if slot is None or self._vectors is None:
+            return None
+        return np.array(self._vectors[slot])
+
+    def _write_disk(self, key: bytes, vector: np.ndarray):
+        """Write into the ring buffer, overwriting the oldest slot when full"""
+        if self.path is None or key in self._slots:
+            return
+        if self._vectors is None:
+            self._open_disk(vector.shape[0], mode="w+")
+        if vector.shape[0] != self._vectors.shape[1]:
+            return
+
+        slot = self._next_slot
+        old_key = bytes(self._keys[slot]).ljust(32, b"\0")
+        self._slots.pop(old_key, None)
+
+        self._vectors[slot] = vector
+        self._keys[slot] = key
+        self._slots[key] = slot
+        self._next_slot = (slot + 1) % self.disk_capacity
+        self._unflushed += 1
+
+    def _flush_disk(self):
+        if self._vectors is None:
+            return
+        self._vectors.flush()
+        self._keys.flush()
+
+        meta = {
+            "model_name": self.model_name,
+            "dim": int(self._vectors.shape[1]),
+            "capacity": self.disk_capacity,
+            "next_slot": self._next_slot
+        }
+        meta_path = self._meta_path()
+        tmp_path = meta_path.with_suffix(".json.tmp")
+        tmp_path.write_text(json.dumps(meta))
+        os.replace(tmp_path, meta_path)
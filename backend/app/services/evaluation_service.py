@@ -1,21 +1,106 @@
 from typing import List, Dict, Optional
 import numpy as np
-from scipy import stats
 from datetime import datetime, timedelta
 from uuid import uuid4
 import asyncio
-from sentence_transformers import SentenceTransformer
+import time
 
+from app.core.config import settings
+from app.services.embedding_cache import EmbeddingCache
+from app.services.inference_worker import InferenceWorker, InferenceQueueFull
+from app.services.lexical import LexicalScorer, load_corpus
+from app.services.metric_registry import (
+    EMBEDDING, MetricContext, MetricEvaluator, MetricRegistry, MetricSpec
+)
+from app.services.micro_batcher import MicroBatcher
+from app.services.cost_ledger import CostLedger
+from app.services.pricing import get_pricing_table
+from app.services.experiment_store import ROLLUP_COLLECTION, create_experiment_store
+from app.services.experiment_rollups import (
+    ROLLUP_FORMAT, ROLLUP_REPLAYING, ExperimentRollup, rollup_increments
+)
+from app.services.response_cache import ResponseCache
+from app.services.traffic_router import assign_variant, variant_weights
+from app.services.experiment_stats import (
+    ExperimentAccumulator, metric_values, metrics_from_means
+)
 from app.schemas.evaluation import (
     EvaluationMetrics, ABTestConfig, ABTestResult, 
-    HumanFeedback, ExperimentCreate
+    HumanFeedback, ExperimentCreate, EvaluationPair, VariantAssignment
 )
 
 class EvaluationService:
-    def __init__(self):
-        # Initialize embedding model for semantic evaluation
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+    def __init__(self, cost_ledger: Optional[CostLedger] = None):
+        # Embedding model for semantic evaluation; loaded lazily on the
+        # inference worker (or by the startup warm-up), never on the event loop
+        self.inference_worker = InferenceWorker(
+            model_name=settings.EMBEDDING_MODEL_NAME,
+            executor=settings.INFERENCE_EXECUTOR,
+            max_workers=settings.INFERENCE_WORKERS,
+            max_queue=settings.INFERENCE_MAX_QUEUE,
+            batch_size=settings.EMBEDDING_BATCH_SIZE
+        )
+        # Coalesce concurrent requests into shared encode calls
+        self.batcher = MicroBatcher(
+            self.inference_worker,
+            window_ms=settings.INFERENCE_BATCH_WINDOW_MS,
+            max_batch_size=settings.INFERENCE_MAX_BATCH_SIZE,
+            max_pending=settings.INFERENCE_MAX_QUEUE
+        )
+        self.embedding_cache = EmbeddingCache(
+            model_name=settings.EMBEDDING_MODEL_NAME,
+            max_bytes=settings.EMBEDDING_CACHE_MAX_MB * 1024 * 1024,
+            path=settings.EMBEDDING_CACHE_PATH or None,
+            disk_capacity=settings.EMBEDDING_CACHE_DISK_ENTRIES,
+            flush_every=settings.EMBEDDING_CACHE_FLUSH_EVERY,
+            flush_interval_s=settings.EMBEDDING_CACHE_FLUSH_INTERVAL_S
+        )
+        self._cache_flush: Optional[asyncio.Task] = None
+        # Lexical relevance; IDF is fitted on first use if a corpus is configured
+        self.lexical_scorer = LexicalScorer()
+        self._corpus_loaded = not settings.RELEVANCE_CORPUS_PATH
         
+        # Metric plugins; register more on metric_registry
+        self.metric_registry = MetricRegistry()
+        self._register_builtin_metrics()
+        self.metric_evaluator = MetricEvaluator(
+            self.metric_registry,
+            embed=self.encode,
+            judge_concurrency=settings.EVAL_LLM_JUDGE_CONCURRENCY,
+            propagate=(InferenceQueueFull,)
+        )
+        
+        # Running per-variant cost totals (optional)
+        self.cost_ledger = cost_ledger
+        
+        # Persistent experiment/feedback store, fronted by in-memory records
+        # and running per-variant statistics for the experiments in use. The
+        # statistics are reloaded from the store's rollups, which every worker
+        # adds its results to, and between reloads include local results
+        self.store = create_experiment_store()
+        self._experiments: Dict[str, Dict] = {}
+        self._accumulators: Dict[str, ExperimentAccumulator] = {}
+        self._stats_loaded_at: Dict[str, float] = {}
+        self._shifts: Dict[str, Dict[str, float]] = {}
+        # Experiments being loaded, so concurrent requests share one load
+        self._loading: Dict[str, asyncio.Future] = {}
+        self.stats_refresh_interval = settings.EXPERIMENT_STATS_REFRESH_MS / 1000
+        # Dashboards are polled; identical requests within the TTL share one response
+        self.response_cache = ResponseCache(ttl_s=settings.EXPERIMENT_DASHBOARD_CACHE_TTL_S)
+    
+    async def warm_up(self):
+        """Load the embedding model in the background"""
+        await asyncio.to_thread(self.inference_worker.warm_up)
+    
+    async def close(self):
+        """Flush pending writes, stop batching and shut down the inference executor"""
+        await self.store.close()
+        await self.batcher.close()
+        if self._cache_flush is not None:
+            await asyncio.gather(self._cache_flush, return_exceptions=True)
+        await asyncio.to_thread(self.embedding_cache.flush)
+        self.inference_worker.shutdown(wait=False)
+    
     async def create_ab_experiment(
         self, 
         experiment_data: ExperimentCreate
@@ -29,89 +114,252 @@ class EvaluationService:
             "description": experiment_data.description,
             "flow_a_id": experiment_data.flow_a_id,
             "flow_b_id": experiment_data.flow_b_id,
+            "variant_flows": {
+                "A": experiment_data.flow_a_id,
+                "B": experiment_data.flow_b_id,
+                **experiment_data.additional_variants
+            },
             "config": experiment_data.config.dict(),
             "status": "running",
-            "created_at": datetime.utcnow(),
-            "results": [],
-            "variant_assignments": {}  # user_id -> variant mapping
+            "stop_reason": None,
+            "rollups": ROLLUP_FORMAT,
+            "created_at": datetime.utcnow()
         }
         
-        # Store in MongoDB (placeholder - implement with actual DB)
-        # await self.mongodb.experiments.insert_one(experiment)
+        await self.store.insert_experiment(experiment)
+        self._experiments[experiment_id] = experiment
+        self._accumulators[experiment_id] = ExperimentAccumulator()
+        self._stats_loaded_at[experiment_id] = time.monotonic()
         return experiment_id
     
+    async def assign_variant(
+        self,
+        experiment_id: str,
+        user_id: str
+    ) -> VariantAssignment:
+        """Assign a user to a variant by hashing; no per-user state is stored"""
+        experiment = await self._get_experiment(experiment_id)
+        config = experiment["config"]
+        weights = variant_weights(config)
+        unknown = set(weights) - set(experiment["variant_flows"])
+        if unknown:
+            raise ValueError(f"Variants without a flow: {sorted(unknown)}")
+        
+        variant = assign_variant(
+            experiment_id, user_id, weights, config["assignment_salt"]
+        )
+        
+        # Assignments are only logged for analysis, never read back
+        await self.store.add("variant_assignments", {
+            "experiment_id": experiment_id,
+            "user_id": user_id,
+            "variant": variant,
+            "salt": config["assignment_salt"],
+            "created_at": datetime.utcnow()
+        })
+        return VariantAssignment(
+            experiment_id=experiment_id,
+            user_id=user_id,
+            variant=variant,
+            flow_id=experiment["variant_flows"][variant]
+        )
+    
+    async def rebucket(self, experiment_id: str, salt: str):
+        """Change the assignment salt, reshuffling users across variants"""
+        experiment = await self._get_experiment(experiment_id)
+        experiment["config"]["assignment_salt"] = salt
+        await self.store.update_experiment(experiment_id, {"config": experiment["config"]})
+    
+    async def record_result(
+        self,
+        experiment_id: str,
+        variant: str,
+        metrics: EvaluationMetrics,
+        response_id: Optional[str] = None
+    ) -> str:
+        """Fold one evaluated response into the experiment's running statistics.
+        
+        Returns the experiment status; once it is "completed" callers should
+        stop generating and evaluating responses for it.
+        """
+        experiment = await self._get_experiment(experiment_id)
+        if experiment["status"] != "running":
+            return experiment["status"]
+        
+        now = datetime.utcnow()
+        await self.store.add("experiment_results", {
+            "experiment_id": experiment_id,
+            "variant": variant,
+            "response_id": response_id,
+            "metrics": metrics.dict(),
+            "created_at": now
+        })
+        values = metric_values(metrics)
+        self._accumulators[experiment_id].add(variant, values)
+        await self.store.put_rollups(rollup_increments(
+            experiment_id, variant, values, now, await self._rollup_shifts(experiment_id, values)
+        ))
+        if self.cost_ledger is not None:
+            self.cost_ledger.add(
+                "experiment",
+                experiment_id,
+                variant,
+                prompt_tokens=metrics.token_usage.get("prompt_tokens", 0),
+                completion_tokens=metrics.token_usage.get("completion_tokens", 0),
+                cost=metrics.cost_usd or 0.0
+            )
+        await self._check_stopping(experiment)
+        return experiment["status"]
+    
     async def evaluate_prompt_quality(
         self, 
         prompt: str, 
         response: str,
         expected_output: Optional[str] = None,
         execution_time_ms: float = 0,
-        token_counts: Dict[str, int] = None
+        token_counts: Dict[str, int] = None,
+        model: Optional[str] = None
     ) -> EvaluationMetrics:
         """Evaluate prompt response quality using multiple metrics"""
-        
-        # Performance metrics
-        if token_counts is None:
-            token_counts = {"prompt_tokens": 0, "completion_tokens": 0}
-        
-        # Calculate semantic metrics
-        coherence = await self._calculate_coherence(prompt, response)
-        relevance = await self._calculate_relevance(prompt, response)
-        
-        # Factual accuracy (if ground truth provided)
-        accuracy = None
-        if expected_output:
-            accuracy = await self._calculate_accuracy(response, expected_output)
-        
-        # Cost estimation (rough approximation)
-        cost_usd = self._estimate_cost(token_counts)
-        
-        return EvaluationMetrics(
-            latency_ms=execution_time_ms,
-            token_usage=token_counts,
-            cost_usd=cost_usd,
-            coherence_score=coherence,
-            relevance_score=relevance,
-            factual_accuracy=accuracy
+        pair = EvaluationPair(
+            prompt=prompt,
+            response=response,
+            expected_output=expected_output,
+            execution_time_ms=execution_time_ms,
+            token_counts=token_counts,
+            model=model
         )
+        results = await self.evaluate_batch([pair])
+        return results[0]
+    
+    async def evaluate_batch(
+        self,
+        pairs: List[EvaluationPair],
+        metrics: Optional[List[str]] = None
+    ) -> List[EvaluationMetrics]:
+        """Evaluate many prompt-response pairs with a single embedding pass.
+        
+        ``metrics`` selects registered metrics by name (default: all); they
+        run concurrently, sharing one embedding call.
+        """
+        if not pairs:
+            return []
+        
+        # An empty expected output means there is nothing to compare against
+        pairs = [
+            pair if pair.expected_output or pair.expected_output is None
+            else pair.copy(update={"expected_output": None})
+            for pair in pairs
+        ]
+        specs = self.metric_registry.specs(metrics)
+        scores = await self.metric_evaluator.evaluate(pairs, [spec.name for spec in specs])
+        
+        results = []
+        for i, pair in enumerate(pairs):
+            # Performance metrics
+            token_counts = pair.token_counts
+            if token_counts is None:
+                token_counts = {"prompt_tokens": 0, "completion_tokens": 0}
+            
+            fields: Dict[str, Optional[float]] = {}
+            custom_metrics: Dict[str, float] = {}
+            for spec in specs:
+                value = scores[spec.name][i]
+                if spec.attribute:
+                    fields[spec.attribute] = value
+                elif value is not None:
+                    custom_metrics[spec.name] = value
+            
+            results.append(EvaluationMetrics(
+                latency_ms=pair.execution_time_ms,
+                token_usage=token_counts,
+                custom_metrics=custom_metrics,
+                **fields
+            ))
+        return results
     
     async def compare_variants(
         self, 
         experiment_id: str
     ) -> ABTestResult:
         """Statistical comparison of A/B test variants"""
+        experiment = await self._get_experiment(experiment_id)
+        accumulator = await self._refresh_statistics(experiment_id)
         
-        # Get experiment results (placeholder - implement with actual DB)
-        # results = await self.mongodb.experiments.find_one({"experiment_id": experiment_id})
-        
-        # Mock data for demonstration
-        variant_a_scores = [0.8, 0.75, 0.9, 0.85, 0.78] * 20  # Mock scores
-        variant_b_scores = [0.85, 0.88, 0.92, 0.87, 0.84] * 20  # Mock scores
+        # Significance, confidence interval and winner on the success metric,
+        # all computed from running sufficient statistics
+        await self._check_stopping(experiment)
+        config = experiment["config"]
+        success_metric = config["success_metric"]
+        comparison = accumulator.compare(success_metric)
         
-        # Statistical significance testing
-        significance = self._calculate_statistical_significance(
-            variant_a_scores, variant_b_scores
-        )
-        
-        # Calculate aggregate metrics
-        variant_a_metrics = self._create_mock_metrics(np.mean(variant_a_scores))
-        variant_b_metrics = self._create_mock_metrics(np.mean(variant_b_scores))
+        # Sequential experiments report the always-valid p-value, which stays
+        # valid no matter how often the dashboard is checked
+        significance = comparison["p_value"]
+        if config["testing_mode"] == "sequential":
+            significance = accumulator.sequential_p.get(success_metric, 1.0)
         
-        # Determine winner and improvement
-        winner, improvement = self._determine_winner_and_improvement(
-            variant_a_scores, variant_b_scores
-        )
+        winner, improvement = comparison["winner"], comparison["improvement"]
+        if experiment["status"] == "completed" and significance > config["alpha"]:
+            # Stopped without a significant difference
+            winner = "tie"
         
         return ABTestResult(
             experiment_id=experiment_id,
-            variant_a_metrics=variant_a_metrics,
-            variant_b_metrics=variant_b_metrics,
-            sample_size=len(variant_a_scores) + len(variant_b_scores),
+            variant_a_metrics=metrics_from_means(accumulator.means("A")),
+            variant_b_metrics=metrics_from_means(accumulator.means("B")),
+            sample_size=accumulator.sample_size,
             statistical_significance=significance,
             winner=winner,
-            improvement_percentage=improvement
+            improvement_percentage=improvement,
+            success_metric=success_metric,
+            confidence_interval=comparison["confidence_interval"],
+            status=experiment["status"],
+            stop_reason=experiment["stop_reason"]
+        )
+    
+    async def get_results(self, experiment_id: str) -> ABTestResult:
+        """``compare_variants``, shared by identical requests within the cache TTL"""
+        return await self.response_cache.get_or_compute(
+            ("results", experiment_id), lambda: self.compare_variants(experiment_id)
+        )
+    
+    async def get_dashboard(self, experiment_id: str) -> Dict:
+        """Monitoring summary of an experiment, read from its running statistics"""
+        return await self.response_cache.get_or_compute(
+            ("dashboard", experiment_id), lambda: self._build_dashboard(experiment_id)
+        )
+    
+    async def metric_series(
+        self,
+        experiment_id: str,
+        metric: str,
+        granularity: str = "hour",
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> Dict:
+        """Per-variant time series of a metric from the experiment's rollups"""
+        async def build():
+            await self._get_experiment(experiment_id)
+            rollup = ExperimentRollup(experiment_id)
+            since = rollup.since(granularity, start)
+            rollup.load(await self.store.get_rollups(experiment_id, since))
+            return {
+                "experiment_id": experiment_id,
+                "metric": metric,
+                "granularity": granularity,
+                "variants": rollup.series(metric, granularity, start, end)
+            }
+        
+        return await self.response_cache.get_or_compute(
+            ("series", experiment_id, metric, granularity, start, end), build
         )
     
+    async def compare_metric(self, experiment_id: str, metric: str) -> Dict:
+        """Compare a single metric between variants"""
+        await self._get_experiment(experiment_id)
+        return (await self._refresh_statistics(experiment_id)).compare(metric)
+    
     async def record_human_feedback(
         self,
         experiment_id: str,
@@ -125,109 +373,305 @@ class EvaluationService:
             "feedback": feedback.dict(),
             "timestamp": datetime.utcnow()
         }
+        await self.store.add("human_feedback", feedback_record)
+    
+    async def fit_relevance_corpus(self, documents: List[str]):
+        """Fit IDF/BM25 relevance weighting on reference documents"""
+        await asyncio.to_thread(self.lexical_scorer.fit, documents)
+        self._corpus_loaded = True
+    
+    async def encode(self, texts: List[str]) -> np.ndarray:
+        """Embed texts, returning L2-normalised float32 rows.
+        
+        Shared by evaluation and the flow engine's semantic cache: cached
+        vectors are reused and misses are micro-batched onto the worker.
+        """
+        vectors = self.embedding_cache.get_many(texts)
+        missing = [text for text, vector in zip(texts, vectors) if vector is None]
         
-        # Store in MongoDB (placeholder)
-        # await self.mongodb.human_feedback.insert_one(feedback_record)
-        pass
+        if missing:
+            # Only cache misses go through the transformer
+            fresh = await self.batcher.encode(missing)
+            self.embedding_cache.put_many(missing, fresh)
+            if self.embedding_cache.flush_due() and (
+                self._cache_flush is None or self._cache_flush.done()
+            ):
+                # Sync the disk tier in the background, off the request path
+                self._cache_flush = asyncio.ensure_future(self._flush_embedding_cache())
+            computed = dict(zip(missing, fresh))
+            vectors = [
+                computed[text] if vector is None else vector
+                for text, vector in zip(texts, vectors)
+            ]
+        
+        return np.vstack(vectors).astype(np.float32, copy=False)
     
     # Private helper methods
-    async def _calculate_coherence(self, prompt: str, response: str) -> float:
-        """Calculate semantic coherence between prompt and response"""
+    async def _flush_embedding_cache(self):
         try:
-            prompt_embedding = self.embedding_model.encode([prompt])
-            response_embedding = self.embedding_model.encode([response])
-            
-            # Cosine similarity
-            similarity = np.dot(prompt_embedding[0], response_embedding[0]) / (
-                np.linalg.norm(prompt_embedding[0]) * np.linalg.norm(response_embedding[0])
+            await asyncio.to_thread(self.embedding_cache.flush)
+        except Exception as e:
+            print(f"Warning: embedding cache flush failed: {e}")
+    
+    def _register_builtin_metrics(self):
+        self.metric_registry.register(MetricSpec(
+            name="coherence",
+            compute=self._coherence,
+            cost_class=EMBEDDING,
+            attribute="coherence_score",
+            default=0.5,
+            description="Embedding similarity of response and prompt"
+        ))
+        self.metric_registry.register(MetricSpec(
+            name="relevance",
+            compute=self._calculate_relevance,
+            attribute="relevance_score",
+            description="Lexical coverage of the prompt's terms by the response"
+        ))
+        self.metric_registry.register(MetricSpec(
+            name="factual_accuracy",
+            compute=self._factual_accuracy,
+            inputs=("response", "expected_output"),
+            cost_class=EMBEDDING,
+            attribute="factual_accuracy",
+            default=0.5,
+            description="Embedding similarity of response and expected output"
+        ))
+        self.metric_registry.register(MetricSpec(
+            name="cost",
+            compute=self._estimate_costs,
+            inputs=(),
+            attribute="cost_usd",
+            description="Estimated USD cost from token usage"
+        ))
+    
+    async def _get_experiment(self, experiment_id: str) -> Dict:
+        """Return the experiment record, rebuilding its statistics from storage"""
+        experiment = self._experiments.get(experiment_id)
+        if experiment is not None:
+            return experiment
+        
+        loading = self._loading.get(experiment_id)
+        if loading is None:
+            loading = self._loading[experiment_id] = asyncio.ensure_future(
+                self._load_experiment(experiment_id)
             )
-            
-            # Convert to 0-1 scale
-            return float((similarity + 1) / 2)
-        except Exception:
-            return 0.5  # Default fallback
+            loading.add_done_callback(lambda _: self._loading.pop(experiment_id, None))
+        return await asyncio.shield(loading)
     
-    async def _calculate_relevance(self, prompt: str, response: str) -> float:
-        """Calculate topic relevance score"""
-        # Simplified relevance calculation based on keyword overlap
-        prompt_words = set(prompt.lower().split())
-        response_words = set(response.lower().split())
+    async def _load_experiment(self, experiment_id: str) -> Dict:
+        experiment = await self.store.get_experiment(experiment_id)
+        if experiment is None:
+            raise KeyError(experiment_id)
         
-        if not prompt_words:
-            return 0.0
+        config = experiment["config"]
+        if experiment.get("rollups") != ROLLUP_FORMAT:
+            experiment = await self._replay_rollups(experiment)
         
-        overlap = len(prompt_words.intersection(response_words))
-        relevance = overlap / len(prompt_words)
+        # Totals are merged from the day buckets, so loading doesn't depend
+        # on how many results the experiment has
+        accumulator = await self._refresh_statistics(experiment_id)
+        if config["testing_mode"] == "sequential":
+            # Restarts from the current data; only ever more conservative
+            # than the running minimum it replaces
+            accumulator.update_sequential(config["success_metric"], config["mixture_variance"])
+        self._experiments[experiment_id] = experiment
+        return experiment
+    
+    async def _replay_rollups(self, experiment: Dict) -> Dict:
+        """Rebuild the rollups of an experiment saved before the current format.
+        
+        Rollup writes are increments, so exactly one loader in any process
+        may replay: it claims the experiment first, and the others wait for
+        it to finish. (If the replaying process dies, the experiment stays
+        claimed rather than being counted twice.)
+        """
+        experiment_id = experiment["experiment_id"]
+        claimed = await self.store.update_experiment_if(
+            experiment_id, "rollups", ROLLUP_REPLAYING, current=(None, True)
+        )
+        if not claimed:
+            while experiment.get("rollups") == ROLLUP_REPLAYING:
+                await asyncio.sleep(self.store.flush_interval)
+                experiment = await self.store.get_experiment(experiment_id)
+            return experiment
         
-        return min(relevance, 1.0)
+        async for result in self.store.iter_results(experiment_id):
+            values = metric_values(EvaluationMetrics(**result["metrics"]))
+            await self.store.put_rollups(rollup_increments(
+                experiment_id,
+                result["variant"],
+                values,
+                result.get("created_at") or datetime.utcnow(),
+                await self._rollup_shifts(experiment_id, values)
+            ))
+        await self.store.flush(ROLLUP_COLLECTION)
+        experiment["rollups"] = ROLLUP_FORMAT
+        await self.store.update_experiment(experiment_id, {"rollups": ROLLUP_FORMAT})
+        return experiment
     
-    async def _calculate_accuracy(self, response: str, expected: str) -> float:
-        """Calculate factual accuracy against expected output"""
-        try:
-            response_embedding = self.embedding_model.encode([response])
-            expected_embedding = self.embedding_model.encode([expected])
-            
-            similarity = np.dot(response_embedding[0], expected_embedding[0]) / (
-                np.linalg.norm(response_embedding[0]) * np.linalg.norm(expected_embedding[0])
-            )
-            
-            return float((similarity + 1) / 2)
-        except Exception:
-            return 0.5
+    async def _rollup_shifts(
+        self,
+        experiment_id: str,
+        values: Dict[str, float]
+    ) -> Dict[str, float]:
+        """The experiment's per-metric rollup shifts, claiming ``values`` for new metrics"""
+        shifts = self._shifts.setdefault(experiment_id, {})
+        missing = {name: value for name, value in values.items() if name not in shifts}
+        if missing:
+            shifts.update(await self.store.rollup_shifts(experiment_id, missing))
+        return shifts
     
-    def _estimate_cost(self, token_counts: Dict[str, int]) -> float:
-        """Estimate cost based on token usage (GPT-4 pricing)"""
-        prompt_tokens = token_counts.get("prompt_tokens", 0)
-        completion_tokens = token_counts.get("completion_tokens", 0)
+    async def _refresh_statistics(
+        self,
+        experiment_id: str,
+        max_age: float = 0.0
+    ) -> ExperimentAccumulator:
+        """Reload an experiment's totals from the store unless loaded within ``max_age`` seconds.
         
-        # GPT-4 pricing (approximate)
-        prompt_cost = prompt_tokens * 0.00003  # $0.03 per 1K tokens
-        completion_cost = completion_tokens * 0.00006  # $0.06 per 1K tokens
+        The stored rollups hold every worker's results, so the reloaded
+        totals include results recorded by other processes.
+        """
+        loaded_at = self._stats_loaded_at.get(experiment_id)
+        if loaded_at is not None and time.monotonic() - loaded_at < max_age:
+            return self._accumulators[experiment_id]
+        # Before awaiting, so concurrent callers don't all reload
+        self._stats_loaded_at[experiment_id] = time.monotonic()
         
-        return prompt_cost + completion_cost
+        rollup = ExperimentRollup(experiment_id)
+        rollup.load(await self.store.get_rollups(experiment_id, {"day": None}))
+        accumulator = rollup.accumulator()
+        previous = self._accumulators.get(experiment_id)
+        if previous is not None:
+            # Always-valid p-values only ever decrease
+            accumulator.sequential_p = previous.sequential_p
+        self._accumulators[experiment_id] = accumulator
+        return accumulator
     
-    def _calculate_statistical_significance(
-        self, 
-        variant_a: List[float], 
-        variant_b: List[float]
-    ) -> float:
-        """Calculate p-value for statistical significance"""
-        try:
-            # Perform t-test
-            t_stat, p_value = stats.ttest_ind(variant_a, variant_b)
-            return float(p_value)
-        except Exception:
-            return 1.0  # No significance if calculation fails
+    async def _build_dashboard(self, experiment_id: str) -> Dict:
+        results = await self.compare_variants(experiment_id)
+        accumulator = self._accumulators[experiment_id]
+        
+        metrics_comparison = []
+        for metric_name, metric in (
+            ("Coherence Score", "coherence_score"),
+            ("User Satisfaction", "user_satisfaction"),
+            ("Latency (ms)", "latency_ms")
+        ):
+            comparison = accumulator.compare(metric)
+            metrics_comparison.append({
+                "metric_name": metric_name,
+                "variant_a": comparison["variant_a"],
+                "variant_b": comparison["variant_b"],
+                "improvement": comparison["improvement"],
+                "significance": comparison["p_value"],
+                "confidence_interval": comparison["confidence_interval"]
+            })
+        
+        return {
+            "experiment_id": experiment_id,
+            "status": results.status,
+            "stop_reason": results.stop_reason,
+            "sample_size": results.sample_size,
+            "samples_by_variant": dict(accumulator.samples),
+            "winner": results.winner,
+            "metrics_comparison": metrics_comparison,
+            "generated_at": datetime.utcnow()
+        }
     
-    def _determine_winner_and_improvement(
-        self, 
-        variant_a: List[float], 
-        variant_b: List[float]
-    ) -> tuple[Optional[str], Optional[float]]:
-        """Determine winning variant and improvement percentage"""
-        try:
-            mean_a = np.mean(variant_a)
-            mean_b = np.mean(variant_b)
-            
-            if abs(mean_a - mean_b) < 0.01:  # Threshold for tie
-                return "tie", 0.0
-            
-            if mean_b > mean_a:
-                improvement = ((mean_b - mean_a) / mean_a) * 100
-                return "B", improvement
-            else:
-                improvement = ((mean_a - mean_b) / mean_b) * 100
-                return "A", improvement
-        except Exception:
-            return None, None
-    
-    def _create_mock_metrics(self, score: float) -> EvaluationMetrics:
-        """Create mock metrics for demonstration"""
-        return EvaluationMetrics(
-            latency_ms=150.0 + np.random.normal(0, 20),
-            token_usage={"prompt_tokens": 50, "completion_tokens": 100},
-            cost_usd=0.01,
-            coherence_score=score,
-            relevance_score=score + np.random.normal(0, 0.05),
-            user_satisfaction=score * 5  # Convert to 1-5 scale
+    async def _check_stopping(self, experiment: Dict):
+        """Complete the experiment once a winner is decided or it runs out of time"""
+        if experiment["status"] != "running":
+            return
+        
+        config = experiment["config"]
+        metric = config["success_metric"]
+        # Decided on every worker's results, reloaded at most once per interval
+        accumulator = await self._refresh_statistics(
+            experiment["experiment_id"], self.stats_refresh_interval
+        )
+        a = accumulator.stats("A", metric)
+        b = accumulator.stats("B", metric)
+        enough_samples = min(a.count, b.count) >= config["minimum_sample_size"]
+        
+        stop_reason = None
+        if config["testing_mode"] == "sequential":
+            p_value = accumulator.update_sequential(metric, config["mixture_variance"])
+            if enough_samples and p_value <= config["alpha"]:
+                stop_reason = "significant"
+        elif enough_samples:
+            # Fixed horizon: a single test once the planned sample size is reached
+            stop_reason = "horizon_reached"
+        
+        max_duration = timedelta(days=config["max_duration_days"])
+        if stop_reason is None and datetime.utcnow() - experiment["created_at"] >= max_duration:
+            stop_reason = "max_duration"
+        
+        if stop_reason is not None:
+            update = {
+                "status": "completed",
+                "stop_reason": stop_reason,
+                "completed_at": datetime.utcnow()
+            }
+            experiment.update(update)
+            await self.store.update_experiment(experiment["experiment_id"], update)
+    
+    async def _coherence(self, pairs: List[EvaluationPair], context: MetricContext) -> List[float]:
+        """Semantic similarity of each response to its prompt"""
+        prompts = await context.embeddings([p.prompt for p in pairs])
+        responses = await context.embeddings([p.response for p in pairs])
+        return self._rowwise_similarity(prompts, responses)
+    
+    async def _factual_accuracy(
+        self,
+        pairs: List[EvaluationPair],
+        context: MetricContext
+    ) -> List[float]:
+        """Semantic similarity of each response to its expected output"""
+        responses = await context.embeddings([p.response for p in pairs])
+        expected = await context.embeddings([p.expected_output for p in pairs])
+        return self._rowwise_similarity(responses, expected)
+    
+    def _rowwise_similarity(self, a: np.ndarray, b: np.ndarray) -> List[float]:
+        """Cosine similarity of matching rows, converted to a 0-1 scale"""
+        # Rows are unit length, so the row-wise dot product is the cosine
+        similarity = np.einsum("ij,ij->i", a, b)
+        return ((similarity + 1) / 2).astype(float).tolist()
+    
+    async def _calculate_relevance(
+        self,
+        pairs: List[EvaluationPair],
+        context: Optional[MetricContext] = None
+    ) -> List[float]:
+        """Calculate topic relevance scores (prompt term coverage) for a batch"""
+        if not self._corpus_loaded:
+            try:
+                documents = await asyncio.to_thread(load_corpus, settings.RELEVANCE_CORPUS_PATH)
+                await self.fit_relevance_corpus(documents)
+            except OSError as e:
+                print(f"Warning: could not load relevance corpus: {e}")
+                self._corpus_loaded = True
+        
+        prompts = [pair.prompt for pair in pairs]
+        responses = [pair.response for pair in pairs]
+        if len(pairs) > 256:
+            # Large batches tokenize off the event loop
+            scores = await asyncio.to_thread(
+                self.lexical_scorer.score, prompts, responses, settings.RELEVANCE_WEIGHTING
+            )
+        else:
+            scores = self.lexical_scorer.score(prompts, responses, settings.RELEVANCE_WEIGHTING)
+        return scores.astype(float).tolist()
+    
+    def _estimate_costs(
+        self,
+        pairs: List[EvaluationPair],
+        context: Optional[MetricContext] = None
+    ) -> np.ndarray:
+        """Estimate costs from token usage with the configured pricing table"""
+        counts = [pair.token_counts or {} for pair in pairs]
+        return get_pricing_table().costs(
+            [pair.model for pair in pairs],
+            [c.get("prompt_tokens", 0) for c in counts],
+            [c.get("completion_tokens", 0) for c in counts]
         )
@@ -0,0 +1,223 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+from app.services.experiment_stats import ExperimentAccumulator, RunningStats
+
+GRANULARITIES = ("minute", "hour", "day")
+
+# Stored bucket format; experiments saved with an older one are replayed
+# from their results when first loaded
+ROLLUP_FORMAT = 2
+# Marks an experiment whose rollups one loader is rebuilding from its results
+ROLLUP_REPLAYING = "replaying"
+
+# How far back a series reaches when no start is given
+DEFAULT_RETENTION: Dict[str, Optional[timedelta]] = {
+    "minute": timedelta(days=2),
+    "hour": timedelta(days=90),
+    "day": None
+}
+
+
+def bucket_start(when: datetime, granularity: str) -> datetime:
+    """Start of the ``granularity`` bucket containing ``when``"""
+    if granularity == "minute":
+        return when.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return when.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return when.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unknown granularity: {granularity}")
+
+
+def _sums(stats: RunningStats, shift: float) -> Dict:
+    # Sums of (value - shift): with the shift close to the values, squaring
+    # them keeps the variance's significant digits (raw sums of squares of
+    # values like 1e6 +- 0.01 cancel it away)
+    offset = stats.mean - shift
+    return {
+        "count": stats.count,
+        "shift": shift,
+        "sum": stats.count * offset,
+        "sum_sq": stats.m2 + stats.count * offset * offset
+    }
+
+
+def _from_sums(sums: Dict) -> RunningStats:
+    count = sums.get("count", 0)
+    if not count:
+        return RunningStats()
+    offset = sums["sum"] / count
+    m2 = sums["sum_sq"] - sums["sum"] * offset
+    return RunningStats(count, sums.get("shift", 0.0) + offset, max(m2, 0.0))
+
+
+@dataclass
+class RollupBucket:
+    """Running statistics of one variant's results within one time bucket"""
+    experiment_id: str
+    granularity: str
+    start: datetime
+    variant: str
+    samples: int = 0
+    metrics: Dict[str, RunningStats] = field(default_factory=dict)
+    # Per-metric shift of the stored sums, shared by all of the experiment's buckets
+    shifts: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def key(self) -> Tuple[str, str, datetime, str]:
+        return self.experiment_id, self.granularity, self.start, self.variant
+
+    def add(self, values: Dict[str, float]):
+        self.samples += 1
+        for name, value in values.items():
+            self.metrics.setdefault(name, RunningStats()).add(value)
+
+    def merge(self, other: "RollupBucket"):
+        for name, shift in other.shifts.items():
+            self.shifts.setdefault(name, shift)
+        self.samples += other.samples
+        for name, stats in other.metrics.items():
+            self.metrics.setdefault(name, RunningStats()).merge(stats)
+
+    def to_document(self) -> Dict:
+        """Stored form; counts and shifted sums, so writers add to it rather than replace it"""
+        return {
+            "experiment_id": self.experiment_id,
+            "granularity": self.granularity,
+            "bucket": self.start,
+            "variant": self.variant,
+            "samples": self.samples,
+            "metrics": {
+                name: _sums(stats, self.shifts.get(name, 0.0))
+                for name, stats in self.metrics.items()
+            }
+        }
+
+    @classmethod
+    def from_document(cls, document: Dict) -> "RollupBucket":
+        return cls(
+            experiment_id=document["experiment_id"],
+            granularity=document["granularity"],
+            start=document["bucket"],
+            variant=document["variant"],
+            samples=document["samples"],
+            metrics={name: _from_sums(sums) for name, sums in document["metrics"].items()},
+            shifts={
+                name: sums.get("shift", 0.0) for name, sums in document["metrics"].items()
+            }
+        )
+
+
+def rollup_increments(
+    experiment_id: str,
+    variant: str,
+    values: Dict[str, float],
+    at: datetime,
+    shifts: Dict[str, float]
+) -> List[RollupBucket]:
+    """One result as increments to its minute, hour and day buckets.
+
+    ``shifts`` are the experiment's stored per-metric shifts (see
+    ``ExperimentStore.rollup_shifts``) and must cover every metric in ``values``.
+    """
+    increments = []
+    for granularity in GRANULARITIES:
+        bucket = RollupBucket(
+            experiment_id, granularity, bucket_start(at, granularity), variant,
+            shifts={name: shifts[name] for name in values}
+        )
+        bucket.add(values)
+        increments.append(bucket)
+    return increments
+
+
+def _naive_utc(when: Optional[datetime]) -> Optional[datetime]:
+    # Buckets are naive UTC, like the results' created_at
+    if when is None or when.tzinfo is None:
+        return when
+    return when.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class ExperimentRollup:
+    """Per-variant, per-metric statistics of one experiment in time buckets.
+
+    Every worker adds its results to the stored buckets as increments, so
+    buckets loaded back from the experiment store cover all of them. Reads
+    cost the number of buckets in the requested range, not the number of
+    results.
+    """
+
+    def __init__(
+        self,
+        experiment_id: str,
+        retention: Optional[Dict[str, Optional[timedelta]]] = None
+    ):
+        self.experiment_id = experiment_id
+        self.retention = DEFAULT_RETENTION if retention is None else retention
+        self.buckets: Dict[str, Dict[Tuple[datetime, str], RollupBucket]] = {
+            granularity: {} for granularity in GRANULARITIES
+        }
+
+    def load(self, documents: Iterable[Dict]):
+        """Add buckets read back from the experiment store"""
+        for document in documents:
+            bucket = RollupBucket.from_document(document)
+            self.buckets[bucket.granularity][(bucket.start, bucket.variant)] = bucket
+
+    def accumulator(self) -> ExperimentAccumulator:
+        """Overall per-variant statistics, merged from the day buckets"""
+        accumulator = ExperimentAccumulator()
+        for bucket in self.buckets["day"].values():
+            accumulator.samples[bucket.variant] = (
+                accumulator.samples.get(bucket.variant, 0) + bucket.samples
+            )
+            variant_metrics = accumulator.metrics.setdefault(bucket.variant, {})
+            for name, stats in bucket.metrics.items():
+                variant_metrics.setdefault(name, RunningStats()).merge(stats)
+        return accumulator
+
+    def series(
+        self,
+        metric: str,
+        granularity: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> Dict[str, List[Dict]]:
+        """Per-variant points of a metric, oldest first, for buckets in [start, end)"""
+        if granularity not in self.buckets:
+            raise ValueError(f"Unknown granularity: {granularity}")
+        start, end = _naive_utc(start), _naive_utc(end)
+        points: Dict[str, List[Dict]] = {}
+        for (bucket_at, variant), bucket in sorted(self.buckets[granularity].items()):
+            if start is not None and bucket_at < bucket_start(start, granularity):
+                continue
+            if end is not None and bucket_at >= end:
+                continue
+            stats = bucket.metrics.get(metric)
+            if stats is None or stats.count == 0:
+                continue
+            points.setdefault(variant, []).append({
+                "bucket": bucket_at,
+                "count": stats.count,
+                "mean": stats.mean,
+                "std": stats.std
+            })
+        return points
+
+    def since(
+        self,
+        granularity: str,
+        start: Optional[datetime] = None
+    ) -> Dict[str, Optional[datetime]]:
+        """Oldest bucket start to load for a series: ``start``, or the retention"""
+        if granularity not in self.buckets:
+            raise ValueError(f"Unknown granularity: {granularity}")
+        start = _naive_utc(start)
+        if start is None:
+            keep = self.retention.get(granularity)
+            if keep is None:
+                return {granularity: None}
+            start = datetime.utcnow() - keep
+        return {granularity: bucket_start(start, granularity)}
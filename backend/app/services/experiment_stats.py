@@ -0,0 +1,246 @@
+from typing import Dict, Optional, Tuple
+from dataclasses import dataclass, asdict
+import math
+
+from app.schemas.evaluation import EvaluationMetrics
+
+# Metrics where a smaller value is the better outcome
+LOWER_IS_BETTER = {"latency_ms", "cost_usd"}
+
+
+@dataclass
+class RunningStats:
+    """Running mean/variance using Welford's online algorithm"""
+    count: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+
+    def add(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def merge(self, other: "RunningStats"):
+        """Combine with another accumulator (Chan et al. parallel update)"""
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+
+    @property
+    def variance(self) -> float:
+        """Sample variance (n - 1 denominator)"""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "RunningStats":
+        return cls(**data)
+
+
+def metric_values(metrics: EvaluationMetrics) -> Dict[str, float]:
+    """Flatten the numeric fields of an evaluation into metric name -> value"""
+    values = {}
+    for name in (
+        "latency_ms", "cost_usd", "coherence_score", "relevance_score",
+        "factual_accuracy", "user_satisfaction", "task_completion_rate",
+        "conversion_rate"
+    ):
+        value = getattr(metrics, name)
+        if value is not None:
+            values[name] = float(value)
+    for name, value in metrics.token_usage.items():
+        values[f"token_usage.{name}"] = float(value)
+    for name, value in metrics.custom_metrics.items():
+        values[f"custom.{name}"] = float(value)
+    return values
+
+
+def metrics_from_means(means: Dict[str, float]) -> EvaluationMetrics:
+    """Build an aggregate EvaluationMetrics from per-metric means"""
+    return EvaluationMetrics(
+        latency_ms=means.get("latency_ms", 0.0),
+        token_usage={
+            name.split(".", 1)[1]: int(round(value))
+            for name, value in means.items() if name.startswith("token_usage.")
+        },
+        cost_usd=means.get("cost_usd"),
+        coherence_score=means.get("coherence_score"),
+        relevance_score=means.get("relevance_score"),
+        factual_accuracy=means.get("factual_accuracy"),
+        user_satisfaction=means.get("user_satisfaction"),
+        task_completion_rate=means.get("task_completion_rate"),
+        conversion_rate=means.get("conversion_rate"),
+        custom_metrics={
+            name.split(".", 1)[1]: value
+            for name, value in means.items() if name.startswith("custom.")
+        }
+    )
+
+
+def welch_test(
+    a: RunningStats,
+    b: RunningStats,
+    confidence: float = 0.95
+) -> Tuple[float, Optional[Tuple[float, float]]]:
+    """Welch's t-test on sufficient statistics.
+
+    Returns the two-sided p-value and the confidence interval for the
+    difference in means (B - A). Needs at least two samples per variant.
+    """
+    if a.count < 2 or b.count < 2:
+        return 1.0, None
+
+    from scipy import stats
+
+    diff = b.mean - a.mean
+    var_a = a.variance / a.count
+    var_b = b.variance / b.count
+    se = math.sqrt(var_a + var_b)
+    if se == 0:
+        return (1.0 if diff == 0 else 0.0), (diff, diff)
+
+    # Welch-Satterthwaite degrees of freedom
+    df = (var_a + var_b) ** 2 / (
+        var_a ** 2 / (a.count - 1) + var_b ** 2 / (b.count - 1)
+    )
+    p_value = 2 * stats.t.sf(abs(diff) / se, df)
+    margin = stats.t.ppf(0.5 + confidence / 2, df) * se
+    return float(p_value), (diff - margin, diff + margin)
+
+
+def msprt_p_value(
+    a: RunningStats,
+    b: RunningStats,
+    mixture_variance: float,
+    previous_p: float = 1.0
+) -> float:
+    """Always-valid p-value from a mixture sequential probability ratio test.
+
+    Uses the normal-mixture mSPRT for a difference in means (Johari et al.)
+    with mixing variance ``mixture_variance`` expressed in units of the pooled
+    metric variance. Unlike a fixed-horizon t-test, the result may be checked
+    after every sample without inflating the false positive rate.
+    """
+    if a.count < 2 or b.count < 2:
+        return previous_p
+
+    var_a = a.variance / a.count
+    var_b = b.variance / b.count
+    v = var_a + var_b
+    if v == 0:
+        return previous_p
+
+    pooled = (a.m2 + b.m2) / (a.count + b.count - 2)
+    tau2 = mixture_variance * pooled
+    if tau2 <= 0:
+        return previous_p
+
+    diff = b.mean - a.mean
+    log_lr = 0.5 * math.log(v / (v + tau2)) + (
+        tau2 * diff * diff / (2 * v * (v + tau2))
+    )
+    # p_n = min(p_{n-1}, 1 / Lambda_n)
+    return min(previous_p, math.exp(-log_lr) if log_lr < 700 else 0.0)
+
+
+class ExperimentAccumulator:
+    """Per-variant, per-metric running statistics for one experiment.
+
+    Results are folded in as they arrive, so comparisons cost O(1) time and
+    memory regardless of how many samples the experiment has collected.
+    """
+
+    def __init__(self):
+        self.samples: Dict[str, int] = {}
+        self.metrics: Dict[str, Dict[str, RunningStats]] = {}
+        # Always-valid p-values per metric (monotonically non-increasing)
+        self.sequential_p: Dict[str, float] = {}
+
+    def add(self, variant: str, values: Dict[str, float]):
+        self.samples[variant] = self.samples.get(variant, 0) + 1
+        variant_metrics = self.metrics.setdefault(variant, {})
+        for name, value in values.items():
+            variant_metrics.setdefault(name, RunningStats()).add(value)
+
+    def stats(self, variant: str, metric: str) -> RunningStats:
+        return self.metrics.get(variant, {}).get(metric, RunningStats())
+
+    def means(self, variant: str) -> Dict[str, float]:
+        return {
+            name: running.mean
+            for name, running in self.metrics.get(variant, {}).items()
+        }
+
+    @property
+    def sample_size(self) -> int:
+        return sum(self.samples.values())
+
+    def update_sequential(
+        self,
+        metric: str,
+        mixture_variance: float,
+        variant_a: str = "A",
+        variant_b: str = "B"
+    ) -> float:
+        """Advance the always-valid p-value for a metric after new data"""
+        p_value = msprt_p_value(
+            self.stats(variant_a, metric),
+            self.stats(variant_b, metric),
+            mixture_variance,
+            self.sequential_p.get(metric, 1.0)
+        )
+        self.sequential_p[metric] = p_value
+        return p_value
+
+    def compare(self, metric: str, variant_a: str = "A", variant_b: str = "B") -> Dict:
+        """Compare one metric between two variants from running statistics"""
+        a = self.stats(variant_a, metric)
+        b = self.stats(variant_b, metric)
+        p_value, interval = welch_test(a, b)
+        winner, improvement = determine_winner(metric, a, b)
+        return {
+            "metric": metric,
+            "variant_a": a.mean if a.count else None,
+            "variant_b": b.mean if b.count else None,
+            "samples_a": a.count,
+            "samples_b": b.count,
+            "p_value": p_value,
+            "confidence_interval": list(interval) if interval else None,
+            "winner": winner,
+            "improvement": improvement
+        }
+
+
+def determine_winner(
+    metric: str,
+    a: RunningStats,
+    b: RunningStats
+) -> Tuple[Optional[str], Optional[float]]:
+    """Determine winning variant and improvement percentage"""
+    if a.count == 0 or b.count == 0:
+        return None, None
+
+    mean_a, mean_b = a.mean, b.mean
+    if abs(mean_a - mean_b) < 0.01:  # Threshold for tie
+        return "tie", 0.0
+
+    b_better = mean_b < mean_a if metric in LOWER_IS_BETTER else mean_b > mean_a
+    winner, loser = (mean_b, mean_a) if b_better else (mean_a, mean_b)
+    if loser == 0:
+        return ("B" if b_better else "A"), None
+    improvement = abs(winner - loser) / abs(loser) * 100
+    return ("B" if b_better else "A"), improvement
@@ -0,0 +1,578 @@
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence
+from datetime import datetime
+import asyncio
+import json
+import sqlite3
+import threading
+
+from app.core.config import settings
+
+# Collections written through the buffered bulk-insert path
+BUFFERED_COLLECTIONS = ("experiment_results", "human_feedback", "variant_assignments")
+
+# Time-bucketed counts and sums, incremented by (experiment, granularity, bucket, variant)
+ROLLUP_COLLECTION = "experiment_rollup_sums"
+
+# Per-experiment, per-metric reference values subtracted before rollup sums are taken
+SHIFT_COLLECTION = "experiment_rollup_shifts"
+
+
+class RollupWriteError(Exception):
+    """Some rollup increments were not applied; ``failed`` holds their positions"""
+
+    def __init__(self, message: str, failed: List[int]):
+        super().__init__(message)
+        self.failed = failed
+
+
+class ExperimentStore:
+    """Storage for experiments, assignments, per-sample results and feedback.
+
+    Experiment records are written immediately (they are rare). High-volume
+    documents are buffered per collection and written with ``insert_many``
+    once ``batch_size`` documents are pending or every ``flush_interval_ms``,
+    whichever comes first, so ingestion never costs one round trip per write.
+    Rollup increments are combined per bucket and added to the stored
+    bucket, never written over it, so every worker's results add up.
+    """
+
+    def __init__(self, batch_size: int = 500, flush_interval_ms: float = 1000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self._buffers: Dict[str, List[Dict]] = {c: [] for c in BUFFERED_COLLECTIONS}
+        self._rollups: Dict[tuple, Any] = {}  # key -> pending increment (RollupBucket)
+        self._flush_task: Optional[asyncio.Task] = None
+        self._indexes_ready = False
+
+    async def insert_experiment(self, experiment: Dict):
+        await self._ensure_indexes()
+        await self._insert_one("experiments", experiment)
+
+    async def update_experiment(self, experiment_id: str, fields: Dict):
+        await self._update_one("experiments", experiment_id, fields)
+
+    async def update_experiment_if(
+        self,
+        experiment_id: str,
+        field: str,
+        value: Any,
+        current: Sequence[Any]
+    ) -> bool:
+        """Set a top-level field only while it holds one of ``current``.
+
+        ``None`` in ``current`` also matches a missing field. Atomic across
+        processes; returns whether this call made the change.
+        """
+        return await self._update_one_if(experiment_id, field, value, current)
+
+    async def get_experiment(self, experiment_id: str) -> Optional[Dict]:
+        return await self._find_one("experiments", experiment_id)
+
+    async def add(self, collection: str, document: Dict):
+        """Buffer a document for bulk insertion"""
+        buffer = self._buffers[collection]
+        buffer.append(document)
+        if len(buffer) >= self.batch_size:
+            await self.flush(collection)
+        else:
+            self._ensure_flusher()
+
+    async def iter_results(self, experiment_id: str) -> AsyncIterator[Dict]:
+        """Stream an experiment's results in insertion order"""
+        await self.flush("experiment_results")
+        async for document in self._find_many("experiment_results", experiment_id):
+            yield document
+
+    async def put_rollups(self, increments: Iterable[Any]):
+        """Buffer rollup increments; those to the same bucket are combined"""
+        for increment in increments:
+            self._requeue(increment)
+        if len(self._rollups) >= self.batch_size:
+            await self.flush(ROLLUP_COLLECTION)
+        else:
+            self._ensure_flusher()
+
+    async def get_rollups(
+        self,
+        experiment_id: str,
+        since: Dict[str, Optional[datetime]]
+    ) -> List[Dict]:
+        """Rollup documents per granularity from ``since[granularity]`` on.
+
+        Pending increments are written first, so the documents include this
+        process's results as well as every other writer's.
+        """
+        await self.flush(ROLLUP_COLLECTION)
+        documents = []
+        for granularity, start in since.items():
+            documents.extend(await self._find_rollups(experiment_id, granularity, start))
+        return documents
+
+    async def rollup_shifts(
+        self,
+        experiment_id: str,
+        proposed: Dict[str, float]
+    ) -> Dict[str, float]:
+        """The stored shift of each proposed metric.
+
+        A proposed value is stored only for a metric that has no shift yet,
+        so every writer gets the same shift no matter which one came first.
+        """
+        await self._ensure_indexes()
+        return await self._claim_shifts(experiment_id, proposed)
+
+    async def flush(self, collection: Optional[str] = None):
+        """Write buffered documents"""
+        await self._ensure_indexes()
+        if collection in (None, ROLLUP_COLLECTION):
+            await self._flush_rollups()
+        if collection == ROLLUP_COLLECTION:
+            return
+        for name in [collection] if collection else BUFFERED_COLLECTIONS:
+            documents, self._buffers[name] = self._buffers[name], []
+            if not documents:
+                continue
+            try:
+                await self._insert_many(name, documents)
+            except Exception:
+                # Keep the batch for the next flush attempt
+                self._buffers[name] = documents + self._buffers[name]
+                raise
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        await self.flush()
+
+    # Private helper methods
+    def _ensure_flusher(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_periodically())
+
+    def _requeue(self, increment: Any):
+        pending = self._rollups.get(increment.key)
+        if pending is None:
+            self._rollups[increment.key] = increment
+        else:
+            pending.merge(increment)
+
+    async def _flush_rollups(self):
+        increments, self._rollups = list(self._rollups.values()), {}
+        if not increments:
+            return
+        try:
+            await self._increment_rollups([increment.to_document() for increment in increments])
+        except Exception as e:
+            # Increments aren't idempotent: keep only those that weren't applied
+            failed = e.failed if isinstance(e, RollupWriteError) else range(len(increments))
+            for i in failed:
+                self._requeue(increments[i])
+            raise
+
+    async def _flush_periodically(self):
+        while any(self._buffers.values()) or self._rollups:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Warning: experiment store flush failed: {e}")
+
+    async def _ensure_indexes(self):
+        if not self._indexes_ready:
+            await self._create_indexes()
+            self._indexes_ready = True
+
+    # Backend operations
+    async def _create_indexes(self):
+        raise NotImplementedError
+
+    async def _insert_one(self, collection: str, document: Dict):
+        raise NotImplementedError
+
+    async def _insert_many(self, collection: str, documents: List[Dict]):
+        raise NotImplementedError
+
+    async def _update_one(self, collection: str, experiment_id: str, fields: Dict):
+        raise NotImplementedError
+
+    async def _update_one_if(
+        self,
+        experiment_id: str,
+        field: str,
+        value: Any,
+        current: Sequence[Any]
+    ) -> bool:
+        raise NotImplementedError
+
+    async def _claim_shifts(
+        self,
+        experiment_id: str,
+        proposed: Dict[str, float]
+    ) -> Dict[str, float]:
+        raise NotImplementedError
+
+    async def _find_one(self, collection: str, experiment_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def _find_many(self, collection: str, experiment_id: str) -> AsyncIterator[Dict]:
+        raise NotImplementedError
+
+    async def _increment_rollups(self, documents: List[Dict]):
+        raise NotImplementedError
+
+    async def _find_rollups(
+        self,
+        experiment_id: str,
+        granularity: str,
+        since: Optional[datetime]
+    ) -> List[Dict]:
+        raise NotImplementedError
+
+
+class MongoExperimentStore(ExperimentStore):
+    """MongoDB backend (motor)"""
+
+    def __init__(self, url: str, **kwargs):
+        super().__init__(**kwargs)
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        self.client = AsyncIOMotorClient(url)
+        self.db = self.client.get_default_database("prompt_flow")
+
+    async def _create_indexes(self):
+        await self.db.experiments.create_index("experiment_id", unique=True)
+        for collection in BUFFERED_COLLECTIONS:
+            await self.db[collection].create_index("experiment_id")
+        await self.db.experiment_results.create_index("response_id")
+        await self.db.human_feedback.create_index("response_id")
+        await self.db[ROLLUP_COLLECTION].create_index(
+            [("experiment_id", 1), ("granularity", 1), ("bucket", 1), ("variant", 1)],
+            unique=True
+        )
+        await self.db[SHIFT_COLLECTION].create_index(
+            [("experiment_id", 1), ("metric", 1)], unique=True
+        )
+
+    async def _insert_one(self, collection: str, document: Dict):
+        await self.db[collection].insert_one(dict(document))
+
+    async def _insert_many(self, collection: str, documents: List[Dict]):
+        # Unordered so one bad document doesn't block the rest of the batch
+        await self.db[collection].insert_many(documents, ordered=False)
+
+    async def _update_one(self, collection: str, experiment_id: str, fields: Dict):
+        await self.db[collection].update_one(
+            {"experiment_id": experiment_id}, {"$set": fields}
+        )
+
+    async def _update_one_if(
+        self,
+        experiment_id: str,
+        field: str,
+        value: Any,
+        current: Sequence[Any]
+    ) -> bool:
+        # $in with null also matches documents without the field
+        result = await self.db.experiments.update_one(
+            {"experiment_id": experiment_id, field: {"$in": list(current)}},
+            {"$set": {field: value}}
+        )
+        return result.modified_count == 1
+
+    async def _claim_shifts(
+        self,
+        experiment_id: str,
+        proposed: Dict[str, float]
+    ) -> Dict[str, float]:
+        from pymongo import ReturnDocument
+
+        shifts = {}
+        for metric, shift in proposed.items():
+            document = await self.db[SHIFT_COLLECTION].find_one_and_update(
+                {"experiment_id": experiment_id, "metric": metric},
+                {"$setOnInsert": {"shift": shift}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            shifts[metric] = document["shift"]
+        return shifts
+
+    async def _find_one(self, collection: str, experiment_id: str) -> Optional[Dict]:
+        return await self.db[collection].find_one(
+            {"experiment_id": experiment_id}, {"_id": 0}
+        )
+
+    async def _find_many(self, collection: str, experiment_id: str) -> AsyncIterator[Dict]:
+        cursor = self.db[collection].find(
+            {"experiment_id": experiment_id}, {"_id": 0}
+        ).sort("_id", 1)
+        async for document in cursor:
+            yield document
+
+    async def _increment_rollups(self, documents: List[Dict]):
+        from pymongo import UpdateOne
+        from pymongo.errors import BulkWriteError
+
+        requests = []
+        for d in documents:
+            increments, shifts = {"samples": d["samples"]}, {}
+            for name, sums in d["metrics"].items():
+                shifts[f"metrics.{name}.shift"] = sums["shift"]
+                increments.update(
+                    (f"metrics.{name}.{field}", sums[field]) for field in ("count", "sum", "sum_sq")
+                )
+            requests.append(UpdateOne(
+                {name: d[name] for name in ("experiment_id", "granularity", "bucket", "variant")},
+                # The shift is the same for every writer, so setting it is idempotent
+                {"$inc": increments, "$set": shifts},
+                upsert=True
+            ))
+        try:
+            await self.db[ROLLUP_COLLECTION].bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            failed = [error["index"] for error in e.details.get("writeErrors", [])]
+            raise RollupWriteError(str(e), failed) from e
+
+    async def _find_rollups(
+        self,
+        experiment_id: str,
+        granularity: str,
+        since: Optional[datetime]
+    ) -> List[Dict]:
+        query: Dict[str, Any] = {"experiment_id": experiment_id, "granularity": granularity}
+        if since is not None:
+            query["bucket"] = {"$gte": since}
+        cursor = self.db[ROLLUP_COLLECTION].find(query, {"_id": 0})
+        return [document async for document in cursor]
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _decode_object(obj: Dict) -> Any:
+    if set(obj) == {"$date"}:
+        return datetime.fromisoformat(obj["$date"])
+    return obj
+
+
+class SQLiteExperimentStore(ExperimentStore):
+    """In-process SQLite backend for local runs and tests"""
+
+    def __init__(self, path: str = ":memory:", **kwargs):
+        super().__init__(**kwargs)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def _execute(self, sql: str, params: Any = (), many: bool = False) -> List[tuple]:
+        with self._lock:
+            try:
+                if many:
+                    self._conn.executemany(sql, params)
+                    rows = []
+                else:
+                    rows = self._conn.execute(sql, params).fetchall()
+                self._conn.commit()
+            except Exception:
+                # All or nothing, so a failed batch can be retried as a whole
+                self._conn.rollback()
+                raise
+            return rows
+
+    async def _run(self, sql: str, params: Any = (), many: bool = False) -> List[tuple]:
+        return await asyncio.to_thread(self._execute, sql, params, many)
+
+    async def _create_indexes(self):
+        await self._run(
+            "CREATE TABLE IF NOT EXISTS experiments "
+            "(experiment_id TEXT PRIMARY KEY, doc TEXT NOT NULL)"
+        )
+        for collection in BUFFERED_COLLECTIONS:
+            await self._run(
+                f"CREATE TABLE IF NOT EXISTS {collection} ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "experiment_id TEXT, response_id TEXT, doc TEXT NOT NULL)"
+            )
+            await self._run(
+                f"CREATE INDEX IF NOT EXISTS ix_{collection}_experiment_id "
+                f"ON {collection} (experiment_id)"
+            )
+            await self._run(
+                f"CREATE INDEX IF NOT EXISTS ix_{collection}_response_id "
+                f"ON {collection} (response_id)"
+            )
+        # One row per bucket and metric; the metric "" row counts the bucket's samples
+        await self._run(
+            f"CREATE TABLE IF NOT EXISTS {ROLLUP_COLLECTION} ("
+            "experiment_id TEXT, granularity TEXT, bucket TEXT, variant TEXT, metric TEXT, "
+            "n INTEGER NOT NULL, shift REAL NOT NULL, total REAL NOT NULL, "
+            "total_sq REAL NOT NULL, "
+            "PRIMARY KEY (experiment_id, granularity, bucket, variant, metric))"
+        )
+        await self._run(
+            f"CREATE TABLE IF NOT EXISTS {SHIFT_COLLECTION} ("
+            "experiment_id TEXT, metric TEXT, shift REAL NOT NULL, "
+            "PRIMARY KEY (experiment_id, metric))"
+        )
+
+    async def _insert_one(self, collection: str, document: Dict):
+        await self._run(
+            "INSERT INTO experiments (experiment_id, doc) VALUES (?, ?)",
+            (document["experiment_id"], json.dumps(document, default=_encode_value))
+        )
+
+    async def _insert_many(self, collection: str, documents: List[Dict]):
+        await self._run(
+            f"INSERT INTO {collection} (experiment_id, response_id, doc) VALUES (?, ?, ?)",
+            [
+                (
+                    d.get("experiment_id"),
+                    d.get("response_id"),
+                    json.dumps(d, default=_encode_value)
+                )
+                for d in documents
+            ],
+            many=True
+        )
+
+    async def _update_one(self, collection: str, experiment_id: str, fields: Dict):
+        document = await self._find_one(collection, experiment_id)
+        if document is None:
+            return
+        document.update(fields)
+        await self._run(
+            "UPDATE experiments SET doc = ? WHERE experiment_id = ?",
+            (json.dumps(document, default=_encode_value), experiment_id)
+        )
+
+    async def _update_one_if(
+        self,
+        experiment_id: str,
+        field: str,
+        value: Any,
+        current: Sequence[Any]
+    ) -> bool:
+        # One statement, so it is atomic for other processes using the file too
+        path = f"$.{field}"
+        matches = ["json_extract(doc, ?) IS NULL" for option in current if option is None]
+        params: List[Any] = [path] * len(matches)
+        for option in current:
+            if option is not None:
+                matches.append("json_extract(doc, ?) = ?")
+                params.extend((path, option))
+        if not matches:
+            return False
+        rows = await self._run(
+            "UPDATE experiments SET doc = json_set(doc, ?, json(?)) "
+            f"WHERE experiment_id = ? AND ({' OR '.join(matches)}) RETURNING experiment_id",
+            (path, json.dumps(value, default=_encode_value), experiment_id, *params)
+        )
+        return bool(rows)
+
+    async def _claim_shifts(
+        self,
+        experiment_id: str,
+        proposed: Dict[str, float]
+    ) -> Dict[str, float]:
+        await self._run(
+            f"INSERT OR IGNORE INTO {SHIFT_COLLECTION} (experiment_id, metric, shift) "
+            "VALUES (?, ?, ?)",
+            [(experiment_id, metric, shift) for metric, shift in proposed.items()],
+            many=True
+        )
+        rows = await self._run(
+            f"SELECT metric, shift FROM {SHIFT_COLLECTION} WHERE experiment_id = ?",
+            (experiment_id,)
+        )
+        return {metric: shift for metric, shift in rows if metric in proposed}
+
+    async def _find_one(self, collection: str, experiment_id: str) -> Optional[Dict]:
+        await self._ensure_indexes()
+        rows = await self._run(
+            "SELECT doc FROM experiments WHERE experiment_id = ?", (experiment_id,)
+        )
+        return json.loads(rows[0][0], object_hook=_decode_object) if rows else None
+
+    async def _find_many(self, collection: str, experiment_id: str) -> AsyncIterator[Dict]:
+        # Page through by rowid so memory stays bounded for large experiments
+        last_id = 0
+        while True:
+            rows = await self._run(
+                f"SELECT id, doc FROM {collection} WHERE experiment_id = ? AND id > ? "
+                "ORDER BY id LIMIT ?",
+                (experiment_id, last_id, self.batch_size)
+            )
+            if not rows:
+                return
+            for row_id, doc in rows:
+                last_id = row_id
+                yield json.loads(doc, object_hook=_decode_object)
+
+    async def _increment_rollups(self, documents: List[Dict]):
+        rows = []
+        for d in documents:
+            key = (d["experiment_id"], d["granularity"], d["bucket"].isoformat(), d["variant"])
+            rows.append((*key, "", d["samples"], 0.0, 0.0, 0.0))
+            rows.extend(
+                (*key, name, sums["count"], sums["shift"], sums["sum"], sums["sum_sq"])
+                for name, sums in d["metrics"].items()
+            )
+        await self._run(
+            f"INSERT INTO {ROLLUP_COLLECTION} "
+            "(experiment_id, granularity, bucket, variant, metric, n, shift, total, total_sq) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (experiment_id, granularity, bucket, variant, metric) DO UPDATE SET "
+            "n = n + excluded.n, total = total + excluded.total, "
+            "total_sq = total_sq + excluded.total_sq",
+            rows,
+            many=True
+        )
+
+    async def _find_rollups(
+        self,
+        experiment_id: str,
+        granularity: str,
+        since: Optional[datetime]
+    ) -> List[Dict]:
+        # ISO timestamps of the same precision sort chronologically
+        rows = await self._run(
+            f"SELECT bucket, variant, metric, n, shift, total, total_sq FROM {ROLLUP_COLLECTION} "
+            "WHERE experiment_id = ? AND granularity = ? AND bucket >= ?",
+            (experiment_id, granularity, since.isoformat() if since else "")
+        )
+        documents: Dict[tuple, Dict] = {}
+        for bucket, variant, metric, n, shift, total, total_sq in rows:
+            document = documents.get((bucket, variant))
+            if document is None:
+                document = documents[(bucket, variant)] = {
+                    "experiment_id": experiment_id,
+                    "granularity": granularity,
+                    "bucket": datetime.fromisoformat(bucket),
+                    "variant": variant,
+                    "samples": 0,
+                    "metrics": {}
+                }
+            if metric == "":
+                document["samples"] = n
+            else:
+                document["metrics"][metric] = {
+                    "count": n, "shift": shift, "sum": total, "sum_sq": total_sq
+                }
+        return list(documents.values())
+
+
+def create_experiment_store() -> ExperimentStore:
+    """Build the store configured in Settings"""
+    options = {
+        "batch_size": settings.EXPERIMENT_WRITE_BATCH_SIZE,
+        "flush_interval_ms": settings.EXPERIMENT_WRITE_FLUSH_MS
+    }
+    if settings.EXPERIMENT_STORE == "sqlite":
+        return SQLiteExperimentStore(settings.EXPERIMENT_SQLITE_PATH, **options)
+    if settings.EXPERIMENT_STORE != "mongodb":
+        raise ValueError(f"Unknown experiment store: {settings.EXPERIMENT_STORE}")
+    return MongoExperimentStore(settings.MONGODB_URL, **options)
@@ -0,0 +1,144 @@
+from typing import Any, Dict, Iterator, Optional, Tuple
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+import copy
+import hashlib
+import json
+import shutil
+import tempfile
+import uuid
+
+import yaml
+
+
+@dataclass
+class CompiledFlow:
+    """A flow directory materialized on disk, plus its parsed DAG"""
+    key: str
+    path: Path
+    dag: Dict
+    refs: int = 0
+    evicted: bool = False
+
+
+class CompiledFlowCache:
+    """LRU cache of materialized Prompt Flow directories.
+
+    Entries are keyed by a content hash of ``pf_config``, so identical flows
+    share one directory. When a flow id and its ``updated_at`` are supplied,
+    repeat executions skip hashing entirely, and a changed ``updated_at``
+    invalidates the flow's previous entry. Directories in use by a running
+    execution are only removed once released.
+    """
+
+    def __init__(self, root: Optional[str] = None, max_entries: int = 256):
+        self._owns_root = root is None
+        self.root = Path(root) if root else Path(tempfile.mkdtemp(prefix="prompt-flows-"))
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, CompiledFlow]" = OrderedDict()
+        self._flow_keys: Dict[Any, Tuple[Any, str]] = {}  # flow_id -> (updated_at, key)
+
+    @staticmethod
+    def config_hash(pf_config: Dict) -> str:
+        canonical = json.dumps(pf_config, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    @contextmanager
+    def lease(
+        self,
+        pf_config: Dict,
+        flow_id: Any = None,
+        updated_at: Any = None
+    ) -> Iterator[CompiledFlow]:
+        """Borrow the compiled flow for the duration of an execution"""
+        compiled = self.get(pf_config, flow_id, updated_at)
+        compiled.refs += 1
+        try:
+            yield compiled
+        finally:
+            compiled.refs -= 1
+            if compiled.evicted and compiled.refs == 0:
+                shutil.rmtree(compiled.path, ignore_errors=True)
+
+    def get(self, pf_config: Dict, flow_id: Any = None, updated_at: Any = None) -> CompiledFlow:
+        """Return the compiled flow, materializing it on a miss"""
+        if flow_id is not None:
+            known = self._flow_keys.get(flow_id)
+            if known is not None:
+                if known[0] == updated_at and known[1] in self._entries:
+                    self.hits += 1
+                    self._entries.move_to_end(known[1])
+                    return self._entries[known[1]]
+                if known[0] != updated_at:
+                    self.invalidate(flow_id)
+
+        key = self.config_hash(pf_config)
+        compiled = self._entries.get(key)
+        if compiled is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        else:
+            self.misses += 1
+            compiled = self._materialize(key, pf_config)
+            self._entries[key] = compiled
+            self._evict()
+
+        if flow_id is not None:
+            self._flow_keys[flow_id] = (updated_at, key)
+        return compiled
+
+    def invalidate(self, flow_id: Any):
+        """Forget a flow's compiled entry (e.g. after it was updated)"""
+        known = self._flow_keys.pop(flow_id, None)
+        if known is None:
+            return
+        # Other flows with identical content may still share the entry
+        if any(key == known[1] for _, key in self._flow_keys.values()):
+            return
+        compiled = self._entries.pop(known[1], None)
+        if compiled is not None:
+            self._discard(compiled)
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+    def close(self):
+        self._entries.clear()
+        self._flow_keys.clear()
+        if self._owns_root:
+            shutil.rmtree(self.root, ignore_errors=True)
+
+    # Private helper methods
+    def _materialize(self, key: str, pf_config: Dict) -> CompiledFlow:
+        """Write flow.dag.yaml once into a fresh directory for this entry"""
+        # A unique directory per entry means a lease on an evicted entry can
+        # never delete files that a newer entry for the same content uses
+        path = self.root / f"{key[:16]}-{uuid.uuid4().hex[:8]}"
+        path.mkdir()
+        with open(path / "flow.dag.yaml", "w") as f:
+            yaml.safe_dump(pf_config, f)
+        return CompiledFlow(key=key, path=path, dag=copy.deepcopy(pf_config))
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            _, compiled = self._entries.popitem(last=False)
+            self._flow_keys = {
+                flow_id: known for flow_id, known in self._flow_keys.items()
+                if known[1] != compiled.key
+            }
+            self._discard(compiled)
+
+    def _discard(self, compiled: CompiledFlow):
+        compiled.evicted = True
+        if compiled.refs == 0:
+            shutil.rmtree(compiled.path, ignore_errors=True)
@@ -0,0 +1,178 @@
+from typing import Any, Callable, Dict, Optional
+from datetime import datetime
+import asyncio
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.flow import FlowVersion
+from app.services.cost_ledger import CostLedger
+from app.services.experiment_stats import RunningStats
+
+# Per-execution metrics summarised as running mean/variance on the version
+AGGREGATED_METRICS = ("duration", "cpu_time", "queue_wait", "exec_time", "tokens", "cost")
+
+
+def merge_run_metrics(aggregate: Optional[Dict], result: Dict) -> Dict:
+    """Fold one execution result into a version's aggregate metrics.
+
+    Keys other than the execution counters (such as metrics supplied when
+    the version was created) are kept as they are.
+    """
+    aggregate = aggregate or {}
+    merged: Dict[str, Any] = {
+        **aggregate,
+        "runs": aggregate.get("runs", 0) + 1,
+        "errors": aggregate.get("errors", 0),
+        "cache_hits": aggregate.get("cache_hits", 0),
+        "semantic_cache_hits": aggregate.get("semantic_cache_hits", 0),
+        "total_tokens": aggregate.get("total_tokens", 0),
+        "total_cost": aggregate.get("total_cost", 0.0),
+        "stats": dict(aggregate.get("stats", {}))
+    }
+    if "error" in result:
+        merged["errors"] += 1
+    else:
+        metrics = result.get("metrics", {})
+        for name in AGGREGATED_METRICS:
+            if isinstance(metrics.get(name), (int, float)):
+                stats = RunningStats.from_dict(merged["stats"].get(name, {}))
+                stats.add(float(metrics[name]))
+                merged["stats"][name] = stats.to_dict()
+        merged["cache_hits"] += metrics.get("cache_hits", 0)
+        merged["semantic_cache_hits"] += metrics.get("semantic_cache_hits", 0)
+        merged["total_tokens"] += metrics.get("tokens", 0)
+        merged["total_cost"] += metrics.get("cost", 0.0)
+        merged["last_trace_id"] = metrics.get("trace_id")
+    merged["updated_at"] = datetime.utcnow().isoformat()
+    return merged
+
+
+def combine_metrics(aggregate: Optional[Dict], partial: Dict) -> Dict:
+    """Add a batch of executions' aggregate metrics to a version's aggregate.
+
+    Like ``merge_run_metrics``, other keys of ``aggregate`` are kept.
+    """
+    aggregate = aggregate or {}
+    combined: Dict[str, Any] = dict(aggregate)
+    combined.update(
+        (name, aggregate.get(name, 0) + partial.get(name, 0))
+        for name in ("runs", "errors", "cache_hits", "semantic_cache_hits", "total_tokens")
+    )
+    combined["total_cost"] = aggregate.get("total_cost", 0.0) + partial.get("total_cost", 0.0)
+    combined["stats"] = dict(aggregate.get("stats", {}))
+    for name, data in partial.get("stats", {}).items():
+        stats = RunningStats.from_dict(combined["stats"].get(name, {}))
+        stats.merge(RunningStats.from_dict(data))
+        combined["stats"][name] = stats.to_dict()
+    if partial.get("last_trace_id") is not None:
+        combined["last_trace_id"] = partial["last_trace_id"]
+    combined["updated_at"] = partial.get("updated_at", datetime.utcnow().isoformat())
+    return combined
+
+
+def record_run_costs(ledger: CostLedger, flow_id: int, result: Dict):
+    """Add an execution's LLM calls to the flow's per-model cost totals"""
+    if result.get("metrics", {}).get("mock"):
+        return
+    calls = [
+        node for node in result.get("metrics", {}).get("nodes", {}).values()
+        if node.get("model")
+    ]
+    if not calls:
+        return
+    ledger.add_many(
+        "flow",
+        str(flow_id),
+        [node["model"] for node in calls],
+        [node.get("token_usage", {}).get("prompt_tokens", 0) for node in calls],
+        [node.get("token_usage", {}).get("completion_tokens", 0) for node in calls],
+        [node.get("cost", 0.0) for node in calls]
+    )
+
+
+class FlowMetricsRecorder:
+    """Execution metrics of each flow's latest version, written in batches.
+
+    Executions are folded into an in-memory aggregate per flow, which is
+    added to the version row every ``flush_interval_ms`` (one locked
+    read-modify-write per flow and flush, not per execution). Mock
+    executions are not recorded.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession],
+        flush_interval_ms: float = 1000
+    ):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval_ms / 1000
+        self._pending: Dict[int, Dict] = {}
+        self._lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def add(self, flow_id: int, result: Dict):
+        if result.get("metrics", {}).get("mock"):
+            return
+        self._pending[flow_id] = merge_run_metrics(self._pending.get(flow_id), result)
+        self._ensure_flusher()
+
+    async def flush(self):
+        async with self._lock:
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            try:
+                async with self.session_factory() as db:
+                    for flow_id, partial in pending.items():
+                        await self._apply(db, flow_id, partial)
+                    await db.commit()
+            except Exception:
+                # Keep the executions for the next flush attempt
+                for flow_id, partial in pending.items():
+                    newer = self._pending.get(flow_id)
+                    self._pending[flow_id] = (
+                        partial if newer is None else combine_metrics(partial, newer)
+                    )
+                raise
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        await self.flush()
+
+    # Private helper methods
+    def _ensure_flusher(self):
+        if self._flush_task is None or self._flush_task.done():
+            try:
+                self._flush_task = asyncio.get_running_loop().create_task(
+                    self._flush_periodically()
+                )
+            except RuntimeError:
+                pass  # no event loop: flushed by the next flush() or close()
+
+    async def _flush_periodically(self):
+        while self._pending:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Warning: flow metrics flush failed: {e}")
+
+    async def _apply(self, db: AsyncSession, flow_id: int, partial: Dict):
+        # Locked where the database supports it, so other processes'
+        # flushes don't overwrite each other's counts
+        query = (
+            select(FlowVersion)
+            .where(FlowVersion.flow_id == flow_id)
+            .order_by(FlowVersion.id.desc())
+            .limit(1)
+            .with_for_update()
+        )
+        version = (await db.execute(query)).scalars().first()
+        if version is None:
+            return
+        # Assign a new dict: in-place changes to a JSON column aren't tracked
+        version.metrics = combine_metrics(version.metrics, partial)
@@ -0,0 +1,213 @@
+from typing import Any, Dict, Iterable, List, Optional, Set
+import ast
+
+from app.services.dag_executor import TEMPLATE_VARIABLE, node_config
+
+
+def validate_flow_graph(
+    nodes: List[Dict],
+    connections: List[Dict],
+    node_types: Optional[Iterable[str]] = None
+) -> Dict:
+    """Validate a UI flow graph in O(V + E).
+
+    Errors (the flow cannot run): missing or duplicate node ids, connections
+    to unknown nodes, circular dependencies (with the cycle path), unknown
+    node types when ``node_types`` is given, and handle mismatches.
+    Warnings: nodes that are not connected or cannot reach an output node.
+    """
+    errors: List[str] = []
+    warnings: List[str] = []
+
+    if not nodes:
+        errors.append("Flow must have at least one node")
+
+    known_types = set(node_types) if node_types is not None else None
+    index: Dict[str, Dict] = {}
+    for position, node in enumerate(nodes):
+        node_id = node.get("id")
+        if not node_id:
+            errors.append(f"Node at position {position} has no id")
+            continue
+        if node_id in index:
+            errors.append(f"Duplicate node id '{node_id}'")
+            continue
+        index[node_id] = node
+        if known_types is not None and node.get("type") not in known_types:
+            errors.append(f"Node '{node_id}' has unsupported type '{node.get('type')}'")
+
+    successors: Dict[str, Set[str]] = {node_id: set() for node_id in index}
+    predecessors: Dict[str, Set[str]] = {node_id: set() for node_id in index}
+    filled_handles: Dict[tuple, str] = {}
+    handles = _HandleIndex(index)
+
+    for position, connection in enumerate(connections):
+        label = connection.get("id") or f"#{position}"
+        source, target = connection.get("source"), connection.get("target")
+        if source not in index or target not in index:
+            missing = [
+                f"{role} '{node_id}'"
+                for role, node_id in (("source", source), ("target", target))
+                if node_id not in index
+            ]
+            errors.append(f"Connection {label} references unknown {' and '.join(missing)}")
+            continue
+
+        successors[source].add(target)
+        predecessors[target].add(source)
+        errors.extend(handles.check(label, connection))
+
+        slot = (target, connection.get("targetHandle") or source)
+        if slot in filled_handles:
+            errors.append(
+                f"Connections {filled_handles[slot]} and {label} both feed "
+                f"input '{slot[1]}' of node '{target}'"
+            )
+        else:
+            filled_handles[slot] = label
+
+    cycle = _find_cycle(successors, predecessors)
+    if cycle:
+        errors.append(f"Circular dependency: {' -> '.join(cycle)}")
+
+    warnings.extend(_connectivity_warnings(index, successors, predecessors))
+
+    return {
+        "valid": len(errors) == 0,
+        "errors": errors,
+        "warnings": warnings
+    }
+
+
+class _HandleIndex:
+    """Lazily derives the named inputs each node accepts"""
+
+    def __init__(self, index: Dict[str, Dict]):
+        self.index = index
+        self._inputs: Dict[str, Optional[Set[str]]] = {}
+
+    def check(self, label: str, connection: Dict) -> List[str]:
+        errors = []
+        source = self.index[connection["source"]]
+        target = self.index[connection["target"]]
+
+        if source.get("type") == "output":
+            errors.append(f"Connection {label}: output node '{source['id']}' has no outputs")
+        if target.get("type") == "input":
+            errors.append(f"Connection {label}: input node '{target['id']}' accepts no inputs")
+
+        source_handle = connection.get("sourceHandle")
+        if source_handle and source.get("type") == "input":
+            fields = node_config(source).get("fields")
+            if fields and source_handle not in fields:
+                errors.append(
+                    f"Connection {label}: input node '{source['id']}' has no field '{source_handle}'"
+                )
+
+        target_handle = connection.get("targetHandle")
+        if target_handle:
+            accepted = self.inputs(target)
+            if accepted is not None and target_handle not in accepted:
+                errors.append(
+                    f"Connection {label}: node '{target['id']}' has no input '{target_handle}'"
+                )
+        return errors
+
+    def inputs(self, node: Dict) -> Optional[Set[str]]:
+        """Named inputs of a node, or None when any name is accepted"""
+        node_id = node["id"]
+        if node_id not in self._inputs:
+            self._inputs[node_id] = self._derive_inputs(node)
+        return self._inputs[node_id]
+
+    def _derive_inputs(self, node: Dict) -> Optional[Set[str]]:
+        config = node_config(node)
+        static = set(config.get("inputs", {}))
+        node_type = node.get("type")
+        if node_type == "prompt":
+            return {"input"} | static | _template_roots(config.get("template", ""))
+        if node_type == "llm":
+            return {"input", "prompt"} | static | _template_roots(config.get("prompt", ""))
+        if node_type == "python":
+            parameters = _main_parameters(config.get("code", ""))
+            return None if parameters is None else parameters | static
+        return None
+
+
+def _template_roots(template: str) -> Set[str]:
+    return {match.group(1).split(".", 1)[0] for match in TEMPLATE_VARIABLE.finditer(template)}
+
+
+def _main_parameters(code: str) -> Optional[Set[str]]:
+    """Parameter names of ``main``; None if it takes **kwargs or can't be parsed"""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+    for statement in tree.body:
+        if isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef)) and statement.name == "main":
+            args = statement.args
+            if args.kwarg is not None:
+                return None
+            return {a.arg for a in args.posonlyargs + args.args + args.kwonlyargs}
+    return None
+
+
+def _find_cycle(
+    successors: Dict[str, Set[str]],
+    predecessors: Dict[str, Set[str]]
+) -> Optional[List[str]]:
+    """Return one cycle as a closed path, or None if the graph is acyclic"""
+    # Kahn's algorithm strips everything that is not on or behind a cycle
+    in_degree = {node_id: len(sources) for node_id, sources in predecessors.items()}
+    ready = [node_id for node_id, degree in in_degree.items() if degree == 0]
+    while ready:
+        node_id = ready.pop()
+        for successor in successors[node_id]:
+            in_degree[successor] -= 1
+            if in_degree[successor] == 0:
+                ready.append(successor)
+
+    remaining = {node_id for node_id, degree in in_degree.items() if degree > 0}
+    if not remaining:
+        return None
+
+    # Every remaining node has a remaining predecessor, so walking predecessors
+    # from any of them must revisit a node; the revisited stretch is a cycle
+    position: Dict[str, int] = {}
+    path: List[str] = []
+    node_id = next(iter(remaining))
+    while node_id not in position:
+        position[node_id] = len(path)
+        path.append(node_id)
+        node_id = next(p for p in predecessors[node_id] if p in remaining)
+    cycle = path[position[node_id]:]
+    cycle.reverse()
+    return cycle + [cycle[0]]
+
+
+def _connectivity_warnings(
+    index: Dict[str, Any],
+    successors: Dict[str, Set[str]],
+    predecessors: Dict[str, Set[str]]
+) -> List[str]:
+    warnings = []
+    if len(index) > 1:
+        for node_id in index:
+            if not successors[node_id] and not predecessors[node_id]:
+                warnings.append(f"Node '{node_id}' is not connected to the flow")
+
+    outputs = [node_id for node_id, node in index.items() if node.get("type") == "output"]
+    if outputs:
+        # Reverse BFS from output nodes finds everything that contributes
+        reaches_output = set(outputs)
+        frontier = list(outputs)
+        while frontier:
+            for source in predecessors[frontier.pop()]:
+                if source not in reaches_output:
+                    reaches_output.add(source)
+                    frontier.append(source)
+        for node_id in index:
+            if node_id not in reaches_output and (successors[node_id] or predecessors[node_id]):
+                warnings.append(f"Node '{node_id}' does not reach any output node")
+    return warnings
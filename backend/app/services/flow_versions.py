@@ -0,0 +1,181 @@
+from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+import copy
+import json
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.flow import FlowVersion
+from app.services import json_delta
+
+
+class FlowVersionStore:
+    """Stores flow versions as snapshots plus structural deltas.
+
+    A new version is saved as a delta from the flow's latest version, or as
+    a full snapshot once the delta chain reaches ``snapshot_every`` versions
+    or the delta is not much smaller than the config itself. A config whose
+    content hash matches an earlier version of the same flow is stored as a
+    reference to it. Reading a version replays at most ``snapshot_every``
+    deltas, and reconstructed configs are kept in an LRU cache (versions are
+    immutable, so it never needs invalidating).
+    """
+
+    def __init__(self, snapshot_every: int = 10, cache_size: int = 256):
+        self.snapshot_every = snapshot_every
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[int, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def create(
+        self,
+        db: AsyncSession,
+        flow_id: int,
+        version: str,
+        flow_config: Dict,
+        metrics: Optional[Dict] = None
+    ) -> FlowVersion:
+        """Add a version to the session (the caller commits).
+
+        The config is cached when it is first read back, not here, so a
+        version whose transaction rolls back never enters the cache.
+        """
+        digest = json_delta.content_hash(flow_config)
+        row = FlowVersion(
+            flow_id=flow_id,
+            version=version,
+            content_hash=digest,
+            metrics=metrics or {}
+        )
+
+        duplicate = await self._find_by_hash(db, flow_id, digest)
+        latest = await self.latest(db, flow_id)
+        if duplicate is not None:
+            row.storage, row.base_version_id = "ref", duplicate.id
+            row.chain_length = (duplicate.chain_length or 0) + 1
+        elif latest is not None and (latest.chain_length or 0) + 1 < self.snapshot_every:
+            delta = json_delta.diff(await self._reconstruct(db, latest.id), flow_config)
+            if len(json.dumps(delta, default=str)) * 2 < len(json.dumps(flow_config, default=str)):
+                row.storage, row.base_version_id, row.delta = "delta", latest.id, delta
+                row.chain_length = (latest.chain_length or 0) + 1
+        if row.storage is None:
+            row.storage, row.flow_config, row.chain_length = "snapshot", flow_config, 0
+
+        if row.storage == "ref" and row.chain_length >= self.snapshot_every:
+            row.storage, row.base_version_id, row.flow_config = "snapshot", None, flow_config
+            row.chain_length = 0
+
+        db.add(row)
+        await db.flush()
+        return row
+
+    async def latest(self, db: AsyncSession, flow_id: int) -> Optional[FlowVersion]:
+        query = (
+            select(FlowVersion)
+            .where(FlowVersion.flow_id == flow_id)
+            .order_by(FlowVersion.id.desc())
+            .limit(1)
+        )
+        return (await db.execute(query)).scalars().first()
+
+    async def history(
+        self,
+        db: AsyncSession,
+        flow_id: int,
+        limit: int = 50,
+        before: Optional[int] = None
+    ) -> List[FlowVersion]:
+        """Version history, newest first, without loading any configs"""
+        query = select(FlowVersion).where(FlowVersion.flow_id == flow_id)
+        if before is not None:
+            query = query.where(FlowVersion.id < before)
+        query = query.order_by(FlowVersion.id.desc()).limit(limit)
+        return list((await db.execute(query)).scalars().all())
+
+    async def get_config(self, db: AsyncSession, version_id: int) -> Dict:
+        """Reconstruct a version's flow_config; raises KeyError if unknown"""
+        return copy.deepcopy(await self._reconstruct(db, version_id))
+
+    async def diff(self, db: AsyncSession, from_id: int, to_id: int) -> Dict:
+        """Structural delta and node/connection summary between two versions"""
+        old = await self._reconstruct(db, from_id)
+        new = await self._reconstruct(db, to_id)
+        return {
+            "delta": json_delta.diff(old, new),
+            "summary": {
+                key: self._summarize(old.get(key, []), new.get(key, []))
+                for key in ("nodes", "connections")
+            }
+        }
+
+    def stats(self) -> Dict:
+        return {"hits": self.hits, "misses": self.misses, "cached": len(self._cache)}
+
+    # Private helper methods
+    async def _find_by_hash(
+        self,
+        db: AsyncSession,
+        flow_id: int,
+        digest: str
+    ) -> Optional[FlowVersion]:
+        query = (
+            select(FlowVersion)
+            .where(FlowVersion.flow_id == flow_id, FlowVersion.content_hash == digest)
+            .order_by(FlowVersion.id.desc())
+            .limit(1)
+        )
+        return (await db.execute(query)).scalars().first()
+
+    async def _reconstruct(self, db: AsyncSession, version_id: int) -> Any:
+        chain = []
+        current = version_id
+        while True:
+            if current in self._cache:
+                self.hits += 1
+                self._cache.move_to_end(current)
+                config = self._cache[current]
+                break
+            self.misses += 1
+            row = (await db.execute(
+                select(
+                    FlowVersion.id,
+                    FlowVersion.storage,
+                    FlowVersion.base_version_id,
+                    FlowVersion.flow_config,
+                    FlowVersion.delta
+                ).where(FlowVersion.id == current)
+            )).first()
+            if row is None:
+                raise KeyError(f"Flow version {current} not found")
+            if row.storage in (None, "snapshot"):
+                config = row.flow_config
+                self._remember(row.id, config)
+                break
+            chain.append(row)
+            current = row.base_version_id
+
+        for row in reversed(chain):
+            if row.storage == "delta" and row.delta is not None:
+                config = json_delta.apply(config, row.delta)
+            self._remember(row.id, config)
+        return config
+
+    def _remember(self, version_id: int, config: Any):
+        self._cache[version_id] = config
+        self._cache.move_to_end(version_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _summarize(self, old: List[Dict], new: List[Dict]) -> Dict[str, List[str]]:
+        old_items = {item.get("id"): item for item in old if isinstance(item, dict)}
+        new_items = {item.get("id"): item for item in new if isinstance(item, dict)}
+        return {
+            "added": [item_id for item_id in new_items if item_id not in old_items],
+            "removed": [item_id for item_id in old_items if item_id not in new_items],
+            "changed": [
+                item_id for item_id, item in new_items.items()
+                if item_id in old_items and old_items[item_id] != item
+            ]
+        }
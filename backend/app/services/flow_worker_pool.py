@@ -0,0 +1,334 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from multiprocessing.connection import Connection
+import asyncio
+import inspect
+import multiprocessing
+import time
+
+
+class FlowQueueFull(Exception):
+    """Raised when too many flow executions are waiting for a worker"""
+
+
+class FlowTimeout(Exception):
+    """A flow execution exceeded its timeout; its worker was replaced"""
+
+
+class FlowWorkerUnavailable(Exception):
+    """No worker became available in time (e.g. workers fail to start)"""
+
+
+def _serve(conn: Connection, handle: Callable[[tuple], Any]):
+    """Worker loop: reply to each job with (status, detail, seconds) until told to stop"""
+    conn.send(("ready", None, 0.0))
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+
+        started = time.perf_counter()
+        try:
+            reply = ("ok", handle(job), 0.0)
+        except Exception as e:
+            reply = ("error", f"{type(e).__name__}: {e}", 0.0)
+        reply = (reply[0], reply[1], time.perf_counter() - started)
+        try:
+            conn.send(reply)
+        except Exception as e:
+            conn.send(("error", f"Result could not be returned: {e}", reply[2]))
+
+
+def _worker_main(conn: Connection):
+    """Worker process: import promptflow once, then run (flow_path, inputs) jobs"""
+    try:
+        try:
+            from promptflow.client import PFClient
+        except ImportError:
+            from promptflow import PFClient
+        client = PFClient()
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}", 0.0))
+        return
+    _serve(conn, lambda job: client.test(flow=job[0], inputs=job[1]))
+
+
+def run_python_code(node_id: str, code: str, inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """Execute a python node's code and call its ``main()`` with matching inputs"""
+    namespace: Dict[str, Any] = {}
+    exec(compile(code, f"<node {node_id}>", "exec"), namespace)
+    main = namespace.get("main")
+    if not callable(main):
+        raise ValueError("Python node must define main()")
+
+    parameters = inspect.signature(main).parameters
+    if any(p.kind == inspect.Parameter.VAR_KEYWORD for p in parameters.values()):
+        kwargs = inputs
+    else:
+        kwargs = {name: inputs[name] for name in parameters if name in inputs}
+
+    cpu_started = time.process_time()
+    if inspect.iscoroutinefunction(main):
+        result = asyncio.run(main(**kwargs))
+    else:
+        result = main(**kwargs)
+    return {"result": result, "cpu_time": time.process_time() - cpu_started}
+
+
+def python_node_worker_main(conn: Connection):
+    """Worker process for python nodes: run (node_id, code, inputs) jobs"""
+    _serve(conn, lambda job: run_python_code(*job))
+
+
+class FlowWorker:
+    """One long-lived worker process and the parent's end of its pipe"""
+
+    def __init__(self, context: Any, target: Callable[[Connection], None] = _worker_main):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=target, args=(child_conn,), daemon=True)
+        self.process.start()
+        # Only the child keeps its end, so recv() sees EOF if the child dies
+        child_conn.close()
+        self.jobs = 0
+
+    def wait_ready(self, timeout: float):
+        """Block until the child is ready for jobs (worker thread)"""
+        if not self.conn.poll(timeout):
+            raise TimeoutError("Flow worker did not start in time")
+        try:
+            status, detail, _ = self.conn.recv()
+        except EOFError:
+            raise RuntimeError("Flow worker exited during startup")
+        if status != "ready":
+            raise RuntimeError(f"Flow worker failed to start: {detail}")
+
+    async def run(self, job: tuple) -> tuple:
+        self.jobs += 1
+        self.conn.send(job)
+        # The thread is released when the reply arrives or the worker is killed
+        return await asyncio.to_thread(self.conn.recv)
+
+    @property
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def stop(self):
+        """Ask the worker to exit after its current job (blocking)"""
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.kill()
+        self.conn.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+class FlowWorkerPool:
+    """Pool of long-lived processes that execute Prompt Flow jobs.
+
+    Each worker imports promptflow once and then serves jobs from its pipe,
+    so concurrent executions run in parallel across cores and never block the
+    event loop. With ``target=python_node_worker_main`` the workers run python
+    node code instead. Callers wait for an idle worker on an asyncio queue (at most
+    ``max_queue`` may wait, each for at most ``acquire_timeout`` seconds). A
+    job that times out or is cancelled has its worker killed and replaced,
+    and workers are recycled after ``max_jobs_per_worker`` jobs to contain
+    leaks.
+    """
+
+    def __init__(
+        self,
+        size: int = 2,
+        max_jobs_per_worker: int = 100,
+        job_timeout: float = 300.0,
+        max_queue: int = 64,
+        start_timeout: float = 120.0,
+        acquire_timeout: Optional[float] = None,
+        target: Callable[[Connection], None] = _worker_main
+    ):
+        self.size = size
+        self.target = target
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.job_timeout = job_timeout
+        self.max_queue = max_queue
+        self.start_timeout = start_timeout
+        # Long enough to cover a worker restart plus a full job by default
+        self.acquire_timeout = (
+            start_timeout + job_timeout if acquire_timeout is None else acquire_timeout
+        )
+        self.jobs = 0
+        self.recycled = 0
+        self.killed = 0
+        # Spawned workers import nothing from this process but the target
+        self._context = multiprocessing.get_context("spawn")
+        self._idle: Optional[asyncio.Queue] = None
+        self._workers: List[FlowWorker] = []
+        self._spawning = 0
+        self._waiting = 0
+        self._closed = False
+        # Background respawns/stops, referenced until done so they aren't collected
+        self._background: Set[asyncio.Task] = set()
+
+    async def start(self):
+        """Spawn every worker ahead of the first job"""
+        await asyncio.gather(*(self._spawn() for _ in range(self.size - self._capacity())))
+
+    async def run(self, flow_path: str, inputs: Dict, timeout: Optional[float] = None) -> Dict:
+        """Execute a flow directory on an idle worker"""
+        return await self.submit((flow_path, inputs), timeout)
+
+    async def submit(self, job: tuple, timeout: Optional[float] = None) -> Dict:
+        """Run one job on an idle worker; its worker is killed if it times out"""
+        timeout = self.job_timeout if timeout is None else timeout
+        queued = time.perf_counter()
+        worker = await self._acquire()
+        started = time.perf_counter()
+        try:
+            status, detail, exec_time = await asyncio.wait_for(
+                worker.run(job), timeout
+            )
+        except asyncio.TimeoutError:
+            await self._discard(worker)
+            worker = None
+            raise FlowTimeout(f"Execution timed out after {timeout}s")
+        except EOFError:
+            await self._discard(worker)
+            worker = None
+            raise RuntimeError("Flow worker exited during execution")
+        except BaseException:
+            # Cancelled mid-job: the worker's state is unknown
+            await self._discard(worker)
+            worker = None
+            raise
+        finally:
+            if worker is not None:
+                await self._release(worker)
+
+        self.jobs += 1
+        if status != "ok":
+            raise RuntimeError(detail)
+        return {
+            "outputs": detail,
+            "queue_wait": started - queued,
+            "exec_time": exec_time
+        }
+
+    def stats(self) -> Dict:
+        return {
+            "workers": len(self._workers),
+            "idle": self._idle.qsize() if self._idle is not None else 0,
+            "waiting": self._waiting,
+            "jobs": self.jobs,
+            "recycled": self.recycled,
+            "killed": self.killed
+        }
+
+    async def close(self):
+        self._closed = True
+        for task in list(self._background):
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+        workers, self._workers = self._workers, []
+        await asyncio.gather(
+            *(asyncio.to_thread(worker.kill) for worker in workers),
+            return_exceptions=True
+        )
+
+    # Private helper methods
+    def _capacity(self) -> int:
+        return len(self._workers) + self._spawning
+
+    async def _acquire(self) -> FlowWorker:
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+        if self._idle.empty() and self._capacity() < self.size:
+            await self._spawn()
+        if self._idle.empty() and self._waiting >= self.max_queue:
+            raise FlowQueueFull(
+                f"Flow execution queue is full ({self.max_queue} waiting jobs)"
+            )
+
+        self._waiting += 1
+        deadline = time.monotonic() + self.acquire_timeout
+        try:
+            while True:
+                try:
+                    worker = await asyncio.wait_for(
+                        self._idle.get(), max(deadline - time.monotonic(), 0)
+                    )
+                except asyncio.TimeoutError:
+                    raise FlowWorkerUnavailable(
+                        f"No worker became available within {self.acquire_timeout}s"
+                    )
+                if worker.alive:
+                    return worker
+                await self._discard(worker)
+        finally:
+            self._waiting -= 1
+
+    async def _release(self, worker: FlowWorker):
+        if not worker.alive:
+            await self._discard(worker)
+        elif worker.jobs >= self.max_jobs_per_worker:
+            self.recycled += 1
+            self._workers.remove(worker)
+            self._in_background(asyncio.to_thread(worker.stop))
+            # Starting a worker is slow; the caller whose job finished shouldn't wait for it
+            if not self._closed:
+                self._in_background(self._respawn())
+        else:
+            self._idle.put_nowait(worker)
+
+    async def _discard(self, worker: FlowWorker):
+        """Kill a worker whose job failed to finish and schedule a replacement"""
+        self.killed += 1
+        if worker in self._workers:
+            self._workers.remove(worker)
+        # Killing joins the process, which may take a while: not on the loop
+        await asyncio.to_thread(worker.kill)
+        if not self._closed:
+            self._in_background(self._respawn())
+
+    def _in_background(self, coroutine: Awaitable):
+        task = asyncio.ensure_future(coroutine)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _respawn(self):
+        try:
+            await self._spawn()
+        except Exception as e:
+            print(f"Warning: failed to replace flow worker: {e}")
+
+    async def _spawn(self):
+        if self._closed or self._capacity() >= self.size:
+            return
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+        self._spawning += 1
+        try:
+            worker = await asyncio.to_thread(self._start_worker)
+        finally:
+            self._spawning -= 1
+        if self._closed:
+            await asyncio.to_thread(worker.kill)
+            return
+        self._workers.append(worker)
+        self._idle.put_nowait(worker)
+
+    def _start_worker(self) -> FlowWorker:
+        worker = FlowWorker(self._context, self.target)
+        try:
+            worker.wait_ready(self.start_timeout)
+        except Exception:
+            worker.kill()
+            raise
+        return worker
@@ -0,0 +1,116 @@
+from typing import Any, Dict, List
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio
+import threading
+
+import numpy as np
+
+
+class InferenceQueueFull(Exception):
+    """Raised when the inference queue is at capacity"""
+
+
+# Models are loaded once per process: shared by threads in thread mode,
+# and loaded by the pool initializer in each worker in process mode.
+_models: Dict[str, Any] = {}
+_models_lock = threading.Lock()
+
+
+def _get_model(model_name: str) -> Any:
+    """Load (once) and return the sentence transformer for this process"""
+    model = _models.get(model_name)
+    if model is None:
+        with _models_lock:
+            model = _models.get(model_name)
+            if model is None:
+                from sentence_transformers import SentenceTransformer
+                model = SentenceTransformer(model_name)
+                _models[model_name] = model
+    return model
+
+
+def _encode_texts(model_name: str, texts: List[str], batch_size: int) -> np.ndarray:
+    """Encode texts into L2-normalised float32 rows"""
+    return _get_model(model_name).encode(
+        texts,
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=False
+    )
+
+
+class InferenceWorker:
+    """Runs embedding inference on an executor so the event loop stays free.
+
+    ``executor`` selects a thread pool (the model is shared, torch releases
+    the GIL during inference) or a process pool (one model per process). At
+    most ``max_queue`` jobs may be pending; beyond that ``encode`` raises
+    ``InferenceQueueFull`` instead of queueing unbounded work.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        executor: str = "thread",
+        max_workers: int = 2,
+        max_queue: int = 64,
+        batch_size: int = 64
+    ):
+        self.model_name = model_name
+        self.executor_kind = executor
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self._pending = 0
+        self._executor = self._create_executor()
+
+    def _create_executor(self) -> Executor:
+        if self.executor_kind == "process":
+            return ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=_get_model,
+                initargs=(self.model_name,)
+            )
+        if self.executor_kind != "thread":
+            raise ValueError(f"Unknown inference executor: {self.executor_kind}")
+        return ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="inference"
+        )
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def warm_up(self):
+        """Load the model ahead of the first request (blocking)"""
+        futures = [
+            self._executor.submit(_get_model, self.model_name)
+            for _ in range(self.max_workers if self.executor_kind == "process" else 1)
+        ]
+        for future in futures:
+            future.result()
+
+    async def encode(self, texts: List[str]) -> np.ndarray:
+        """Encode texts on the executor, applying queue backpressure"""
+        if self._pending >= self.max_queue:
+            raise InferenceQueueFull(
+                f"Inference queue is full ({self.max_queue} pending jobs)"
+            )
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor,
+                _encode_texts,
+                self.model_name,
+                list(texts),
+                self.batch_size
+            )
+        finally:
+            self._pending -= 1
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
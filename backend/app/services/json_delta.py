@@ -0,0 +1,122 @@
+"""
+Structural deltas between JSON documents.
+
+A delta is one of:
+
+- ``{"=": value}``: replace the value wholesale
+- ``{"d": {key: delta}, "x": [keys]}``: change/add keys of an object and
+  remove others
+- ``{"l": {"d": {id: delta}, "a": [ids], "x": [ids], "o": [ids]}}``: change,
+  add (``a``, in order) and remove items of a list of objects keyed by their
+  ``"id"`` (the canvas' nodes and connections); ``o`` is only stored when
+  the items were reordered
+
+so the size of a delta follows the size of the change, not of the document.
+"""
+
+from typing import Any, Dict, List, Optional
+import hashlib
+import json
+
+
+def content_hash(document: Any) -> str:
+    """Hash of a document that ignores object key order"""
+    canonical = json.dumps(document, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def diff(old: Any, new: Any) -> Optional[Dict]:
+    """Delta turning ``old`` into ``new`` (None when they are equal)"""
+    if old == new:
+        return None
+    if isinstance(old, dict) and isinstance(new, dict):
+        changed = {}
+        for key, value in new.items():
+            if key not in old:
+                changed[key] = {"=": value}
+            else:
+                child = diff(old[key], value)
+                if child is not None:
+                    changed[key] = child
+        delta: Dict[str, Any] = {}
+        if changed:
+            delta["d"] = changed
+        removed = [key for key in old if key not in new]
+        if removed:
+            delta["x"] = removed
+        return delta
+    if isinstance(old, list) and isinstance(new, list):
+        delta = _diff_keyed_list(old, new)
+        if delta is not None:
+            return delta
+    return {"=": new}
+
+
+def apply(old: Any, delta: Dict) -> Any:
+    """Apply a delta from ``diff``.
+
+    Unchanged subtrees are shared with ``old`` rather than copied, so
+    neither document should be mutated afterwards.
+    """
+    if "=" in delta:
+        return delta["="]
+    if "l" in delta:
+        return _apply_keyed_list(old, delta["l"])
+    result = dict(old)
+    for key in delta.get("x", []):
+        result.pop(key, None)
+    for key, child in delta.get("d", {}).items():
+        result[key] = apply(result.get(key), child)
+    return result
+
+
+# Private helper functions
+def _keyed(items: List[Any]) -> Optional[Dict[str, Any]]:
+    index = {}
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get("id"), str):
+            return None
+        index[item["id"]] = item
+    return index if len(index) == len(items) else None
+
+
+def _diff_keyed_list(old: List[Any], new: List[Any]) -> Optional[Dict]:
+    old_index, new_index = _keyed(old), _keyed(new)
+    if old_index is None or new_index is None:
+        return None
+
+    changed, added = {}, []
+    for item_id, item in new_index.items():
+        if item_id not in old_index:
+            changed[item_id] = {"=": item}
+            added.append(item_id)
+        else:
+            child = diff(old_index[item_id], item)
+            if child is not None:
+                changed[item_id] = child
+    removed = [item_id for item_id in old_index if item_id not in new_index]
+
+    ops: Dict[str, Any] = {}
+    if changed:
+        ops["d"] = changed
+    if added:
+        ops["a"] = added
+    if removed:
+        ops["x"] = removed
+    kept = [item_id for item_id in old_index if item_id in new_index]
+    if kept + added != list(new_index):
+        ops["o"] = list(new_index)
+    return {"l": ops}
+
+
+def _apply_keyed_list(old: List[Any], ops: Dict) -> List[Any]:
+    index = {item["id"]: item for item in old}
+    changed = ops.get("d", {})
+    order = ops.get("o")
+    if order is None:
+        removed = set(ops.get("x", []))
+        order = [item_id for item_id in index if item_id not in removed] + ops.get("a", [])
+    return [
+        apply(index.get(item_id), changed[item_id]) if item_id in changed else index[item_id]
+        for item_id in order
+    ]
@@ -0,0 +1,126 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from functools import lru_cache
+import re
+import unicodedata
+import zlib
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+WEIGHTINGS = ("overlap", "idf", "bm25")
+
+
+@lru_cache(maxsize=8192)
+def tokenize(text: str) -> Tuple[str, ...]:
+    """Unicode-normalised, case-folded word tokens with punctuation stripped"""
+    return tuple(TOKEN_PATTERN.findall(unicodedata.normalize("NFKC", text).casefold()))
+
+
+class LexicalScorer:
+    """Batch lexical relevance of responses to their prompts.
+
+    Texts become rows of a hashed sparse bag-of-words matrix, so N pairs
+    are scored with a handful of sparse matrix operations. Weightings:
+
+    - ``overlap``: share of the prompt's distinct terms found in the response
+    - ``idf``: the same, with each term weighted by its IDF
+    - ``bm25``: BM25 score of the response for the prompt, divided by the
+      score of a response that saturates every prompt term (so it is in [0, 1])
+
+    IDF and average document length come from ``fit`` on a reference corpus;
+    unfitted, every term has IDF 1.
+    """
+
+    def __init__(self, n_features: int = 1 << 20, k1: float = 1.2, b: float = 0.75):
+        self.n_features = n_features
+        self.k1 = k1
+        self.b = b
+        self.idf: Optional[np.ndarray] = None
+        self.avg_length = 0.0
+
+    @property
+    def fitted(self) -> bool:
+        return self.idf is not None
+
+    def vectorize(self, texts: List[str]):
+        """Term-frequency matrix (len(texts) x n_features, CSR)"""
+        from scipy import sparse
+
+        # Number the distinct tokens of the batch, then hash each only once
+        vocabulary: Dict[str, int] = {}
+        lengths = np.empty(len(texts), dtype=np.int64)
+        token_ids: List[int] = []
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[row] = len(tokens)
+            token_ids.extend([vocabulary.setdefault(token, len(vocabulary)) for token in tokens])
+        # crc32 rather than hash(): stable across processes and restarts
+        features = np.fromiter(
+            (zlib.crc32(token.encode("utf-8")) % self.n_features for token in vocabulary),
+            dtype=np.int64,
+            count=len(vocabulary)
+        )
+        cols = features[np.asarray(token_ids, dtype=np.int64)]
+        rows = np.repeat(np.arange(len(texts)), lengths)
+        data = np.ones(len(cols), dtype=np.float32)
+        # Duplicate (row, col) entries are summed into term frequencies
+        return sparse.csr_matrix(
+            (data, (rows, cols)), shape=(len(texts), self.n_features)
+        )
+
+    def fit(self, corpus: Iterable[str]) -> "LexicalScorer":
+        """Fit IDF weights and average length on reference documents"""
+        tf = self.vectorize(list(corpus))
+        documents = tf.shape[0]
+        if documents == 0:
+            return self
+        # Document frequency: number of rows containing each feature
+        df = np.bincount(tf.indices, minlength=self.n_features)
+        # BM25 IDF with +1 inside the log so weights stay positive
+        self.idf = np.log1p((documents - df + 0.5) / (df + 0.5)).astype(np.float32)
+        self.avg_length = float(tf.sum()) / documents
+        return self
+
+    def score(
+        self,
+        prompts: List[str],
+        responses: List[str],
+        weighting: str = "overlap"
+    ) -> np.ndarray:
+        """Relevance in [0, 1] of ``responses[i]`` to ``prompts[i]``"""
+        if weighting not in WEIGHTINGS:
+            raise ValueError(f"Unknown relevance weighting: {weighting}")
+        if len(prompts) != len(responses):
+            raise ValueError("prompts and responses must have the same length")
+        if not prompts:
+            return np.zeros(0, dtype=np.float32)
+
+        query = self.vectorize(prompts)
+        query.data[:] = 1  # distinct prompt terms
+        if weighting != "overlap" and self.idf is not None:
+            query = query.multiply(self.idf[np.newaxis, :]).tocsr()
+        document = self.vectorize(responses)
+
+        if weighting == "bm25":
+            lengths = np.asarray(document.sum(axis=1)).ravel()
+            avg_length = self.avg_length or max(float(lengths.mean()), 1.0)
+            norm = self.k1 * (1 - self.b + self.b * lengths / avg_length)
+            # Saturate term frequencies row by row: tf * (k1 + 1) / (tf + norm)
+            row_norm = np.repeat(norm, np.diff(document.indptr))
+            document.data = document.data * (self.k1 + 1) / (document.data + row_norm)
+            best = np.asarray(query.sum(axis=1)).ravel() * (self.k1 + 1)
+        else:
+            document.data[:] = 1
+            best = np.asarray(query.sum(axis=1)).ravel()
+
+        matched = np.asarray(query.multiply(document).sum(axis=1)).ravel()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scores = np.where(best > 0, matched / best, 0.0)
+        return np.clip(scores, 0.0, 1.0)
+
+
+def load_corpus(path: str) -> List[str]:
+    """Reference documents, one per line"""
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
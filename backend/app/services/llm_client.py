@@ -0,0 +1,95 @@
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.core.config import settings
+
+
+class LLMClient:
+    """Thin async wrapper over the configured LLM provider.
+
+    Uses OpenAI when ``OPENAI_API_KEY`` is set and falls back to a mock
+    completion for development, mirroring PromptFlowService's mock execution.
+    """
+
+    def __init__(self, api_key: Optional[str] = None):
+        self.api_key = api_key if api_key is not None else settings.OPENAI_API_KEY
+        self._client: Any = None
+
+    @property
+    def client(self) -> Any:
+        if self._client is None and self.api_key:
+            from openai import AsyncOpenAI
+            self._client = AsyncOpenAI(api_key=self.api_key)
+        return self._client
+
+    @property
+    def mock(self) -> bool:
+        """Whether completions are mocked (no API key configured)"""
+        return not self.api_key
+
+    async def complete(
+        self,
+        prompt: str,
+        model: str = "gpt-3.5-turbo",
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        on_token: Optional[Callable[[str], None]] = None
+    ) -> Tuple[str, Dict[str, int]]:
+        """Return the completion text and token usage.
+
+        With ``on_token`` the completion is streamed and each text delta is
+        passed to the callback as it arrives.
+        """
+        if self.mock:
+            text = f"Mock completion for: {prompt}"
+            if on_token is not None:
+                for i, word in enumerate(text.split(" ")):
+                    on_token(word if i == 0 else " " + word)
+            return text, {
+                "prompt_tokens": len(prompt.split()),
+                "completion_tokens": len(text.split())
+            }
+
+        if on_token is not None:
+            return await self._stream(prompt, model, temperature, max_tokens, on_token)
+
+        response = await self.client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+        usage = response.usage
+        return response.choices[0].message.content or "", {
+            "prompt_tokens": usage.prompt_tokens if usage else 0,
+            "completion_tokens": usage.completion_tokens if usage else 0
+        }
+
+    async def _stream(
+        self,
+        prompt: str,
+        model: str,
+        temperature: float,
+        max_tokens: Optional[int],
+        on_token: Callable[[str], None]
+    ) -> Tuple[str, Dict[str, int]]:
+        stream = await self.client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        parts = []
+        usage = None
+        async for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                delta = chunk.choices[0].delta.content
+                parts.append(delta)
+                on_token(delta)
+        return "".join(parts), {
+            "prompt_tokens": usage.prompt_tokens if usage else 0,
+            "completion_tokens": usage.completion_tokens if usage else 0
+        }
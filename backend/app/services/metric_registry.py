@@ -0,0 +1,225 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+from dataclasses import dataclass
+import asyncio
+import inspect
+
+import numpy as np
+
+from app.schemas.evaluation import EvaluationPair
+
+# Cost classes: what a metric spends its time on
+CPU = "cpu"
+EMBEDDING = "embedding"
+LLM_JUDGE = "llm_judge"
+COST_CLASSES = (CPU, EMBEDDING, LLM_JUDGE)
+
+PAIR_FIELDS = tuple(EvaluationPair.model_fields)
+TEXT_FIELDS = ("prompt", "response", "expected_output")
+
+Embedder = Callable[[List[str]], Awaitable[np.ndarray]]
+
+
+@dataclass(frozen=True)
+class MetricSpec:
+    """A metric the evaluator can compute.
+
+    ``compute`` (sync or async) receives the pairs that have every field in
+    ``inputs`` plus the shared ``MetricContext``. When ``batched`` it takes
+    the whole list and returns one score per pair; otherwise it is called
+    once per pair and the calls run concurrently. ``attribute`` names the
+    ``EvaluationMetrics`` field to fill; other metrics go to
+    ``custom_metrics``. ``default`` replaces the scores of a metric that fails.
+    """
+    name: str
+    compute: Callable[..., Any]
+    inputs: Tuple[str, ...] = ("prompt", "response")
+    cost_class: str = CPU
+    batched: bool = True
+    attribute: Optional[str] = None
+    default: Optional[float] = None
+    description: str = ""
+
+
+class MetricContext:
+    """Work shared by the metrics of one evaluation batch"""
+
+    def __init__(self, pairs: List[EvaluationPair], embed: Optional[Embedder] = None):
+        self.pairs = pairs
+        self._embed = embed
+        self._rows: Dict[str, int] = {}
+        self._matrix: Optional[asyncio.Task] = None
+
+    def prefetch(self, texts: List[str]):
+        """Start one encode call for every text the embedding metrics need"""
+        for text in texts:
+            self._rows.setdefault(text, len(self._rows))
+        if self._rows and self._embed is not None:
+            self._matrix = asyncio.ensure_future(self._embed(list(self._rows)))
+
+    async def embeddings(self, texts: List[str]) -> np.ndarray:
+        """L2-normalised embedding rows for ``texts``"""
+        if self._embed is None:
+            raise RuntimeError("No embedder configured for embedding metrics")
+        if self._matrix is None or any(text not in self._rows for text in texts):
+            # Not planned ahead: encode directly (still cached by the embedder)
+            return await self._embed(texts)
+        matrix = await asyncio.shield(self._matrix)
+        return matrix[[self._rows[text] for text in texts]]
+
+    def close(self):
+        if self._matrix is None:
+            return
+        if not self._matrix.done():
+            self._matrix.cancel()
+        elif not self._matrix.cancelled():
+            self._matrix.exception()  # already reported by the metrics that used it
+
+
+class MetricRegistry:
+    """Named metric plugins"""
+
+    def __init__(self):
+        self._specs: Dict[str, MetricSpec] = {}
+
+    def register(self, spec: MetricSpec, replace: bool = False):
+        if spec.cost_class not in COST_CLASSES:
+            raise ValueError(f"Unknown cost class: {spec.cost_class}")
+        unknown = sorted(set(spec.inputs) - set(PAIR_FIELDS))
+        if unknown:
+            raise ValueError(f"Unknown metric inputs: {', '.join(unknown)}")
+        if spec.name in self._specs and not replace:
+            raise ValueError(f"Metric already registered: {spec.name}")
+        self._specs[spec.name] = spec
+
+    def unregister(self, name: str):
+        self._specs.pop(name, None)
+
+    def get(self, name: str) -> MetricSpec:
+        if name not in self._specs:
+            raise KeyError(f"Unknown metric: {name}")
+        return self._specs[name]
+
+    def specs(self, names: Optional[Sequence[str]] = None) -> List[MetricSpec]:
+        if names is None:
+            return list(self._specs.values())
+        return [self.get(name) for name in names]
+
+    def describe(self) -> List[Dict]:
+        return [
+            {
+                "name": spec.name,
+                "inputs": list(spec.inputs),
+                "cost_class": spec.cost_class,
+                "batched": spec.batched,
+                "attribute": spec.attribute,
+                "description": spec.description
+            }
+            for spec in self._specs.values()
+        ]
+
+
+class MetricEvaluator:
+    """Plans and runs a set of metrics over a batch of pairs.
+
+    Texts needed by embedding metrics are encoded in a single call before
+    any metric starts, every metric runs concurrently with the others, and
+    LLM-judge calls are capped at ``judge_concurrency``. A failing metric
+    gets its ``default`` scores unless the error type is in ``propagate``.
+    """
+
+    def __init__(
+        self,
+        registry: MetricRegistry,
+        embed: Optional[Embedder] = None,
+        judge_concurrency: int = 8,
+        propagate: Tuple[type, ...] = ()
+    ):
+        self.registry = registry
+        self.embed = embed
+        self.judge_concurrency = judge_concurrency
+        self.propagate = propagate
+
+    def plan(self, pairs: List[EvaluationPair], specs: List[MetricSpec]) -> Dict:
+        """Pairs each metric applies to and the texts to embed up front"""
+        applicable = {
+            spec.name: [
+                i for i, pair in enumerate(pairs)
+                if all(getattr(pair, name) is not None for name in spec.inputs)
+            ]
+            for spec in specs
+        }
+        texts: Dict[str, None] = {}
+        for spec in specs:
+            if spec.cost_class != EMBEDDING:
+                continue
+            for i in applicable[spec.name]:
+                for name in spec.inputs:
+                    if name in TEXT_FIELDS:
+                        texts[getattr(pairs[i], name)] = None
+        return {"applicable": applicable, "texts": list(texts)}
+
+    async def evaluate(
+        self,
+        pairs: List[EvaluationPair],
+        names: Optional[Sequence[str]] = None
+    ) -> Dict[str, List[Optional[float]]]:
+        """Scores per metric name, aligned with ``pairs`` (None if not applicable)"""
+        specs = self.registry.specs(names)
+        plan = self.plan(pairs, specs)
+        context = MetricContext(pairs, self.embed)
+        context.prefetch(plan["texts"])
+        judges = asyncio.Semaphore(self.judge_concurrency)
+        try:
+            scores = await asyncio.gather(*(
+                self._run(spec, [pairs[i] for i in plan["applicable"][spec.name]], context, judges)
+                for spec in specs
+            ))
+        finally:
+            context.close()
+
+        results = {}
+        for spec, values in zip(specs, scores):
+            column: List[Optional[float]] = [None] * len(pairs)
+            for i, value in zip(plan["applicable"][spec.name], values):
+                column[i] = None if value is None else float(value)
+            results[spec.name] = column
+        return results
+
+    # Private helper methods
+    async def _run(
+        self,
+        spec: MetricSpec,
+        pairs: List[EvaluationPair],
+        context: MetricContext,
+        judges: asyncio.Semaphore
+    ) -> Sequence[Optional[float]]:
+        if not pairs:
+            return []
+        try:
+            if spec.batched:
+                return await self._call(spec, pairs, context)
+
+            async def one(pair: EvaluationPair):
+                if spec.cost_class == LLM_JUDGE:
+                    async with judges:
+                        return await self._call(spec, pair, context)
+                return await self._call(spec, pair, context)
+
+            return await asyncio.gather(*(one(pair) for pair in pairs))
+        except self.propagate:
+            raise
+        except Exception as e:
+            print(f"Warning: metric {spec.name} failed: {e}")
+            return [spec.default] * len(pairs)
+
+    async def _call(self, spec: MetricSpec, argument: Any, context: MetricContext) -> Any:
+        if inspect.iscoroutinefunction(spec.compute):
+            return await spec.compute(argument, context)
+        if spec.cost_class == CPU and isinstance(argument, list) and len(argument) > 256:
+            # Large CPU batches run off the event loop
+            result = await asyncio.to_thread(spec.compute, argument, context)
+        else:
+            result = spec.compute(argument, context)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
@@ -0,0 +1,127 @@
+from typing import Dict, List, Optional, Set, Tuple
+import asyncio
+
+import numpy as np
+
+from app.services.inference_worker import InferenceWorker, InferenceQueueFull
+
+
+class MicroBatcher:
+    """Dynamic batching in front of an ``InferenceWorker``.
+
+    Concurrent ``encode`` calls are collected for up to ``window_ms`` (or
+    until ``max_batch_size`` texts have arrived), de-duplicated, sent through
+    the model in a single call, and each caller receives its own rows.
+    """
+
+    def __init__(
+        self,
+        worker: InferenceWorker,
+        window_ms: float = 5.0,
+        max_batch_size: int = 64,
+        max_pending: int = 64
+    ):
+        self.worker = worker
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.max_pending = max_pending
+        self.batches = 0
+        self.batched_requests = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: Set[asyncio.Task] = set()
+        self._pending = 0
+
+    async def encode(self, texts: List[str]) -> np.ndarray:
+        """Encode texts as part of the next micro-batch"""
+        if self._pending >= self.max_pending:
+            raise InferenceQueueFull(
+                f"Inference queue is full ({self.max_pending} pending requests)"
+            )
+
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self._pending += 1
+        self._queue.put_nowait((list(texts), future))
+        return await future
+
+    def stats(self) -> Dict:
+        return {
+            "pending_requests": self._pending,
+            "batches": self.batches,
+            "batched_requests": self.batched_requests,
+            "mean_batch_requests": (
+                self.batched_requests / self.batches if self.batches else 0.0
+            )
+        }
+
+    async def close(self):
+        """Stop collecting and fail any requests still waiting"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        while self._queue is not None and not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Micro-batcher is closed"))
+            self._pending -= 1
+
+    # Private helper methods
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._collect())
+
+    async def _collect(self):
+        """Gather requests into batches and hand them to the worker"""
+        loop = asyncio.get_running_loop()
+        while True:
+            first = await self._queue.get()
+            batch = [first]
+            size = len(first[0])
+            deadline = loop.time() + self.window
+
+            while size < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            # Dispatch without blocking collection of the next batch
+            task = asyncio.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch: List[Tuple[List[str], asyncio.Future]]):
+        """Run one model call for the batch and scatter rows to callers"""
+        text_index: Dict[str, int] = {}
+        for texts, _ in batch:
+            for text in texts:
+                text_index.setdefault(text, len(text_index))
+
+        self.batches += 1
+        self.batched_requests += len(batch)
+        try:
+            embeddings = await self.worker.encode(list(text_index))
+        except asyncio.CancelledError:
+            for _, future in batch:
+                future.cancel()
+            raise
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for texts, future in batch:
+                if not future.done():
+                    future.set_result(embeddings[[text_index[t] for t in texts]])
+        finally:
+            self._pending -= len(batch)
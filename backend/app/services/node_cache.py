@@ -0,0 +1,150 @@
+from typing import Any, Dict, Optional
+from collections import OrderedDict
+import hashlib
+import json
+import time
+
+from app.core.config import settings
+
+# Config keys that control execution but not what a node computes
+_EXECUTION_KEYS = {"cache", "timeout"}
+
+
+def node_cache_key(node_type: str, config: Dict, inputs: Dict) -> str:
+    """``node:<definition hash>:<inputs hash>`` for a node and its resolved inputs"""
+    definition = {
+        "type": node_type,
+        "config": {k: v for k, v in config.items() if k not in _EXECUTION_KEYS}
+    }
+    return "node:{}:{}".format(_digest(definition), _digest(inputs))
+
+
+def _digest(value: Any) -> str:
+    canonical = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class NodeCache:
+    """Memoized node outputs, stored as JSON with a TTL"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        value = await self._get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: str, ttl: float):
+        await self._set(key, value, ttl)
+
+    def stats(self) -> Dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+    async def close(self):
+        pass
+
+    # Backend operations
+    async def _get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    async def _set(self, key: str, value: str, ttl: float):
+        raise NotImplementedError
+
+
+class MemoryNodeCache(NodeCache):
+    """In-process LRU with per-entry expiry"""
+
+    def __init__(self, max_entries: int = 10_000):
+        super().__init__()
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, value)
+
+    async def _get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    async def _set(self, key: str, value: str, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        return {**super().stats(), "entries": len(self._entries)}
+
+
+class FakeRedis:
+    """In-memory stand-in for the part of redis.asyncio's client used here.
+
+    Supports ``get``, ``set(..., ex=)`` with expiry and ``aclose``, so the
+    Redis backend can run in tests and local setups without a server. Not
+    shared between processes.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, tuple] = {}  # key -> (expires_at or None, value)
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        return entry[1]
+
+    async def set(self, key: str, value: str, ex: Optional[float] = None):
+        self._entries[key] = (None if ex is None else time.monotonic() + ex, value)
+        return True
+
+    async def aclose(self):
+        self._entries.clear()
+
+
+class RedisNodeCache(NodeCache):
+    """Redis backend shared across API processes.
+
+    ``client`` may be any object with redis.asyncio's ``get``/``set``
+    interface; by default one is created from ``url``, and a ``memory://``
+    URL uses ``FakeRedis`` (no server, not shared).
+    """
+
+    def __init__(self, url: str, client: Any = None):
+        super().__init__()
+        if client is None and url.startswith("memory://"):
+            client = FakeRedis()
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.from_url(url, decode_responses=True)
+        self.client = client
+
+    async def _get(self, key: str) -> Optional[str]:
+        return await self.client.get(key)
+
+    async def _set(self, key: str, value: str, ttl: float):
+        await self.client.set(key, value, ex=max(1, int(ttl)))
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def create_node_cache() -> Optional[NodeCache]:
+    """Build the node cache configured in Settings (None when disabled)"""
+    if settings.NODE_CACHE_BACKEND == "none":
+        return None
+    if settings.NODE_CACHE_BACKEND == "memory":
+        return MemoryNodeCache(settings.NODE_CACHE_MAX_ENTRIES)
+    if settings.NODE_CACHE_BACKEND == "redis":
+        return RedisNodeCache(settings.REDIS_URL)
+    raise ValueError(f"Unknown node cache backend: {settings.NODE_CACHE_BACKEND}")
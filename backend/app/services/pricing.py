@@ -0,0 +1,202 @@
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from dataclasses import dataclass
+from datetime import date, datetime
+import bisect
+import json
+
+import numpy as np
+
+from app.core.config import settings
+
+
+@dataclass(frozen=True)
+class ModelPrice:
+    """USD per 1K tokens from ``effective_from`` until the next price"""
+    effective_from: date
+    prompt: float
+    completion: float
+
+
+DEFAULT_PRICES: Dict[str, List[ModelPrice]] = {
+    "gpt-4": [ModelPrice(date(2023, 3, 14), 0.03, 0.06)],
+    "gpt-4-32k": [ModelPrice(date(2023, 3, 14), 0.06, 0.12)],
+    "gpt-4-turbo": [ModelPrice(date(2023, 11, 6), 0.01, 0.03)],
+    "gpt-4o": [
+        ModelPrice(date(2024, 5, 13), 0.005, 0.015),
+        ModelPrice(date(2024, 8, 6), 0.0025, 0.01),
+    ],
+    "gpt-4o-mini": [ModelPrice(date(2024, 7, 18), 0.00015, 0.0006)],
+    "gpt-3.5-turbo": [
+        ModelPrice(date(2023, 3, 1), 0.002, 0.002),
+        ModelPrice(date(2023, 11, 6), 0.001, 0.002),
+        ModelPrice(date(2024, 1, 25), 0.0005, 0.0015),
+    ],
+}
+
+# Unknown models are priced like GPT-4 so costs are never underestimated
+DEFAULT_MODEL = "gpt-4"
+
+When = Optional[Union[date, datetime]]
+
+
+class PricingTable:
+    """Per-model prompt/completion rates with effective dates.
+
+    Dated model variants (``gpt-4o-2024-05-13``) use the longest known
+    prefix; anything else uses ``default_model``. Costs are for the price in
+    effect on the given day (today by default).
+    """
+
+    def __init__(
+        self,
+        prices: Dict[str, List[ModelPrice]],
+        default_model: str = DEFAULT_MODEL
+    ):
+        if default_model not in prices:
+            raise ValueError(f"Default model has no price: {default_model}")
+        self.prices = {
+            model: sorted(history, key=lambda price: price.effective_from)
+            for model, history in prices.items() if history
+        }
+        self.default_model = default_model
+        self._by_length = sorted(self.prices, key=len, reverse=True)
+        self._resolved: Dict[str, str] = {}
+        self._dates = {
+            model: np.array([p.effective_from for p in history], dtype="datetime64[D]")
+            for model, history in self.prices.items()
+        }
+
+    @classmethod
+    def from_file(cls, path: str) -> "PricingTable":
+        """Defaults overridden per model by a JSON file of the form
+        ``{"model": [{"effective_from": "2024-01-01", "prompt": 0.01,
+        "completion": 0.03}]}`` (USD per 1K tokens); ``"default_model"``
+        may name the fallback model.
+        """
+        with open(path) as f:
+            data = json.load(f)
+        default_model = data.pop("default_model", DEFAULT_MODEL)
+        prices = dict(DEFAULT_PRICES)
+        for model, history in data.items():
+            prices[model] = [
+                ModelPrice(
+                    date.fromisoformat(entry["effective_from"]),
+                    float(entry["prompt"]),
+                    float(entry["completion"])
+                )
+                for entry in history
+            ]
+        return cls(prices, default_model)
+
+    def resolve(self, model: Optional[str]) -> str:
+        """Name of the priced model used for ``model``"""
+        if not model:
+            return self.default_model
+        resolved = self._resolved.get(model)
+        if resolved is None:
+            resolved = self.default_model
+            if model in self.prices:
+                resolved = model
+            else:
+                # Longest known prefix wins, so gpt-4o-mini-x doesn't match gpt-4o
+                for name in self._by_length:
+                    if model.startswith(name + "-"):
+                        resolved = name
+                        break
+            self._resolved[model] = resolved
+        return resolved
+
+    def rates(self, model: Optional[str], at: When = None) -> Tuple[float, float]:
+        """(prompt, completion) USD per 1K tokens in effect at ``at``"""
+        history = self.prices[self.resolve(model)]
+        day = _day(at)
+        # Before the first known price, the first price applies
+        index = max(bisect.bisect_right([p.effective_from for p in history], day) - 1, 0)
+        return history[index].prompt, history[index].completion
+
+    def cost(self, model: Optional[str], token_counts: Dict[str, int], at: When = None) -> float:
+        """Estimated USD cost of one call from its token usage"""
+        prompt_rate, completion_rate = self.rates(model, at)
+        return (
+            token_counts.get("prompt_tokens", 0) * prompt_rate
+            + token_counts.get("completion_tokens", 0) * completion_rate
+        ) / 1000
+
+    def costs(
+        self,
+        models: Sequence[Optional[str]],
+        prompt_tokens: Sequence[float],
+        completion_tokens: Sequence[float],
+        at: Optional[Sequence[When]] = None
+    ) -> np.ndarray:
+        """Costs of many calls at once (one rate lookup per distinct model)"""
+        prompt_tokens = np.asarray(prompt_tokens, dtype=np.float64)
+        completion_tokens = np.asarray(completion_tokens, dtype=np.float64)
+        prompt_rates = np.empty(len(prompt_tokens))
+        completion_rates = np.empty(len(prompt_tokens))
+        days = (
+            np.full(len(prompt_tokens), np.datetime64(_day(None), "D"))
+            if at is None else np.array([_day(when) for when in at], dtype="datetime64[D]")
+        )
+
+        # Number the distinct model names, then resolve each only once
+        codes: Dict[Optional[str], int] = {}
+        inverse = np.fromiter(
+            (codes.setdefault(model, len(codes)) for model in models),
+            dtype=np.int64,
+            count=len(prompt_tokens)
+        )
+        groups: Dict[str, List[int]] = {}
+        for name, code in codes.items():
+            groups.setdefault(self.resolve(name), []).append(code)
+        for model, group_codes in groups.items():
+            rows = np.isin(inverse, group_codes)
+            history = self.prices[model]
+            index = np.searchsorted(self._dates[model], days[rows], side="right") - 1
+            index = np.maximum(index, 0)
+            prompt_rates[rows] = np.array([p.prompt for p in history])[index]
+            completion_rates[rows] = np.array([p.completion for p in history])[index]
+        return (prompt_tokens * prompt_rates + completion_tokens * completion_rates) / 1000
+
+    def describe(self) -> Dict:
+        return {
+            "default_model": self.default_model,
+            "models": {
+                model: [
+                    {
+                        "effective_from": price.effective_from.isoformat(),
+                        "prompt": price.prompt,
+                        "completion": price.completion
+                    }
+                    for price in history
+                ]
+                for model, history in self.prices.items()
+            }
+        }
+
+
+def _day(when: When) -> date:
+    if when is None:
+        return date.today()
+    if isinstance(when, datetime):
+        return when.date()
+    return when
+
+
+_pricing_table: Optional[PricingTable] = None
+
+
+def get_pricing_table() -> PricingTable:
+    """The pricing table configured in Settings (loaded once)"""
+    global _pricing_table
+    if _pricing_table is None:
+        if settings.PRICING_FILE:
+            _pricing_table = PricingTable.from_file(settings.PRICING_FILE)
+        else:
+            _pricing_table = PricingTable(DEFAULT_PRICES)
+    return _pricing_table
+
+
+def estimate_cost(model: Optional[str], token_counts: Dict[str, int], at: When = None) -> float:
+    """Estimated USD cost of one call from its token usage"""
+    return get_pricing_table().cost(model, token_counts, at)
@@ -1,30 +1,82 @@
-from typing import Dict, List, Any
+from typing import AsyncIterator, Dict, List, Any, Optional
+from datetime import datetime
 import asyncio
-import yaml
-import tempfile
-import os
-from pathlib import Path
+import importlib.util
+import time
+
+from app.core.config import settings
+from app.services.dag_executor import DagExecutor
+from app.services.flow_cache import CompiledFlowCache
+from app.services.flow_validator import validate_flow_graph
+from app.services.flow_worker_pool import (
+    FlowQueueFull, FlowWorkerPool, python_node_worker_main
+)
+from app.services.llm_client import LLMClient
+from app.services.node_cache import create_node_cache
+from app.services.semantic_cache import Embedder, create_semantic_cache
+from app.services.tracing import Span, create_tracer, new_trace_id
 
 class PromptFlowService:
-    def __init__(self):
-        try:
-            from promptflow import PFClient
-            self.pf_client = PFClient()
-        except ImportError:
-            self.pf_client = None
-            print("Warning: promptflow not installed, using mock execution")
+    def __init__(self, embed: Optional[Embedder] = None):
+        self._promptflow_available: Optional[bool] = None
+        # PFClient runs in worker processes, never on the event loop
+        self.worker_pool = FlowWorkerPool(
+            size=settings.PF_WORKERS,
+            max_jobs_per_worker=settings.PF_WORKER_MAX_JOBS,
+            job_timeout=settings.PF_JOB_TIMEOUT_S,
+            max_queue=settings.PF_MAX_QUEUE
+        )
+        self.flow_cache = CompiledFlowCache(
+            root=settings.FLOW_CACHE_DIR or None,
+            max_entries=settings.FLOW_CACHE_MAX_ENTRIES
+        )
+        self.tracer = create_tracer()
+        self.dag_executor = DagExecutor(
+            LLMClient(),
+            max_concurrency=settings.FLOW_MAX_CONCURRENCY,
+            node_timeout=settings.FLOW_NODE_TIMEOUT_S,
+            node_cache=create_node_cache(),
+            cache_ttl=settings.NODE_CACHE_TTL_S,
+            semantic_cache=create_semantic_cache(embed),
+            tracer=self.tracer,
+            # Flow authors' python code runs in killable worker processes
+            python_pool=FlowWorkerPool(
+                size=settings.PYTHON_NODE_WORKERS,
+                max_jobs_per_worker=settings.PYTHON_NODE_WORKER_MAX_JOBS,
+                job_timeout=settings.FLOW_NODE_TIMEOUT_S,
+                max_queue=settings.PYTHON_NODE_MAX_QUEUE,
+                target=python_node_worker_main
+            )
+        )
+    
+    @property
+    def promptflow_available(self) -> bool:
+        """Whether promptflow is installed (checked without importing it)"""
+        if self._promptflow_available is None:
+            self._promptflow_available = importlib.util.find_spec("promptflow") is not None
+            if not self._promptflow_available:
+                print("Warning: promptflow not installed, using mock execution")
+        return self._promptflow_available
     
     async def create_flow_definition(self, nodes: List[Dict], connections: List[Dict]) -> Dict:
         """Convert UI nodes/connections to Prompt Flow format"""
         flow_definition = {
-            "nodes": self._convert_nodes(nodes),
+            "nodes": self._convert_nodes(nodes, connections),
             "node_variants": {},
             "environment_variables": {}
         }
         return flow_definition
     
-    def _convert_nodes(self, ui_nodes: List[Dict]) -> List[Dict]:
+    def _convert_nodes(self, ui_nodes: List[Dict], connections: List[Dict]) -> List[Dict]:
         """Convert UI node format to Prompt Flow node format"""
+        # Each connection becomes a ${source.output} reference on its target
+        references: Dict[str, Dict[str, str]] = {}
+        for connection in connections:
+            source = connection["source"]
+            references.setdefault(connection["target"], {})[
+                connection.get("targetHandle") or source
+            ] = f"${{{source}.output}}"
+        
         pf_nodes = []
         for node in ui_nodes:
             pf_node = {
@@ -34,55 +86,144 @@ class PromptFlowService:
                     "type": "code" if node["type"] == "python" else "package",
                     "path": node.get("source_path", "")
                 },
-                "inputs": node.get("inputs", {}),
+                "inputs": {**node.get("inputs", {}), **references.get(node["id"], {})},
                 "use_variants": False
             }
             pf_nodes.append(pf_node)
         return pf_nodes
     
-    async def execute_flow(self, flow_config: Dict, inputs: Dict) -> Dict:
-        """Execute a flow with given inputs"""
-        if not self.pf_client:
+    async def close(self):
+        await self.worker_pool.close()
+        await self.dag_executor.python_pool.close()
+        self.flow_cache.close()
+        if self.dag_executor.node_cache is not None:
+            await self.dag_executor.node_cache.close()
+        if self.dag_executor.semantic_cache is not None:
+            await self.dag_executor.semantic_cache.close()
+        self.tracer.shutdown()
+    
+    async def run(
+        self,
+        flow_config: Dict,
+        inputs: Dict,
+        flow_id: Optional[int] = None,
+        updated_at: Optional[datetime] = None
+    ) -> Dict:
+        """Execute a stored flow with the engine configured in Settings"""
+        if settings.FLOW_ENGINE == "promptflow":
+            return await self.execute_flow(
+                flow_config["pf_config"], inputs, flow_id=flow_id, updated_at=updated_at
+            )
+        return await self.execute_dag(
+            flow_config["nodes"], flow_config.get("connections", []), inputs, flow_id=flow_id
+        )
+    
+    async def stream(
+        self,
+        flow_config: Dict,
+        inputs: Dict,
+        flow_id: Optional[int] = None,
+        updated_at: Optional[datetime] = None
+    ) -> AsyncIterator[Dict]:
+        """Execute a stored flow, yielding progress events as they happen.
+        
+        With the native engine this includes node_start/node_end events and
+        LLM tokens; the last event is ``result`` (outputs and metrics) or
+        ``error``.
+        """
+        if settings.FLOW_ENGINE == "promptflow":
+            result = await self.execute_flow(
+                flow_config["pf_config"], inputs, flow_id=flow_id, updated_at=updated_at
+            )
+            if "error" in result:
+                yield {"event": "error", "detail": result["error"]}
+            else:
+                yield {"event": "result", **result}
+            return
+        
+        events: asyncio.Queue = asyncio.Queue()
+        execution = asyncio.create_task(self.dag_executor.execute(
+            flow_config["nodes"],
+            flow_config.get("connections", []),
+            inputs,
+            emit=lambda event, data: events.put_nowait({"event": event, **data}),
+            flow_id=flow_id
+        ))
+        execution.add_done_callback(lambda _: events.put_nowait(None))
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                yield event
+            
+            try:
+                result = execution.result()
+            except Exception as e:
+                yield {"event": "error", "detail": str(e)}
+            else:
+                yield {"event": "result", **result}
+        finally:
+            # Client went away: stop the flow rather than finishing it unseen
+            if not execution.done():
+                execution.cancel()
+                await asyncio.gather(execution, return_exceptions=True)
+    
+    async def execute_dag(
+        self,
+        nodes: List[Dict],
+        connections: List[Dict],
+        inputs: Dict,
+        flow_id: Optional[int] = None
+    ) -> Dict:
+        """Execute UI nodes/connections with the native DAG executor"""
+        try:
+            return await self.dag_executor.execute(nodes, connections, inputs, flow_id=flow_id)
+        except Exception as e:
+            return {"error": str(e)}
+    
+    async def execute_flow(
+        self,
+        flow_config: Dict,
+        inputs: Dict,
+        flow_id: Optional[int] = None,
+        updated_at: Optional[datetime] = None
+    ) -> Dict:
+        """Execute a flow with given inputs on the Prompt Flow worker pool"""
+        if not self.promptflow_available:
             # Mock execution for development
             return {
                 "outputs": {"result": "Mock execution result"},
-                "metrics": {"duration": 1.5, "tokens": 150}
+                "metrics": {"duration": 1.5, "tokens": 150, "mock": True}
             }
         
+        started = time.perf_counter()
+        span = Span("flow", new_trace_id(), attributes={"flow.engine": "promptflow"})
         try:
-            # Create temporary flow directory
-            with tempfile.TemporaryDirectory() as temp_dir:
-                flow_path = Path(temp_dir) / "flow"
-                flow_path.mkdir()
-                
-                # Write flow.dag.yaml
-                flow_yaml = flow_path / "flow.dag.yaml"
-                with open(flow_yaml, 'w') as f:
-                    yaml.dump(flow_config, f)
-                
-                # Execute flow
-                result = self.pf_client.test(flow=str(flow_path), inputs=inputs)
-                return {
-                    "outputs": result,
-                    "metrics": {"duration": 1.0}  # Add actual metrics
-                }
+            # Reuse the materialized flow directory unless the flow changed
+            with self.flow_cache.lease(flow_config, flow_id, updated_at) as compiled:
+                result = await self.worker_pool.run(str(compiled.path), inputs)
+        except FlowQueueFull:
+            raise
         except Exception as e:
+            span.end(str(e))
+            await self.tracer.export([span])
             return {"error": str(e)}
-    
-    async def validate_flow(self, flow_config: Dict) -> Dict:
-        """Validate flow configuration"""
-        errors = []
-        warnings = []
-        
-        # Basic validation
-        if not flow_config.get("nodes"):
-            errors.append("Flow must have at least one node")
         
-        # Check for circular dependencies
-        # Add more validation logic here
-        
-        return {
-            "valid": len(errors) == 0,
-            "errors": errors,
-            "warnings": warnings
+        metrics = {
+            "trace_id": span.trace_id,
+            "duration": time.perf_counter() - started,
+            "queue_wait": result["queue_wait"],
+            "exec_time": result["exec_time"]
         }
+        span.attributes.update((f"flow.{name}", value) for name, value in metrics.items())
+        span.end()
+        await self.tracer.export([span])
+        return {"outputs": result["outputs"], "metrics": metrics}
+    
+    async def validate_flow(self, nodes: List[Dict], connections: List[Dict]) -> Dict:
+        """Validate UI nodes/connections before they are saved or executed"""
+        node_types = None
+        if settings.FLOW_ENGINE != "promptflow":
+            node_types = self.dag_executor.runners.keys()
+        return validate_flow_graph(nodes, connections, node_types)
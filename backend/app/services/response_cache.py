@@ -0,0 +1,54 @@
+from typing import Any, Awaitable, Callable, Dict, Hashable
+from collections import OrderedDict
+import asyncio
+import time
+
+
+class ResponseCache:
+    """Short-lived results of read endpoints, computed once per key.
+
+    Concurrent callers of a key that is not cached share a single
+    computation (single-flight), and its result is then served to everyone
+    for ``ttl_s`` seconds, so many clients polling the same view cost one
+    computation per TTL. Failures are not cached.
+    """
+
+    def __init__(self, ttl_s: float = 2.0, max_entries: int = 1024):
+        self.ttl = ttl_s
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def get_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            # A task of its own, so a caller going away doesn't cancel it for the others
+            task = self._inflight[key] = asyncio.ensure_future(compute())
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.hits += 1
+        return await asyncio.shield(task)
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def stats(self) -> Dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+    # Private helper methods
+    def _finish(self, key: Hashable, task: asyncio.Future):
+        del self._inflight[key]
+        if task.cancelled() or task.exception() is not None or self.ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, task.result())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
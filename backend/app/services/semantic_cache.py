@@ -0,0 +1,253 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from datetime import datetime
+import asyncio
+import hashlib
+import json
+import uuid
+
+import numpy as np
+
+from app.core.config import settings
+
+Embedder = Callable[[List[str]], Awaitable[np.ndarray]]
+
+
+class SemanticIndex:
+    """Nearest-neighbour store of (prompt embedding -> cached completion).
+
+    Entries are partitioned by scope so a completion is only ever reused for
+    the same node and model. Vectors are expected to be L2-normalised, so
+    the inner product is the cosine similarity.
+    """
+
+    async def search(
+        self,
+        scope: str,
+        vector: np.ndarray,
+        threshold: float
+    ) -> Optional[Tuple[float, Dict]]:
+        """Best match at or above ``threshold`` as (similarity, payload)"""
+        raise NotImplementedError
+
+    async def add(self, scope: str, vector: np.ndarray, payload: Dict):
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        return {}
+
+    async def close(self):
+        pass
+
+
+class NumpyIndex(SemanticIndex):
+    """Exact in-process search; each scope keeps its newest ``max_entries``"""
+
+    def __init__(self, max_entries: int = 10_000):
+        self.max_entries = max_entries
+        # scope -> (vectors, payloads, number of rows written)
+        self._scopes: Dict[str, List[Any]] = {}
+
+    async def search(
+        self,
+        scope: str,
+        vector: np.ndarray,
+        threshold: float
+    ) -> Optional[Tuple[float, Dict]]:
+        entry = self._scopes.get(scope)
+        if entry is None:
+            return None
+        vectors, payloads, written = entry
+        size = min(written, self.max_entries)
+        scores = vectors[:size] @ vector
+        best = int(np.argmax(scores))
+        if scores[best] < threshold:
+            return None
+        return float(scores[best]), payloads[best]
+
+    async def add(self, scope: str, vector: np.ndarray, payload: Dict):
+        entry = self._scopes.get(scope)
+        if entry is None:
+            entry = [np.empty((0, vector.shape[0]), dtype=np.float32), [], 0]
+            self._scopes[scope] = entry
+        vectors, payloads, written = entry
+
+        if written < self.max_entries:
+            if written == vectors.shape[0]:
+                # Grow geometrically up to the cap
+                capacity = min(self.max_entries, max(16, written * 2))
+                grown = np.empty((capacity, vector.shape[0]), dtype=np.float32)
+                grown[:written] = vectors[:written]
+                entry[0] = vectors = grown
+            payloads.append(payload)
+        else:
+            # Full: overwrite the oldest row (ring buffer)
+            payloads[written % self.max_entries] = payload
+        vectors[written % self.max_entries] = vector
+        entry[2] = written + 1
+
+    def stats(self) -> Dict:
+        return {
+            "scopes": len(self._scopes),
+            "entries": sum(min(e[2], self.max_entries) for e in self._scopes.values())
+        }
+
+
+class QdrantIndex(SemanticIndex):
+    """Qdrant collection shared by all API processes; scope is a payload filter"""
+
+    def __init__(self, url: str, collection: str = "semantic_cache"):
+        from qdrant_client import AsyncQdrantClient
+
+        self.client = AsyncQdrantClient(url=url)
+        self.collection = collection
+        self._ready = False
+        self._lock = asyncio.Lock()
+
+    async def search(
+        self,
+        scope: str,
+        vector: np.ndarray,
+        threshold: float
+    ) -> Optional[Tuple[float, Dict]]:
+        from qdrant_client import models
+
+        if not await self._ensure_collection(vector.shape[0], create=False):
+            return None
+        scope_filter = models.Filter(must=[
+            models.FieldCondition(key="scope", match=models.MatchValue(value=scope))
+        ])
+        if hasattr(self.client, "query_points"):
+            response = await self.client.query_points(
+                self.collection,
+                query=vector.tolist(),
+                query_filter=scope_filter,
+                score_threshold=threshold,
+                limit=1,
+                with_payload=True
+            )
+            points = response.points
+        else:
+            points = await self.client.search(
+                self.collection,
+                query_vector=vector.tolist(),
+                query_filter=scope_filter,
+                score_threshold=threshold,
+                limit=1,
+                with_payload=True
+            )
+        if not points:
+            return None
+        return float(points[0].score), dict(points[0].payload)
+
+    async def add(self, scope: str, vector: np.ndarray, payload: Dict):
+        from qdrant_client import models
+
+        await self._ensure_collection(vector.shape[0], create=True)
+        await self.client.upsert(
+            self.collection,
+            points=[models.PointStruct(
+                id=str(uuid.uuid4()),
+                vector=vector.tolist(),
+                payload={**payload, "scope": scope}
+            )]
+        )
+
+    async def close(self):
+        await self.client.close()
+
+    async def _ensure_collection(self, dimension: int, create: bool) -> bool:
+        if self._ready:
+            return True
+        async with self._lock:
+            if not self._ready:
+                from qdrant_client import models
+
+                try:
+                    await self.client.get_collection(self.collection)
+                    self._ready = True
+                except Exception:
+                    if not create:
+                        return False
+                if not self._ready:
+                    await self.client.create_collection(
+                        self.collection,
+                        vectors_config=models.VectorParams(
+                            size=dimension, distance=models.Distance.COSINE
+                        )
+                    )
+                    await self.client.create_payload_index(
+                        self.collection, "scope", models.PayloadSchemaType.KEYWORD
+                    )
+                    self._ready = True
+        return self._ready
+
+
+class SemanticCache:
+    """Reuses LLM completions for prompts that mean the same thing.
+
+    Prompts are embedded through the evaluation service's shared (cached,
+    micro-batched) embedding path and matched against earlier prompts in the
+    same scope by cosine similarity.
+    """
+
+    def __init__(self, index: SemanticIndex, embed: Embedder, threshold: float = 0.95):
+        self.index = index
+        self.embed = embed
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def scope(flow_key: str, node_id: str, model: str, params: Dict[str, Any]) -> str:
+        """Completions are only reused by the same node of the same flow, with
+        the same model and generation settings (temperature, max_tokens, ...)
+        """
+        canonical = json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+        digest = hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+        return f"{model}:{flow_key}:{node_id}:{digest}"
+
+    async def lookup(
+        self,
+        scope: str,
+        prompt: str,
+        threshold: Optional[float] = None
+    ) -> Optional[Dict]:
+        """Cached completion payload (plus ``similarity``) for a close prompt"""
+        vector = (await self.embed([prompt]))[0]
+        match = await self.index.search(
+            scope, vector, self.threshold if threshold is None else threshold
+        )
+        if match is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        similarity, payload = match
+        return {**payload, "similarity": similarity}
+
+    async def store(self, scope: str, prompt: str, completion: str, usage: Dict[str, int]):
+        vector = (await self.embed([prompt]))[0]
+        await self.index.add(scope, vector, {
+            "prompt": prompt,
+            "completion": completion,
+            "usage": usage,
+            "created_at": datetime.utcnow().isoformat()
+        })
+
+    def stats(self) -> Dict:
+        return {"hits": self.hits, "misses": self.misses, **self.index.stats()}
+
+    async def close(self):
+        await self.index.close()
+
+
+def create_semantic_cache(embed: Optional[Embedder]) -> Optional[SemanticCache]:
+    """Build the semantic cache configured in Settings (None when disabled)"""
+    if settings.SEMANTIC_CACHE_BACKEND == "none" or embed is None:
+        return None
+    if settings.SEMANTIC_CACHE_BACKEND == "memory":
+        index: SemanticIndex = NumpyIndex(settings.SEMANTIC_CACHE_MAX_ENTRIES)
+    elif settings.SEMANTIC_CACHE_BACKEND == "qdrant":
+        index = QdrantIndex(settings.QDRANT_URL, settings.SEMANTIC_CACHE_COLLECTION)
+    else:
+        raise ValueError(f"Unknown semantic cache backend: {settings.SEMANTIC_CACHE_BACKEND}")
+    return SemanticCache(index, embed, settings.SEMANTIC_CACHE_THRESHOLD)
@@ -0,0 +1,160 @@
+from typing import Any, Dict, List, Optional
+from dataclasses import dataclass, asdict, field
+import asyncio
+import json
+import secrets
+import threading
+import time
+
+from app.core.config import settings
+
+
+@dataclass
+class Span:
+    """One timed operation in a flow execution trace"""
+    name: str
+    trace_id: str
+    span_id: str = field(default_factory=lambda: secrets.token_hex(8))
+    parent_id: Optional[str] = None
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: int = 0
+    status: str = "ok"
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    def end(self, status: Optional[str] = None):
+        self.end_ns = time.time_ns()
+        if status is not None:
+            self.status = status
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+def new_trace_id() -> str:
+    return secrets.token_hex(16)
+
+
+def payload_size(value: Any) -> int:
+    """Size in bytes of a value as it would be serialized in a response"""
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    return len(json.dumps(value, default=str).encode("utf-8"))
+
+
+class SpanExporter:
+    """Receives the spans of each finished trace"""
+
+    def export(self, spans: List[Span]):
+        raise NotImplementedError
+
+    def shutdown(self):
+        pass
+
+
+class FileSpanExporter(SpanExporter):
+    """Appends spans to a JSON-lines file, one span per line"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]):
+        lines = "".join(json.dumps(span.to_dict(), default=str) + "\n" for span in spans)
+        with self._lock, open(self.path, "a") as f:
+            f.write(lines)
+
+
+class OTelSpanExporter(SpanExporter):
+    """Replays finished spans through the OpenTelemetry API.
+
+    Uses the globally configured tracer provider (e.g. set up by
+    ``opentelemetry-instrument``); if none is configured and the SDK and
+    OTLP exporter are installed, an OTLP provider is created from the
+    standard ``OTEL_*`` environment variables.
+    """
+
+    def __init__(self, service_name: str = "prompt-flow-api"):
+        from opentelemetry import trace
+
+        if type(trace.get_tracer_provider()).__name__ == "ProxyTracerProvider":
+            try:
+                from opentelemetry.sdk.resources import Resource
+                from opentelemetry.sdk.trace import TracerProvider
+                from opentelemetry.sdk.trace.export import BatchSpanProcessor
+                from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+                    OTLPSpanExporter
+                )
+
+                provider = TracerProvider(
+                    resource=Resource.create({"service.name": service_name})
+                )
+                provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+                trace.set_tracer_provider(provider)
+            except ImportError:
+                print("Warning: OpenTelemetry SDK not installed, spans will be dropped")
+        self._trace = trace
+        self._tracer = trace.get_tracer("prompt-flow-studio")
+
+    def export(self, spans: List[Span]):
+        from opentelemetry.trace import Status, StatusCode
+
+        # Parents are exported before their children
+        created: Dict[str, Any] = {}
+        for span in sorted(spans, key=lambda s: (s.parent_id is not None, s.start_ns)):
+            parent = created.get(span.parent_id)
+            context = self._trace.set_span_in_context(parent) if parent is not None else None
+            otel_span = self._tracer.start_span(
+                span.name,
+                context=context,
+                start_time=span.start_ns,
+                attributes={
+                    "flow.trace_id": span.trace_id,
+                    **{k: v for k, v in span.attributes.items() if v is not None}
+                }
+            )
+            if span.status != "ok":
+                otel_span.set_status(Status(StatusCode.ERROR, span.status))
+            created[span.span_id] = otel_span
+
+        for span in spans:
+            created[span.span_id].end(end_time=span.end_ns or None)
+
+    def shutdown(self):
+        provider = self._trace.get_tracer_provider()
+        if hasattr(provider, "shutdown"):
+            provider.shutdown()
+
+
+class Tracer:
+    """Hands finished traces to the configured exporter off the event loop"""
+
+    def __init__(self, exporter: Optional[SpanExporter] = None):
+        self.exporter = exporter
+
+    async def export(self, spans: List[Span]):
+        if self.exporter is None or not spans:
+            return
+        try:
+            await asyncio.to_thread(self.exporter.export, spans)
+        except Exception as e:
+            # Tracing must never fail an execution
+            print(f"Warning: trace export failed: {e}")
+
+    def shutdown(self):
+        if self.exporter is not None:
+            self.exporter.shutdown()
+
+
+def create_tracer() -> Tracer:
+    """Build the tracer configured in Settings"""
+    if settings.TRACE_EXPORTER == "none":
+        return Tracer()
+    if settings.TRACE_EXPORTER == "file":
+        return Tracer(FileSpanExporter(settings.TRACE_FILE_PATH))
+    if settings.TRACE_EXPORTER == "otel":
+        return Tracer(OTelSpanExporter(settings.APP_NAME))
+    raise ValueError(f"Unknown trace exporter: {settings.TRACE_EXPORTER}")
@@ -0,0 +1,50 @@
+from typing import Dict
+import hashlib
+
+
+def assignment_bucket(experiment_id: str, user_id: str, salt: str = "") -> float:
+    """Map (salt, experiment, user) to a stable point in [0, 1).
+
+    The hash is independent of process, node and insertion order, so every
+    worker computes the same assignment without shared state. Changing the
+    salt re-buckets all users.
+    """
+    key = f"{salt}:{experiment_id}:{user_id}".encode("utf-8")
+    digest = hashlib.blake2b(key, digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2 ** 64
+
+
+def variant_weights(config: Dict) -> Dict[str, float]:
+    """Traffic weights per variant from an ABTestConfig dict"""
+    weights = config.get("variant_weights")
+    if weights:
+        return weights
+    # traffic_split is the share of traffic sent to variant B
+    split = config.get("traffic_split", 0.5)
+    return {"A": 1.0 - split, "B": split}
+
+
+def assign_variant(
+    experiment_id: str,
+    user_id: str,
+    weights: Dict[str, float],
+    salt: str = ""
+) -> str:
+    """Deterministically assign a user to a variant in proportion to weights"""
+    total = sum(weight for weight in weights.values() if weight > 0)
+    if total <= 0:
+        raise ValueError("Variant weights must include a positive weight")
+
+    point = assignment_bucket(experiment_id, user_id, salt) * total
+    cumulative = 0.0
+    last_positive = None
+    for variant, weight in weights.items():
+        if weight <= 0:
+            # Turned-off variants never receive traffic, not even the rounding leftover
+            continue
+        last_positive = variant
+        cumulative += weight
+        if point < cumulative:
+            return variant
+    # Floating point rounding at the upper edge
+    return last_positive
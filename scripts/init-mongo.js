@@ -112,8 +112,9 @@ db.createCollection('experiment_results', {
       bsonType: "object",
       required: ["experiment_id", "variant", "created_at"],
       properties: {
-        experiment_id: { bsonType: "objectId" },
+        experiment_id: { bsonType: "string" },
         variant: { bsonType: "string" },
+        response_id: { bsonType: ["string", "null"] },
         response: { bsonType: "string" },
         metrics: { bsonType: "object" },
         user_feedback: { bsonType: "object" },
@@ -170,6 +171,7 @@ db.prompts.createIndex({ "created_at": -1 });
 db.prompts.createIndex({ "template": "text", "description": "text" });
 
 // Experiments indexes
+db.experiments.createIndex({ "experiment_id": 1 }, { unique: true });
 db.experiments.createIndex({ "name": 1 });
 db.experiments.createIndex({ "status": 1 });
 db.experiments.createIndex({ "created_at": -1 });
@@ -177,6 +179,12 @@ db.experiments.createIndex({ "created_at": -1 });
 // Experiment results indexes
 db.experiment_results.createIndex({ "experiment_id": 1, "created_at": -1 });
 db.experiment_results.createIndex({ "variant": 1 });
+db.experiment_results.createIndex({ "response_id": 1 });
+
+// Human feedback and variant assignment indexes
+db.human_feedback.createIndex({ "experiment_id": 1 });
+db.human_feedback.createIndex({ "response_id": 1 });
+db.variant_assignments.createIndex({ "experiment_id": 1 });
 
 // Users indexes
 db.users.createIndex({ "email": 1 }, { unique: true });